@@ -0,0 +1,238 @@
+import atexit
+import calendar
+import json
+import logging
+import os
+import threading
+import time
+from flask import session
+from conexiones import get_db_central, pools, shard_actual
+from escritor import escritores
+from metricas import metricas
+
+# Registro de actividad: quién cambió qué tarea y cuándo.
+#
+# Cada cambio (alta, completar, reabrir, editar, eliminar, proyectos nuevos,
+# importaciones, recordatorios enviados) se anota con anotar_actividad(), que
+# solo lo añade a un búfer en memoria: la ruta no espera a SQLite. Un hilo
+# vacía el búfer cada ACTIVIDAD_INTERVALO segundos (antes si se juntan
+# ACTIVIDAD_LOTE entradas) con una operación por shard en su escritor
+# (escritor.py), así que todo un lote entra en un solo commit junto a las
+# demás escrituras. Si la aplicación se cae se pierden como mucho las
+# entradas del último intervalo.
+#
+# Solo se añaden filas. Se guardan en la base de datos del shard del
+# proyecto, en una tabla por mes (actividad_AAAAMM, hora UTC) con índice
+# (proyecto_id, ts); actividad_particiones (migración 11) lista las tablas y
+# su rango de horas. Consultar un intervalo solo toca los meses que lo
+# cubren, y con ACTIVIDAD_RETENCION_MESES el mantenimiento borra los meses
+# antiguos con un DROP TABLE en vez de borrar fila a fila.
+
+ACTIVO = os.environ.get('ACTIVIDAD', '1') == '1'
+INTERVALO = float(os.environ.get('ACTIVIDAD_INTERVALO', 1))
+LOTE = int(os.environ.get('ACTIVIDAD_LOTE', 500))
+# Si no se puede escribir, a partir de aquí se descartan las más antiguas
+MAX_PENDIENTES = int(os.environ.get('ACTIVIDAD_MAX_PENDIENTES', 100000))
+RETENCION_MESES = int(os.environ.get('ACTIVIDAD_RETENCION_MESES', 0))   # 0 = sin límite
+
+COLUMNAS = ('ts', 'usuario_id', 'proyecto_id', 'tarea_id', 'accion', 'antes', 'despues')
+
+log = logging.getLogger('tareas.actividad')
+
+
+# ==================== PARTICIONES ====================
+
+def particion(ts):
+    # Nombre y rango [desde, hasta) del mes UTC de la hora unix ts
+    fecha = time.gmtime(ts)
+    siguiente = (fecha.tm_year + fecha.tm_mon // 12, fecha.tm_mon % 12 + 1)
+    return (f'actividad_{fecha.tm_year:04d}{fecha.tm_mon:02d}',
+            calendar.timegm((fecha.tm_year, fecha.tm_mon, 1, 0, 0, 0)),
+            calendar.timegm((*siguiente, 1, 0, 0, 0)))
+
+
+def crear_particion(conn, nombre, desde, hasta):
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {nombre} (
+            id INTEGER PRIMARY KEY,
+            ts REAL NOT NULL,
+            usuario_id INTEGER,
+            proyecto_id INTEGER NOT NULL,
+            tarea_id INTEGER,
+            accion TEXT NOT NULL,
+            antes TEXT,
+            despues TEXT
+        )
+    ''')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{nombre}_proyecto ON {nombre} (proyecto_id, ts)')
+    conn.execute('INSERT OR IGNORE INTO actividad_particiones (nombre, desde, hasta) VALUES (?, ?, ?)',
+                 (nombre, desde, hasta))
+
+
+# ==================== OPERACIONES ====================
+# Se ejecutan en el escritor de cada base de datos; reciben su conexión.
+
+def _escribir(conn, entradas):
+    por_particion = {}
+    for entrada in entradas:
+        por_particion.setdefault(particion(entrada[0]), []).append(entrada)
+    for (nombre, desde, hasta), filas in por_particion.items():
+        crear_particion(conn, nombre, desde, hasta)
+        conn.executemany(f'INSERT INTO {nombre} ({", ".join(COLUMNAS)}) VALUES (?, ?, ?, ?, ?, ?, ?)', filas)
+    return len(entradas)
+
+
+def eliminar_particiones(conn, antes_de):
+    # Meses que terminaron antes de antes_de
+    nombres = [fila[0] for fila in conn.execute(
+        'SELECT nombre FROM actividad_particiones WHERE hasta <= ?', (antes_de,))]
+    for nombre in nombres:
+        conn.execute(f'DROP TABLE IF EXISTS {nombre}')
+        conn.execute('DELETE FROM actividad_particiones WHERE nombre = ?', (nombre,))
+    return len(nombres)
+
+
+def limite_retencion(ahora=None):
+    # Inicio del mes más antiguo que se conserva, o None si no hay límite
+    if RETENCION_MESES <= 0:
+        return None
+    fecha = time.gmtime(ahora or time.time())
+    meses = fecha.tm_year * 12 + fecha.tm_mon - 1 - (RETENCION_MESES - 1)
+    return calendar.timegm((meses // 12, meses % 12 + 1, 1, 0, 0, 0))
+
+
+# ==================== BÚFER ====================
+
+class RegistroActividad:
+    def __init__(self):
+        # Entradas pendientes por shard
+        self._pendientes = [[] for _ in pools]
+        self._total = 0
+        self._lock = threading.Lock()
+        self._vaciar = threading.Event()
+        self._hilo = None
+        self.escritas = 0
+        self.descartadas = 0
+
+    def anotar(self, shard, usuario_id, proyecto_id, tarea_id, accion, antes=None, despues=None):
+        entrada = (time.time(), usuario_id, proyecto_id, tarea_id, accion,
+                   None if antes is None else json.dumps(antes, ensure_ascii=False),
+                   None if despues is None else json.dumps(despues, ensure_ascii=False))
+        with self._lock:
+            self._pendientes[shard].append(entrada)
+            self._total += 1
+            lleno = self._total >= LOTE
+        if self._hilo is None:
+            self._arrancar()
+        if lleno:
+            self._vaciar.set()
+
+    def _arrancar(self):
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name='actividad', daemon=True)
+                self._hilo.start()
+
+    def vaciar(self):
+        with self._lock:
+            lotes, self._pendientes = self._pendientes, [[] for _ in pools]
+            self._total = 0
+        for shard, entradas in enumerate(lotes):
+            if not entradas:
+                continue
+            try:
+                self.escritas += escritores[shard].ejecutar(_escribir, entradas)
+            except Exception:
+                log.exception('No se pudo guardar la actividad del shard %d; se reintenta', shard)
+                self._devolver(shard, entradas)
+
+    def _devolver(self, shard, entradas):
+        with self._lock:
+            pendientes = entradas + self._pendientes[shard]
+            sobran = max(0, self._total + len(entradas) - MAX_PENDIENTES)
+            self._pendientes[shard] = pendientes[sobran:]
+            self._total += len(entradas) - sobran
+            self.descartadas += sobran
+
+    def _bucle(self):
+        while True:
+            self._vaciar.wait(INTERVALO)
+            self._vaciar.clear()
+            self.vaciar()
+
+    # Para /metrics
+    def pendientes(self):
+        return self._total
+
+
+registro = RegistroActividad()
+# Lo que quede en el búfer al salir (los escritores siguen vivos en atexit)
+atexit.register(registro.vaciar)
+
+
+def anotar_actividad(proyecto_id, tarea_id, accion, antes=None, despues=None):
+    # Cambio hecho en la petición actual por el usuario en sesión
+    if ACTIVO:
+        registro.anotar(shard_actual(), session.get('user_id'), proyecto_id, tarea_id, accion, antes, despues)
+
+
+# ==================== CONSULTAS ====================
+
+PARTICIONES_SQL = '''
+    SELECT nombre FROM actividad_particiones
+    WHERE desde <= ? AND hasta > ?
+    ORDER BY desde DESC
+'''
+
+# Cursor inicial: después de cualquier hora
+FIN = 2.0 ** 53
+
+# Más recientes primero; (ts, id) de la última fila devuelta es el cursor
+# de la página siguiente
+ACTIVIDAD_SQL = '''
+    SELECT id, ts, usuario_id, proyecto_id, tarea_id, accion, antes, despues FROM {tabla}
+    WHERE proyecto_id = ? AND ts >= ? AND (ts < ? OR (ts = ? AND id < ?))
+    ORDER BY ts DESC, id DESC LIMIT ?
+'''
+
+
+def actividad_proyecto(conn, proyecto_id, desde=0, hasta=None, cursor=None, limite=50):
+    # Entradas de [desde, hasta) anteriores al cursor (ts, id); devuelve las
+    # entradas y el cursor siguiente (None en la última página)
+    ts, ultimo_id = cursor or (FIN, 0)
+    if hasta is not None and hasta < ts:
+        ts, ultimo_id = hasta, 0
+    entradas = []
+    for (tabla,) in conn.execute(PARTICIONES_SQL, (ts, desde)).fetchall():
+        entradas += conn.execute(ACTIVIDAD_SQL.format(tabla=tabla),
+                                 (proyecto_id, desde, ts, ts, ultimo_id, limite + 1 - len(entradas))).fetchall()
+        if len(entradas) > limite:
+            break
+    siguiente = (entradas[limite - 1]['ts'], entradas[limite - 1]['id']) if len(entradas) > limite else None
+    return entradas[:limite], siguiente
+
+
+def nombres_usuarios(ids):
+    ids = sorted({usuario_id for usuario_id in ids if usuario_id is not None})
+    if not ids:
+        return {}
+    filas = get_db_central().execute(
+        f'SELECT id, username FROM usuarios WHERE id IN ({", ".join("?" * len(ids))})', ids).fetchall()
+    return {fila['id']: fila['username'] for fila in filas}
+
+
+def entrada_a_dict(fila, usuarios):
+    return {'id': fila['id'], 'ts': fila['ts'],
+            'fecha': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(fila['ts'])),
+            'usuario_id': fila['usuario_id'], 'usuario': usuarios.get(fila['usuario_id']),
+            'tarea_id': fila['tarea_id'], 'accion': fila['accion'],
+            'antes': None if fila['antes'] is None else json.loads(fila['antes']),
+            'despues': None if fila['despues'] is None else json.loads(fila['despues'])}
+
+
+metricas.registrar_indicador('tareas_actividad_pendientes', 'Entradas de actividad en el búfer sin guardar',
+                             registro.pendientes)
+metricas.registrar_indicador('tareas_actividad_escritas', 'Entradas de actividad guardadas por este proceso',
+                             lambda: registro.escritas)
+metricas.registrar_indicador('tareas_actividad_descartadas', 'Entradas de actividad descartadas por búfer lleno',
+                             lambda: registro.descartadas)
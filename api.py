@@ -0,0 +1,418 @@
+import io
+from functools import wraps
+from flask import Blueprint, Response, jsonify, request, session, stream_with_context
+from conexiones import get_db_connection, shard_actual, transaccion
+from cache import tocar_proyectos, tocar_lista_proyectos
+from permisos import proyectos_del_usuario, recordar_proyectos
+from busqueda import buscar_tareas, RESULTADOS_POR_PAGINA
+from escritor import EscrituraSaturada, escritor_del_usuario
+from eventos import publicar_recarga
+from intercambio import FORMATOS, ErrorImportacion, exportar, importar
+from arbol import MARCAR_SUBARBOL_SQL, eliminar_subarbol, pagina_raices, pagina_hijas, TAREAS_POR_PAGINA
+from vencimientos import leer_prioridad, leer_vence
+from recordatorios import recordatorios
+from actividad import actividad_proyecto, anotar_actividad, entrada_a_dict, nombres_usuarios
+
+# API JSON versionada. Usa la misma sesión que la interfaz web y las
+# operaciones por lotes se ejecutan en una única transacción.
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Máximo de elementos por petición de lote
+MAX_LOTE = 1000
+
+
+class ErrorApi(Exception):
+    def __init__(self, mensaje, codigo=400, **extra):
+        super().__init__(mensaje)
+        self.mensaje = mensaje
+        self.codigo = codigo
+        self.extra = extra
+
+
+@api.errorhandler(ErrorApi)
+def manejar_error_api(error):
+    return jsonify(error=error.mensaje, **error.extra), error.codigo
+
+
+@api.errorhandler(EscrituraSaturada)
+def manejar_escritura_saturada(error):
+    # La operación no llegó a ejecutarse: se puede reintentar sin duplicar
+    return jsonify(error='Servidor ocupado; el cambio no se guardó, reinténtalo'), 503
+
+
+def api_login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return jsonify(error='No autenticado'), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+# ==================== UTILIDADES ====================
+
+def leer_lote(clave, objetos=True):
+    datos = request.get_json(silent=True)
+    elementos = datos.get(clave) if isinstance(datos, dict) else None
+    if not isinstance(elementos, list) or not elementos:
+        raise ErrorApi(f'Se esperaba una lista no vacía en "{clave}"')
+    if len(elementos) > MAX_LOTE:
+        raise ErrorApi(f'Como máximo {MAX_LOTE} elementos por petición', 413)
+    if objetos and not all(isinstance(elemento, dict) for elemento in elementos):
+        raise ErrorApi(f'Cada elemento de "{clave}" debe ser un objeto')
+    return elementos
+
+
+def entero(valor, campo):
+    if isinstance(valor, bool) or not isinstance(valor, int):
+        raise ErrorApi(f'"{campo}" debe ser un entero')
+    return valor
+
+
+def texto(valor, campo, obligatorio=False):
+    if valor is None and not obligatorio:
+        return None
+    if not isinstance(valor, str) or (obligatorio and not valor.strip()):
+        raise ErrorApi(f'"{campo}" debe ser un texto no vacío' if obligatorio else f'"{campo}" debe ser un texto')
+    return valor
+
+
+def fecha(valor, campo):
+    # Vencimiento ISO 8601; sin zona se toma como UTC. null o "" lo quita
+    try:
+        return leer_vence(texto(valor, campo))
+    except ValueError:
+        raise ErrorApi(f'"{campo}" debe ser una fecha ISO 8601 (YYYY-MM-DDTHH:MM:SSZ)')
+
+
+def prioridad(valor):
+    if valor is None:
+        return None
+    try:
+        return leer_prioridad(valor)
+    except ValueError:
+        raise ErrorApi('"prioridad" debe ser 0, 1, 2 o "baja", "media", "alta"')
+
+
+def programar_recordatorios(tareas):
+    for tarea in tareas:
+        recordatorios.programar(shard_actual(), tarea['id'], tarea['vence'])
+
+
+CAMPOS_EDITABLES = ('titulo', 'descripcion', 'vence', 'prioridad')
+
+
+def anotar_cambios(anteriores, actualizadas):
+    # Registro de actividad: una entrada por tarea con los campos que
+    # cambiaron y otra si cambió completada
+    anteriores = {fila['id']: fila for fila in anteriores}
+    for tarea in actualizadas:
+        previa = anteriores[tarea['id']]
+        cambiados = [campo for campo in CAMPOS_EDITABLES if previa[campo] != tarea[campo]]
+        if cambiados:
+            anotar_actividad(tarea['proyecto_id'], tarea['id'], 'editada',
+                             {campo: previa[campo] for campo in cambiados},
+                             {campo: tarea[campo] for campo in cambiados})
+        if previa['completada'] != tarea['completada']:
+            anotar_actividad(tarea['proyecto_id'], tarea['id'],
+                             'completada' if tarea['completada'] else 'reabierta',
+                             {'completada': bool(previa['completada'])}, {'completada': bool(tarea['completada'])})
+
+
+def marcadores(valores):
+    return ', '.join('?' * len(valores))
+
+
+def tareas_propias(conn, ids):
+    # {tarea_id: proyecto_id} de las tareas que pertenecen al usuario
+    ids = list(set(ids))
+    filas = conn.execute(f'''
+        SELECT t.id, t.proyecto_id
+        FROM tareas t
+        JOIN proyectos p ON t.proyecto_id = p.id
+        WHERE p.usuario_id = ? AND t.id IN ({marcadores(ids)}) AND t.eliminada = 0
+    ''', (session['user_id'], *ids)).fetchall()
+    return {fila['id']: fila['proyecto_id'] for fila in filas}
+
+
+def exigir_propias(pedidas, propias, mensaje):
+    faltan = sorted(set(pedidas) - set(propias))
+    if faltan:
+        raise ErrorApi(mensaje, 404, ids=faltan)
+
+
+def tarea_a_dict(fila):
+    tarea = dict(fila)
+    tarea['completada'] = bool(tarea['completada'])
+    tarea.pop('eliminada', None)
+    tarea.pop('avisada', None)
+    return tarea
+
+
+def filas_por_id(conn, tabla, ids):
+    return conn.execute(
+        f'SELECT * FROM {tabla} WHERE id IN ({marcadores(ids)}) ORDER BY id', ids
+    ).fetchall()
+
+
+def insertar_lote(conn, sql, parametros):
+    # Dentro de BEGIN IMMEDIATE nadie más escribe, así que los ids de
+    # AUTOINCREMENT del lote son consecutivos y terminan en last_insert_rowid()
+    conn.executemany(sql, parametros)
+    ultimo = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+    return list(range(ultimo - len(parametros) + 1, ultimo + 1))
+
+
+# ==================== PROYECTOS ====================
+
+@api.route('/proyectos')
+@api_login_required
+def listar_proyectos():
+    conn = get_db_connection()
+    proyectos = conn.execute(
+        'SELECT * FROM proyectos WHERE usuario_id = ? ORDER BY id',
+        (session['user_id'],)
+    ).fetchall()
+    return jsonify(proyectos=[dict(proyecto) for proyecto in proyectos])
+
+
+@api.route('/proyectos', methods=['POST'])
+@api_login_required
+def crear_proyectos():
+    parametros = [
+        (texto(p.get('nombre'), 'nombre', obligatorio=True),
+         texto(p.get('descripcion'), 'descripcion') or '',
+         session['user_id'])
+        for p in leer_lote('proyectos')
+    ]
+
+    conn = get_db_connection()
+    with transaccion(conn):
+        ids = insertar_lote(conn,
+            'INSERT INTO proyectos (nombre, descripcion, usuario_id) VALUES (?, ?, ?)', parametros)
+        tocar_lista_proyectos(conn, session['user_id'])
+        creados = filas_por_id(conn, 'proyectos', ids)
+    recordar_proyectos(ids)
+    for proyecto in creados:
+        anotar_actividad(proyecto['id'], None, 'proyecto_creado', despues={'nombre': proyecto['nombre']})
+    return jsonify(proyectos=[dict(proyecto) for proyecto in creados]), 201
+
+
+@api.route('/proyectos/<int:proyecto_id>/tareas')
+@api_login_required
+def listar_tareas(proyecto_id):
+    # Tareas principales, o hijas de ?parent_id=, paginadas con ?after=<id>
+    conn = get_db_connection()
+    if not proyectos_del_usuario(conn, [proyecto_id]):
+        raise ErrorApi('Proyecto no encontrado o sin permisos', 404)
+
+    despues_de = request.args.get('after', 0, type=int)
+    limite = min(request.args.get('limit', TAREAS_POR_PAGINA, type=int), MAX_LOTE)
+    parent_id = request.args.get('parent_id', type=int)
+    if parent_id:
+        tareas, hay_mas = pagina_hijas(conn, proyecto_id, parent_id, despues_de, limite)
+    else:
+        tareas, hay_mas = pagina_raices(conn, proyecto_id, despues_de, limite)
+
+    return jsonify(tareas=[tarea_a_dict(tarea) for tarea in tareas],
+                   siguiente=tareas[-1]['id'] if hay_mas else None)
+
+
+@api.route('/proyectos/<int:proyecto_id>/actividad')
+@api_login_required
+def listar_actividad(proyecto_id):
+    # Cambios del proyecto, los más recientes primero. ?desde= y ?hasta=
+    # (hora unix) acotan el intervalo y ?antes=<siguiente> pide la página
+    # siguiente. Se guardan por lotes (actividad.py): lo del último segundo
+    # puede no aparecer todavía
+    conn = get_db_connection()
+    if not proyectos_del_usuario(conn, [proyecto_id]):
+        raise ErrorApi('Proyecto no encontrado o sin permisos', 404)
+
+    cursor = None
+    if request.args.get('antes'):
+        try:
+            ts, ultimo_id = request.args['antes'].split(':')
+            cursor = (float(ts), int(ultimo_id))
+        except ValueError:
+            raise ErrorApi('"antes" debe ser el valor de "siguiente" de la página anterior')
+    limite = min(max(request.args.get('limit', TAREAS_POR_PAGINA, type=int), 1), MAX_LOTE)
+    entradas, siguiente = actividad_proyecto(conn, proyecto_id, request.args.get('desde', 0, type=float),
+                                             request.args.get('hasta', type=float), cursor, limite)
+    usuarios = nombres_usuarios(entrada['usuario_id'] for entrada in entradas)
+    return jsonify(actividad=[entrada_a_dict(entrada, usuarios) for entrada in entradas],
+                   siguiente=None if siguiente is None else f'{siguiente[0]!r}:{siguiente[1]}')
+
+
+@api.route('/buscar')
+@api_login_required
+def buscar():
+    # ?q=<texto>&pagina=<n>[&proyecto_id=<id>]; título y fragmento con <mark>
+    texto_buscado = request.args.get('q', '').strip()
+    if not texto_buscado:
+        raise ErrorApi('Falta el parámetro "q"')
+
+    pagina = request.args.get('pagina', 1, type=int)
+    limite = min(max(request.args.get('limit', RESULTADOS_POR_PAGINA, type=int), 1), 100)
+    conn = get_db_connection()
+    resultados, hay_mas = buscar_tareas(conn, session['user_id'], texto_buscado,
+                                        request.args.get('proyecto_id', type=int), pagina, limite)
+    return jsonify(resultados=[dict(r, titulo=str(r['titulo']), fragmento=str(r['fragmento']),
+                                    completada=bool(r['completada'])) for r in resultados],
+                   siguiente=pagina + 1 if hay_mas else None)
+
+
+# ==================== TAREAS (LOTES) ====================
+
+@api.route('/tareas', methods=['POST'])
+@api_login_required
+def crear_tareas():
+    nuevas = [
+        {'titulo': texto(t.get('titulo'), 'titulo', obligatorio=True),
+         'descripcion': texto(t.get('descripcion'), 'descripcion') or '',
+         'proyecto_id': entero(t.get('proyecto_id'), 'proyecto_id'),
+         'parent_id': None if t.get('parent_id') is None else entero(t['parent_id'], 'parent_id'),
+         'vence': fecha(t.get('vence'), 'vence'),
+         'prioridad': prioridad(t.get('prioridad')) or 0}
+        for t in leer_lote('tareas')
+    ]
+
+    conn = get_db_connection()
+    with transaccion(conn):
+        proyectos = [t['proyecto_id'] for t in nuevas]
+        exigir_propias(proyectos, proyectos_del_usuario(conn, proyectos), 'Proyectos no encontrados o sin permisos')
+
+        padres = [t['parent_id'] for t in nuevas if t['parent_id'] is not None]
+        if padres:
+            propias = tareas_propias(conn, padres)
+            exigir_propias(padres, propias, 'Tareas padre no encontradas o sin permisos')
+            distinto = [t['parent_id'] for t in nuevas
+                        if t['parent_id'] is not None and propias[t['parent_id']] != t['proyecto_id']]
+            if distinto:
+                raise ErrorApi('La tarea padre debe ser del mismo proyecto', 400, ids=sorted(set(distinto)))
+
+        ids = insertar_lote(conn, '''
+            INSERT INTO tareas (titulo, descripcion, parent_id, proyecto_id, vence, prioridad)
+            VALUES (:titulo, :descripcion, :parent_id, :proyecto_id, :vence, :prioridad)
+        ''', nuevas)
+        tocar_proyectos(conn, proyectos)
+        creadas = filas_por_id(conn, 'tareas', ids)
+    publicar_recarga(proyectos)
+    programar_recordatorios(creadas)
+    for tarea in creadas:
+        anotar_actividad(tarea['proyecto_id'], tarea['id'], 'agregada',
+                         despues={campo: tarea[campo] for campo in CAMPOS_EDITABLES + ('parent_id',)})
+    return jsonify(tareas=[tarea_a_dict(tarea) for tarea in creadas]), 201
+
+
+@api.route('/tareas', methods=['PATCH'])
+@api_login_required
+def actualizar_tareas():
+    cambios = []
+    for t in leer_lote('tareas'):
+        completada = t.get('completada')
+        if completada is not None and not isinstance(completada, bool):
+            raise ErrorApi('"completada" debe ser true o false')
+        cambios.append({
+            'tarea_id': entero(t.get('id'), 'id'),
+            'titulo': texto(t.get('titulo'), 'titulo') or None,
+            'descripcion': texto(t.get('descripcion'), 'descripcion'),
+            'completada': None if completada is None else int(completada),
+            'prioridad': prioridad(t.get('prioridad')),
+            # "vence": null quita el vencimiento; sin la clave no se toca
+            'cambiar_vence': 'vence' in t,
+            'vence': fecha(t.get('vence'), 'vence'),
+        })
+
+    ids = [c['tarea_id'] for c in cambios]
+    conn = get_db_connection()
+    with transaccion(conn):
+        propias = tareas_propias(conn, ids)
+        exigir_propias(ids, propias, 'Tareas no encontradas o sin permisos')
+        anteriores = filas_por_id(conn, 'tareas', sorted(set(ids)))
+
+        campos = [c for c in cambios if c['cambiar_vence'] or any(
+            c[campo] is not None for campo in ('titulo', 'descripcion', 'prioridad'))]
+        # Con otro vencimiento vuelve a tocar el recordatorio (recordatorios.py)
+        conn.executemany('''
+            UPDATE tareas SET titulo = COALESCE(:titulo, titulo),
+                              descripcion = COALESCE(:descripcion, descripcion),
+                              prioridad = COALESCE(:prioridad, prioridad),
+                              avisada = CASE WHEN :cambiar_vence AND vence IS NOT :vence THEN 0 ELSE avisada END,
+                              vence = CASE WHEN :cambiar_vence THEN :vence ELSE vence END
+            WHERE id = :tarea_id
+        ''', campos)
+
+        # Igual que en la interfaz: el estado se propaga a todo el subárbol
+        marcados = [dict(c, proyecto_id=propias[c['tarea_id']]) for c in cambios if c['completada'] is not None]
+        conn.executemany(MARCAR_SUBARBOL_SQL, marcados)
+        tocar_proyectos(conn, propias.values())
+
+        actualizadas = filas_por_id(conn, 'tareas', sorted(set(ids)))
+    publicar_recarga(propias.values())
+    programar_recordatorios(actualizadas)
+    anotar_cambios(anteriores, actualizadas)
+    return jsonify(tareas=[tarea_a_dict(tarea) for tarea in actualizadas])
+
+
+@api.route('/tareas', methods=['DELETE'])
+@api_login_required
+def eliminar_tareas():
+    ids = [entero(tarea_id, 'ids') for tarea_id in leer_lote('ids', objetos=False)]
+
+    conn = get_db_connection()
+    with transaccion(conn):
+        propias = tareas_propias(conn, ids)
+        exigir_propias(ids, propias, 'Tareas no encontradas o sin permisos')
+
+        titulos = {fila['id']: fila['titulo'] for fila in filas_por_id(conn, 'tareas', sorted(set(ids)))}
+        eliminadas = sum(eliminar_subarbol(conn, tarea_id, propias[tarea_id]) for tarea_id in set(ids))
+        tocar_proyectos(conn, propias.values())
+    publicar_recarga(propias.values())
+    for tarea_id in sorted(set(ids)):
+        anotar_actividad(propias[tarea_id], tarea_id, 'eliminada', {'titulo': titulos[tarea_id]})
+    return jsonify(ids=sorted(set(ids)), eliminadas=eliminadas)
+
+
+# ==================== IMPORTACIÓN / EXPORTACIÓN ====================
+
+def leer_formato():
+    formato = request.args.get('formato', 'jsonl')
+    if formato not in FORMATOS:
+        raise ErrorApi(f'Formato desconocido; usa {" o ".join(FORMATOS)}')
+    return formato
+
+
+@api.route('/exportar')
+@api_login_required
+def exportar_datos():
+    # Respuesta en streaming: se genera por bloques mientras se envía
+    formato = leer_formato()
+    proyecto_id = request.args.get('proyecto_id', type=int)
+    conn = get_db_connection()
+    if proyecto_id is not None and not proyectos_del_usuario(conn, [proyecto_id]):
+        raise ErrorApi('Proyecto no encontrado o sin permisos', 404)
+
+    trozos = exportar(conn, session['user_id'], formato,
+                      None if proyecto_id is None else {proyecto_id})
+    respuesta = Response(stream_with_context(trozos), mimetype=FORMATOS[formato])
+    respuesta.headers['Content-Disposition'] = f'attachment; filename="tareas.{formato}"'
+    return respuesta
+
+
+@api.route('/importar', methods=['POST'])
+@api_login_required
+def importar_datos():
+    # Cuerpo en JSONL o CSV; se lee del flujo de entrada por lotes y cada
+    # lote se confirma en el escritor agrupado del shard del usuario
+    formato = leer_formato()
+    texto = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    try:
+        importador = importar(escritor_del_usuario().ejecutar, session['user_id'], texto, formato)
+    except ErrorImportacion as error:
+        raise ErrorApi(str(error), 400, importados=error.resumen)
+    recordar_proyectos(importador.proyectos.values())
+    for viejo, nuevo in importador.proyectos.items():
+        anotar_actividad(nuevo, None, 'proyecto_importado', despues={'id_original': viejo})
+    return jsonify(importados=importador.resumen(),
+                   proyectos={str(viejo): nuevo for viejo, nuevo in importador.proyectos.items()}), 201
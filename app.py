@@ -1,90 +1,99 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-import sqlite3
+from flask import (Flask, Response, render_template, request, redirect, url_for, session, flash, jsonify, abort,
+                   make_response)
 import os
-from werkzeug.security import check_password_hash, generate_password_hash
-from functools import wraps
+from conexiones import get_db_connection, get_db_central, liberar_db_connection, shard_actual, shard_para
+from escritor import EscrituraSaturada, escritor, escritor_del_usuario
+from permisos import login_required, proyecto_del_usuario, tarea_del_usuario, recordar_proyectos
+from api import api
+from metricas import instrumentar
+from sesiones import configurar_sesiones
+from mantenimiento import configurar_mantenimiento
+from replicas import configurar_replicas, get_db_lectura
+from cache import cache, versiones_dashboard, tocar_proyectos, tocar_lista_proyectos
+from seguridad import (HashSaturado, generar_hash, verificar_password, necesita_rehash,
+                       limitador)
+from busqueda import buscar_tareas as buscar_texto, buscar_titulos
+from arbol import (eliminar_subarbol, marcar_subarbol, pagina_raices, pagina_hijas,
+                   primeras_hijas, construir_arbol, TAREAS_POR_PAGINA)
+from eventos import canales, flujo_eventos, publicar_tarea
+from grafo import COLUMNAS, grafos
+from plantillas import FLUJO, configurar_plantillas, fragmento_en_flujo, transmitir_plantilla
+from compresion import configurar_compresion
+from vencimientos import VISTAS, VISTAS_CON_HORA, ahora_utc, leer_prioridad, leer_vence, pagina_vista
+from recordatorios import configurar_recordatorios, recordatorios
+from actividad import anotar_actividad
 
 app = Flask(__name__)
 app.secret_key = 'clave_secreta_muy_segura_para_desarrollo'  # En producción usar variable de entorno
+app.teardown_appcontext(liberar_db_connection)
+app.register_blueprint(api)
+instrumentar(app)
+configurar_sesiones(app)
+configurar_mantenimiento(app)
+configurar_replicas(app)
+configurar_plantillas(app)
+configurar_compresion(app)
+configurar_recordatorios(app)
 
-# Función para requerir login
-def login_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            flash('Por favor inicia sesión para acceder a esta página.', 'warning')
-            return redirect(url_for('login'))
-        return f(*args, **kwargs)
-    return decorated_function
+# ==================== OPERACIONES DE ESCRITURA ====================
+# Se ejecutan en el escritor único (escritor.py), que confirma juntas las
+# operaciones que llegan a la vez; reciben su conexión como primer argumento.
+# Las de usuarios van al escritor de la base de datos central y las de
+# proyectos y tareas al del shard del usuario (escritor_del_usuario).
+# Las de tareas devuelven la versión del proyecto tras el cambio (eventos.py)
+# y lo necesario para aplicar el cambio al árbol en caché (grafo.py).
 
-def init_db():
-    conn = sqlite3.connect('tareas.db')
-    c = conn.cursor()
-    
-    # Tabla de usuarios
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS usuarios (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username VARCHAR(50) UNIQUE NOT NULL,
-            email VARCHAR(100) UNIQUE NOT NULL,
-            password_hash VARCHAR(255) NOT NULL,
-            fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Tabla de proyectos con usuario_id
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS proyectos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nombre VARCHAR(100) NOT NULL,
-            descripcion TEXT,
-            usuario_id INTEGER NOT NULL,
-            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
-        )
-    ''')
-    
-    # Tabla tareas
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS tareas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            titulo TEXT NOT NULL,
-            descripcion TEXT,
-            parent_id INTEGER,
-            proyecto_id INTEGER,
-            completada BOOLEAN DEFAULT FALSE,
-            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (parent_id) REFERENCES tareas (id),
-            FOREIGN KEY (proyecto_id) REFERENCES proyectos (id)
-        )
-    ''')
-    
-    # Crear usuario demo si no existe
-    try:
-        password_hash = generate_password_hash('demo123')
-        c.execute(
-            "INSERT OR IGNORE INTO usuarios (id, username, email, password_hash) VALUES (1, ?, ?, ?)",
-            ('demo', 'demo@ejemplo.com', password_hash)
-        )
-        
-        # Crear proyecto demo si no existe
-        c.execute(
-            "INSERT OR IGNORE INTO proyectos (id, nombre, descripcion, usuario_id) VALUES (1, ?, ?, ?)",
-            ('Proyecto de Demo', 'Proyecto de ejemplo para usuario demo', 1)
-        )
-    except:
-        pass
-    
-    conn.commit()
-    conn.close()
+def _version_proyecto(conn, proyecto_id):
+    return conn.execute('SELECT version FROM proyectos WHERE id = ?', (proyecto_id,)).fetchone()[0]
 
-def get_db_connection():
-    conn = sqlite3.connect('tareas.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+def _crear_usuario(conn, username, email, password_hash, shard):
+    conn.execute('INSERT INTO usuarios (username, email, password_hash, shard) VALUES (?, ?, ?, ?)',
+                 (username, email, password_hash, shard))
 
-# INICIALIZAR LA BD SIEMPRE
-init_db()
+def _crear_inquilino(conn, usuario_id):
+    conn.execute('INSERT OR IGNORE INTO inquilinos (id) VALUES (?)', (usuario_id,))
+
+def _cambiar_hash(conn, usuario_id, password_hash):
+    conn.execute('UPDATE usuarios SET password_hash = ? WHERE id = ?', (password_hash, usuario_id))
+
+def _insertar_tarea(conn, titulo, descripcion, parent_id, proyecto_id, vence=None, prioridad=0):
+    # El padre se comprueba dentro del lote: si se eliminó mientras tanto, la
+    # subtarea no se crea (quedaría huérfana)
+    if parent_id is not None and not conn.execute(
+            'SELECT 1 FROM tareas WHERE id = ? AND proyecto_id = ? AND eliminada = 0',
+            (parent_id, proyecto_id)).fetchone():
+        return None, None
+    tarea_id = conn.execute('''
+        INSERT INTO tareas (titulo, descripcion, parent_id, proyecto_id, vence, prioridad) VALUES (?, ?, ?, ?, ?, ?)
+    ''', (titulo, descripcion, parent_id, proyecto_id, vence, prioridad)).lastrowid
+    tocar_proyectos(conn, [proyecto_id])
+    tarea = conn.execute(f"SELECT {', '.join(COLUMNAS)} FROM tareas WHERE id = ?", (tarea_id,)).fetchone()
+    return tarea, _version_proyecto(conn, proyecto_id)
+
+def _alternar_tarea(conn, tarea_id, proyecto_id):
+    # El estado se lee dentro del lote: dos clics seguidos alternan dos veces
+    tarea = conn.execute('SELECT completada FROM tareas WHERE id = ? AND eliminada = 0', (tarea_id,)).fetchone()
+    if tarea is None:
+        return None, None
+    completada = int(not tarea['completada'])
+    marcar_subarbol(conn, tarea_id, proyecto_id, completada)
+    tocar_proyectos(conn, [proyecto_id])
+    return completada, _version_proyecto(conn, proyecto_id)
+
+def _eliminar_tarea(conn, tarea_id, proyecto_id):
+    tarea = conn.execute('SELECT parent_id, titulo FROM tareas WHERE id = ? AND eliminada = 0',
+                         (tarea_id,)).fetchone()
+    if tarea is None:
+        return None, None
+    eliminar_subarbol(conn, tarea_id, proyecto_id)
+    tocar_proyectos(conn, [proyecto_id])
+    return tarea, _version_proyecto(conn, proyecto_id)
+
+def _insertar_proyecto(conn, nombre, descripcion, usuario_id):
+    proyecto_id = conn.execute('INSERT INTO proyectos (nombre, descripcion, usuario_id) VALUES (?, ?, ?)',
+                               (nombre, descripcion, usuario_id)).lastrowid
+    tocar_lista_proyectos(conn, usuario_id)
+    return proyecto_id
 
 # ==================== RUTAS DE AUTENTICACIÓN ====================
 
@@ -105,7 +114,12 @@ def registro():
             flash('La contraseña debe tener al menos 6 caracteres.', 'danger')
             return render_template('registro.html')
         
-        conn = get_db_connection()
+        # Cada registro cuesta un hash: se limita por IP igual que el login
+        if limitador.bloqueado(request.remote_addr):
+            flash('Demasiados intentos. Espera unos minutos.', 'danger')
+            return render_template('registro.html'), 429
+        
+        conn = get_db_central()
         c = conn.cursor()
         
         try:
@@ -120,21 +134,18 @@ def registro():
                 return render_template('registro.html')
             
             # Crear nuevo usuario
-            password_hash = generate_password_hash(password)
-            c.execute(
-                'INSERT INTO usuarios (username, email, password_hash) VALUES (?, ?, ?)',
-                (username, email, password_hash)
-            )
-            conn.commit()
+            limitador.registrar_intento(request.remote_addr)
+            escritor.ejecutar(_crear_usuario, username, email, generar_hash(password), shard_para(username))
             
             flash('¡Registro exitoso! Ahora puedes iniciar sesión.', 'success')
             return redirect(url_for('login'))
             
+        except (HashSaturado, EscrituraSaturada):
+            flash('El servidor está ocupado. Intenta nuevamente en unos segundos.', 'danger')
+            return render_template('registro.html'), 503
         except Exception as e:
             flash('Error en el registro. Intenta nuevamente.', 'danger')
             return render_template('registro.html')
-        finally:
-            conn.close()
     
     return render_template('registro.html')
 
@@ -144,7 +155,12 @@ def login():
         username = request.form['username']
         password = request.form['password']
         
-        conn = get_db_connection()
+        # Rechazar antes de gastar CPU en el hash si hay demasiados fallos
+        if limitador.bloqueado(request.remote_addr, username):
+            flash('Demasiados intentos fallidos. Espera unos minutos.', 'danger')
+            return render_template('login.html'), 429
+        
+        conn = get_db_central()
         c = conn.cursor()
         
         # Buscar usuario por username o email
@@ -153,14 +169,38 @@ def login():
             (username, username)
         ).fetchone()
         
-        conn.close()
+        try:
+            valido = user is not None and verificar_password(user['password_hash'], password)
+            
+            # Rehacer el hash si cambiaron los parámetros configurados
+            if valido and necesita_rehash(user['password_hash']):
+                escritor.ejecutar(_cambiar_hash, user['id'], generar_hash(password))
+        except HashSaturado:
+            flash('El servidor está ocupado. Intenta nuevamente en unos segundos.', 'danger')
+            return render_template('login.html'), 503
         
-        if user and check_password_hash(user['password_hash'], password):
+        # Sus datos se están moviendo de shard (ver shards.py)
+        if valido and user['trasladando']:
+            flash('Tu cuenta está en mantenimiento. Intenta nuevamente en unos minutos.', 'warning')
+            return render_template('login.html'), 503
+        
+        if valido:
+            limitador.limpiar(username)
             session['user_id'] = user['id']
             session['username'] = user['username']
+            session['shard'] = user['shard']
+            
+            # Desde aquí, la conexión del shard del usuario
+            conn = get_db_connection()
+            if conn.execute('SELECT 1 FROM inquilinos WHERE id = ?', (user['id'],)).fetchone() is None:
+                escritor_del_usuario().ejecutar(_crear_inquilino, user['id'])
+            # Proyectos propios para comprobar permisos sin consultar (sesiones.py)
+            session['proyectos'] = [fila['id'] for fila in conn.execute(
+                'SELECT id FROM proyectos WHERE usuario_id = ? ORDER BY id', (user['id'],))]
             flash(f'¡Bienvenido {user["username"]}!', 'success')
             return redirect(url_for('index'))
         else:
+            limitador.registrar_intento(request.remote_addr, username)
             flash('Usuario o contraseña incorrectos.', 'danger')
     
     return render_template('login.html')
@@ -176,121 +216,270 @@ def logout():
 @app.route('/')
 @login_required
 def index():
-    conn = get_db_connection()
+    # Solo lecturas: réplica si hay una al día (replicas.py)
+    conn = get_db_lectura()
+    usuario_id = session['user_id']
     
-    # Obtener proyectos del usuario actual
-    proyectos = conn.execute(
-        'SELECT * FROM proyectos WHERE usuario_id = ? ORDER BY id', 
-        (session['user_id'],)
-    ).fetchall()
+    # Versiones de la lista de proyectos y del proyecto activo (por defecto el primero)
+    versiones = versiones_dashboard(conn, usuario_id, request.args.get('proyecto_id', type=int))
+    if versiones is None:
+        # La réplica puede ser anterior a la llegada del usuario a este shard
+        conn = get_db_connection()
+        versiones = versiones_dashboard(conn, usuario_id, request.args.get('proyecto_id', type=int))
+    if versiones is None:
+        session.clear()
+        return redirect(url_for('login'))
+    proyecto_activo_id = request.args.get('proyecto_id', versiones['primer_proyecto'] or 0, type=int)
+    despues_de = request.args.get('after', 0, type=int)
+    shard = shard_actual()
+    # Vistas de tareas pendientes (vencimientos.py); las que dependen de la
+    # hora se recalculan cada minuto
+    vista = request.args.get('vista')
+    if vista not in VISTAS:
+        vista = None
+    ahora = ahora_utc()[:16] + ':00' if vista in VISTAS_CON_HORA else ''
     
-    # Obtener proyecto activo (por defecto el primero)
-    proyecto_activo_id = request.args.get('proyecto_id', proyectos[0]['id'] if proyectos else 0, type=int)
+    # Si nada cambió desde la última visita el navegador recibe un 304
+    etag = (f"{shard}-{usuario_id}-{proyecto_activo_id}-{despues_de}-{vista}-{ahora}-"
+            f"{versiones['version_proyectos']}-{versiones['version_progreso']}-{versiones['version_proyecto']}")
+    # (débil si la respuesta se envió comprimida, ver compresion.py)
+    if request.if_none_match.contains_weak(etag) and '_flashes' not in session:
+        respuesta = make_response('', 304)
+        respuesta.set_etag(etag)
+        return respuesta
     
-    # Obtener tareas del proyecto activo (solo si pertenece al usuario)
-    tareas = []
-    if proyecto_activo_id:
-        # Verificar que el proyecto pertenece al usuario
-        proyecto_usuario = conn.execute(
-            'SELECT id FROM proyectos WHERE id = ? AND usuario_id = ?', 
-            (proyecto_activo_id, session['user_id'])
-        ).fetchone()
+    # Fragmento con los proyectos del usuario y su progreso
+    clave = f"proyectos:{shard}:{usuario_id}:{versiones['version_proyectos']}:{versiones['version_progreso']}:{proyecto_activo_id}"
+    lista_proyectos = cache.get(clave)
+    if lista_proyectos is None:
+        proyectos = conn.execute(
+            'SELECT * FROM proyectos WHERE usuario_id = ? ORDER BY id', 
+            (usuario_id,)
+        ).fetchall()
+        lista_proyectos = render_template('_proyectos.html',
+                                          proyectos=proyectos,
+                                          proyecto_activo_id=proyecto_activo_id)
+        cache.set(clave, lista_proyectos)
+    
+    # Fragmento con la página de tareas principales (?after=<id>) y sus
+    # primeras subtareas; el resto de niveles se cargan al expandir
+    clave = (f"tareas:{shard}:{usuario_id}:{proyecto_activo_id}:{despues_de}:{vista}:{ahora}:"
+             f"{versiones['version_proyecto']}")
+    lista_tareas = cache.get(clave)
+    if lista_tareas is not None:
+        trozos_tareas = [lista_tareas]
+    else:
+        arbol = []
+        hay_mas = False
+        if vista is not None:
+            # Lista plana de pendientes, sin precargar subtareas
+            if versiones['version_proyecto'] is not None:
+                filas, hay_mas = pagina_vista(conn, proyecto_activo_id, vista, ahora)
+                arbol = [{'tarea': fila, 'hijas': [], 'hay_mas': False} for fila in filas]
+        else:
+            # Proyectos grandes: desde el árbol en memoria (grafo.py)
+            pagina = grafos.consultar(conn, shard, proyecto_activo_id, versiones['version_proyecto'],
+                                      versiones['tareas_proyecto'], lambda grafo: grafo.pagina_dashboard(despues_de))
+            if pagina is not None:
+                arbol, hay_mas = pagina
+            elif versiones['version_proyecto'] is not None:
+                raices, hay_mas = pagina_raices(conn, proyecto_activo_id, despues_de)
+                hijas, padres_con_mas = primeras_hijas(conn, proyecto_activo_id, [r['id'] for r in raices])
+                arbol = construir_arbol(list(raices) + hijas, padres_con_mas)
+        contexto = dict(arbol=arbol, hay_mas=hay_mas, despues_de=despues_de, vista=vista,
+                        proyecto_activo_id=proyecto_activo_id)
         
-        if proyecto_usuario:
-            tareas = conn.execute(
-                'SELECT * FROM tareas WHERE proyecto_id = ? ORDER BY parent_id, id',
-                (proyecto_activo_id,)
-            ).fetchall()
+        def guardar(html):
+            if versiones['version_proyecto'] is not None:
+                cache.set(clave, html)
+        
+        # En flujo se pinta mientras se envía y se guarda en la caché al terminar
+        if FLUJO:
+            trozos_tareas = fragmento_en_flujo('_lista_tareas.html', guardar, **contexto)
+        else:
+            lista_tareas = render_template('_lista_tareas.html', **contexto)
+            guardar(lista_tareas)
+            trozos_tareas = [lista_tareas]
+    
+    contexto = dict(lista_proyectos=lista_proyectos,
+                    lista_tareas=trozos_tareas,
+                    proyecto_activo_id=proyecto_activo_id,
+                    vista=vista,
+                    vistas=VISTAS,
+                    version_proyecto=versiones['version_proyecto'],
+                    username=session.get('username'))
+    if FLUJO:
+        respuesta = Response(transmitir_plantilla('index.html', **contexto), mimetype='text/html')
+    else:
+        respuesta = make_response(render_template('index.html', **contexto))
+    respuesta.set_etag(etag)
+    respuesta.headers['Cache-Control'] = 'private, no-cache'
+    return respuesta
+
+@app.route('/tareas/<int:tarea_id>/subtareas')
+@login_required
+def subtareas(tarea_id):
+    conn = get_db_lectura()
+    tarea_info = tarea_del_usuario(conn, tarea_id)
+    if not tarea_info:
+        abort(404)
+    
+    despues_de = request.args.get('after', 0, type=int)
+    proyecto_id = tarea_info['proyecto_id']
+    # Del árbol en memoria si el proyecto ya está cargado y al día (grafo.py)
+    pagina = grafos.consultar(conn, shard_actual(), proyecto_id, _version_proyecto(conn, proyecto_id), None,
+                              lambda grafo: grafo.pagina_hijas(tarea_id, despues_de, TAREAS_POR_PAGINA))
+    hijas, hay_mas = pagina or pagina_hijas(conn, proyecto_id, tarea_id, despues_de)
+    return render_template('subtareas.html',
+                         nodos=construir_arbol(hijas),
+                         padre_id=tarea_id,
+                         hay_mas=hay_mas)
+
+@app.route('/tareas/buscar')
+@login_required
+def buscar_tareas():
+    # Selector asíncrono de tarea padre: como mucho 20 coincidencias
+    proyecto_id = request.args.get('proyecto_id', type=int)
+    texto = request.args.get('q', '').strip()
     
-    conn.close()
+    conn = get_db_lectura()
+    if not proyecto_del_usuario(conn, proyecto_id):
+        abort(404)
     
-    return render_template('index.html', 
-                         tareas=tareas, 
-                         proyectos=proyectos, 
-                         proyecto_activo_id=proyecto_activo_id,
+    tareas = buscar_titulos(conn, proyecto_id, texto)
+    return jsonify([dict(tarea) for tarea in tareas])
+
+@app.route('/buscar')
+@login_required
+def buscar():
+    # Búsqueda de texto completo en todos los proyectos del usuario
+    texto = request.args.get('q', '').strip()
+    pagina = request.args.get('pagina', 1, type=int)
+    
+    conn = get_db_lectura()
+    resultados, hay_mas = buscar_texto(conn, session['user_id'], texto, pagina=pagina)
+    return render_template('buscar.html',
+                         texto=texto,
+                         resultados=resultados,
+                         pagina=pagina,
+                         hay_mas=hay_mas,
                          username=session.get('username'))
 
+# Las acciones sobre tareas responden con una redirección o, si se piden
+# con fetch desde el dashboard (Accept: application/json), con los eventos
+# del cambio; en ambos casos los reciben también las demás pestañas abiertas
+# en el proyecto (ver eventos.py)
+
+def pide_json():
+    return request.accept_mimetypes.best == 'application/json'
+
+def responder_cambio(evento, mensaje, proyecto_id, estado=200):
+    if pide_json():
+        return jsonify(eventos=[evento] if evento else []), estado
+    if mensaje:
+        flash(mensaje, 'success')
+    return redirect('/?proyecto_id=' + str(proyecto_id))
+
+def responder_error(mensaje, estado):
+    if pide_json():
+        return jsonify(error=mensaje), estado
+    flash(mensaje, 'danger')
+    return redirect('/')
+
+@app.errorhandler(EscrituraSaturada)
+def escritura_saturada(error):
+    # El cambio no se guardó: reintentarlo no lo duplica
+    return responder_error('El servidor está ocupado y el cambio no se guardó. Intenta nuevamente.', 503)
+
 @app.route('/agregar', methods=['POST'])
 @login_required
 def agregar_tarea():
     titulo = request.form['titulo']
     descripcion = request.form['descripcion']
-    parent_id = request.form['parent_id'] or None
+    parent_id = request.form.get('parent_id', type=int)
     proyecto_id = request.form.get('proyecto_id', type=int)
+    try:
+        vence = leer_vence(request.form.get('vence'))
+        prioridad = leer_prioridad(request.form.get('prioridad'))
+    except ValueError:
+        return responder_error('Fecha de vencimiento o prioridad no válida.', 400)
     
     # Verificar que el proyecto pertenece al usuario
     conn = get_db_connection()
-    proyecto_usuario = conn.execute(
-        'SELECT id FROM proyectos WHERE id = ? AND usuario_id = ?', 
-        (proyecto_id, session['user_id'])
-    ).fetchone()
-    
-    if not proyecto_usuario:
-        flash('Proyecto no válido.', 'danger')
-        return redirect('/')
+    if not proyecto_del_usuario(conn, proyecto_id):
+        return responder_error('Proyecto no válido.', 404)
     
-    c = conn.cursor()
-    c.execute('INSERT INTO tareas (titulo, descripcion, parent_id, proyecto_id) VALUES (?, ?, ?, ?)',
-              (titulo, descripcion, parent_id, proyecto_id))
-    conn.commit()
-    conn.close()
-    
-    flash('Tarea agregada correctamente.', 'success')
-    return redirect('/?proyecto_id=' + str(proyecto_id))
+    tarea, version = escritor_del_usuario().ejecutar(_insertar_tarea, titulo, descripcion, parent_id, proyecto_id,
+                                                     vence, prioridad)
+    if tarea is None:
+        return responder_error('Tarea padre no válida.', 404)
+    tarea_id = tarea['id']
+    grafos.aplicar(shard_actual(), proyecto_id, version, 'agregar', tarea)
+    recordatorios.programar(shard_actual(), tarea_id, vence)
+    anotar_actividad(proyecto_id, tarea_id, 'agregada',
+                     despues={'titulo': titulo, 'descripcion': descripcion, 'vence': vence, 'prioridad': prioridad,
+                              'parent_id': parent_id})
+    evento = publicar_tarea(conn, 'agregada', proyecto_id, tarea_id, version, responder=pide_json())
+    return responder_cambio(evento, 'Tarea agregada correctamente.', proyecto_id, 201)
 
-@app.route('/completar/<int:tarea_id>')
+@app.route('/completar/<int:tarea_id>', methods=['GET', 'POST'])
 @login_required
 def completar_tarea(tarea_id):
     conn = get_db_connection()
-    c = conn.cursor()
     
     # Obtener proyecto_id y verificar permisos
-    tarea_info = c.execute('''
-        SELECT t.proyecto_id 
-        FROM tareas t 
-        JOIN proyectos p ON t.proyecto_id = p.id 
-        WHERE t.id = ? AND p.usuario_id = ?
-    ''', (tarea_id, session['user_id'])).fetchone()
+    tarea_info = tarea_del_usuario(conn, tarea_id)
     
     if not tarea_info:
-        flash('Tarea no encontrada o sin permisos.', 'danger')
-        return redirect('/')
+        return responder_error('Tarea no encontrada o sin permisos.', 404)
     
     proyecto_id = tarea_info['proyecto_id']
     
-    c.execute('UPDATE tareas SET completada = NOT completada WHERE id = ?', (tarea_id,))
-    conn.commit()
-    conn.close()
-    
-    return redirect('/?proyecto_id=' + str(proyecto_id))
+    # Alternar la tarea y propagar el nuevo estado a todo su subárbol
+    completada, version = escritor_del_usuario().ejecutar(_alternar_tarea, tarea_id, proyecto_id)
+    evento = None
+    if version is not None:
+        grafos.aplicar(shard_actual(), proyecto_id, version, 'marcar', tarea_id, completada)
+        anotar_actividad(proyecto_id, tarea_id, 'completada' if completada else 'reabierta',
+                         {'completada': bool(not completada)}, {'completada': bool(completada)})
+        evento = publicar_tarea(conn, 'actualizada', proyecto_id, tarea_id, version, responder=pide_json())
+    return responder_cambio(evento, None, proyecto_id)
 
-@app.route('/eliminar/<int:tarea_id>')
+@app.route('/eliminar/<int:tarea_id>', methods=['GET', 'POST'])
 @login_required
 def eliminar_tarea(tarea_id):
     conn = get_db_connection()
-    c = conn.cursor()
     
     # Verificar permisos antes de eliminar
-    tarea_info = c.execute('''
-        SELECT t.proyecto_id 
-        FROM tareas t 
-        JOIN proyectos p ON t.proyecto_id = p.id 
-        WHERE t.id = ? AND p.usuario_id = ?
-    ''', (tarea_id, session['user_id'])).fetchone()
+    tarea_info = tarea_del_usuario(conn, tarea_id)
     
     if not tarea_info:
-        flash('Tarea no encontrada o sin permisos.', 'danger')
-        return redirect('/')
+        return responder_error('Tarea no encontrada o sin permisos.', 404)
     
     proyecto_id = tarea_info['proyecto_id']
     
-    # Eliminar la tarea y sus subtareas
-    c.execute('DELETE FROM tareas WHERE id = ? OR parent_id = ?', (tarea_id, tarea_id))
-    conn.commit()
-    conn.close()
-    
-    flash('Tarea eliminada correctamente.', 'success')
-    return redirect('/?proyecto_id=' + str(proyecto_id))
+    # Eliminar la tarea y todo su subárbol (hijos, nietos, ...)
+    tarea, version = escritor_del_usuario().ejecutar(_eliminar_tarea, tarea_id, proyecto_id)
+    evento = None
+    if version is not None:
+        grafos.aplicar(shard_actual(), proyecto_id, version, 'eliminar', tarea_id)
+        anotar_actividad(proyecto_id, tarea_id, 'eliminada', {'titulo': tarea['titulo']})
+        evento = publicar_tarea(conn, 'eliminada', proyecto_id, tarea_id, version, tarea['parent_id'],
+                                responder=pide_json())
+    return responder_cambio(evento, 'Tarea eliminada correctamente.', proyecto_id)
+
+@app.route('/proyectos/<int:proyecto_id>/eventos')
+@login_required
+def eventos_proyecto(proyecto_id):
+    # Flujo SSE del dashboard; al reconectar el navegador envía la última
+    # versión recibida en Last-Event-ID
+    conn = get_db_connection()
+    if not proyecto_del_usuario(conn, proyecto_id):
+        abort(404)
+    if canales.saturados():
+        abort(503)
+    version = request.headers.get('Last-Event-ID', type=int) or request.args.get('version', type=int)
+    return flujo_eventos(shard_actual(), proyecto_id, version)
 
 @app.route('/crear_proyecto', methods=['POST'])
 @login_required
@@ -298,16 +487,14 @@ def crear_proyecto():
     nombre = request.form['nombre_proyecto']
     descripcion = request.form.get('descripcion_proyecto', '')
     
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('INSERT INTO proyectos (nombre, descripcion, usuario_id) VALUES (?, ?, ?)',
-              (nombre, descripcion, session['user_id']))
-    conn.commit()
-    conn.close()
+    proyecto_id = escritor_del_usuario().ejecutar(_insertar_proyecto, nombre, descripcion, session['user_id'])
+    recordar_proyectos([proyecto_id])
+    anotar_actividad(proyecto_id, None, 'proyecto_creado', despues={'nombre': nombre})
     
     flash('Proyecto creado correctamente.', 'success')
     return redirect('/')
 
 if __name__ == '__main__':
+    # Servidor de desarrollo; en producción usar asgi.py
     port = int(os.environ.get("PORT", 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,126 @@
+# Operaciones sobre subárboles de tareas con CTE recursivas (WITH RECURSIVE).
+# Todas las consultas recorren el árbol dentro del mismo proyecto usando el
+# índice (proyecto_id, parent_id, id), sin bucles en Python.
+#
+# Las tareas eliminadas siguen en la tabla con tareas.eliminada != 0 hasta que
+# las purga mantenimiento.py: toda consulta sobre tareas vivas lleva
+# eliminada = 0, que además es la condición de los índices parciales.
+
+SUBARBOL_CTE = '''
+    WITH RECURSIVE subarbol(id) AS (
+        SELECT id FROM tareas WHERE id = :tarea_id AND proyecto_id = :proyecto_id AND eliminada = 0
+        UNION
+        SELECT t.id FROM tareas t
+        JOIN subarbol ON t.proyecto_id = :proyecto_id AND t.parent_id = subarbol.id AND t.eliminada = 0
+    )
+'''
+
+# Marca el subárbol como eliminado con la hora actual
+ELIMINAR_SUBARBOL_SQL = SUBARBOL_CTE + '''
+    UPDATE tareas SET eliminada = CAST(strftime('%s', 'now') AS INTEGER) WHERE id IN subarbol
+'''
+
+MARCAR_SUBARBOL_SQL = SUBARBOL_CTE + 'UPDATE tareas SET completada = :completada WHERE id IN subarbol'
+
+
+# cursor.rowcount vale -1 en sentencias que empiezan por WITH, así que las
+# filas afectadas se leen con changes(), que no cuenta las que escriben los
+# triggers (contadores, búsqueda) como sí haría total_changes
+def filas_cambiadas(conn):
+    return conn.execute('SELECT changes()').fetchone()[0]
+
+
+def eliminar_subarbol(conn, tarea_id, proyecto_id):
+    conn.execute(ELIMINAR_SUBARBOL_SQL, {'tarea_id': tarea_id, 'proyecto_id': proyecto_id})
+    return filas_cambiadas(conn)
+
+
+def marcar_subarbol(conn, tarea_id, proyecto_id, completada):
+    conn.execute(MARCAR_SUBARBOL_SQL,
+                 {'tarea_id': tarea_id, 'proyecto_id': proyecto_id, 'completada': completada})
+    return filas_cambiadas(conn)
+
+
+# ==================== PAGINACIÓN Y ARMADO DEL ÁRBOL ====================
+
+TAREAS_POR_PAGINA = 50
+HIJAS_PRECARGADAS = 10
+
+# Indica si la tarea tiene subtareas para mostrar el botón de expandir
+# (contador mantenido por triggers, ver contadores.py)
+COLUMNA_TIENE_HIJAS = 't.total_hijas > 0 AS tiene_hijas'
+
+PAGINA_RAICES_SQL = f'''
+    SELECT t.*, {COLUMNA_TIENE_HIJAS} FROM tareas t
+    WHERE t.proyecto_id = ? AND t.parent_id IS NULL AND t.id > ? AND t.eliminada = 0
+    ORDER BY t.id LIMIT ?
+'''
+
+PAGINA_HIJAS_SQL = f'''
+    SELECT t.*, {COLUMNA_TIENE_HIJAS} FROM tareas t
+    WHERE t.proyecto_id = ? AND t.parent_id = ? AND t.id > ? AND t.eliminada = 0
+    ORDER BY t.id LIMIT ?
+'''
+
+
+TAREA_SQL = f'''
+    SELECT t.*, {COLUMNA_TIENE_HIJAS} FROM tareas t
+    WHERE t.id = ? AND t.proyecto_id = ? AND t.eliminada = 0
+'''
+
+
+def _paginar(filas, limite):
+    # Se pide una fila de más para saber si existe otra página
+    return filas[:limite], len(filas) > limite
+
+
+def pagina_raices(conn, proyecto_id, despues_de=0, limite=TAREAS_POR_PAGINA):
+    filas = conn.execute(PAGINA_RAICES_SQL, (proyecto_id, despues_de, limite + 1)).fetchall()
+    return _paginar(filas, limite)
+
+
+def pagina_hijas(conn, proyecto_id, padre_id, despues_de=0, limite=TAREAS_POR_PAGINA):
+    filas = conn.execute(PAGINA_HIJAS_SQL, (proyecto_id, padre_id, despues_de, limite + 1)).fetchall()
+    return _paginar(filas, limite)
+
+
+def primeras_hijas(conn, proyecto_id, padres_ids, limite=HIJAS_PRECARGADAS):
+    # Las primeras `limite` hijas de cada padre en una sola consulta
+    if not padres_ids:
+        return [], set()
+
+    marcadores = ', '.join('?' * len(padres_ids))
+    filas = conn.execute(f'''
+        SELECT * FROM (
+            SELECT t.*, {COLUMNA_TIENE_HIJAS},
+                   ROW_NUMBER() OVER (PARTITION BY t.parent_id ORDER BY t.id) AS posicion
+            FROM tareas t
+            WHERE t.proyecto_id = ? AND t.parent_id IN ({marcadores}) AND t.eliminada = 0
+        ) WHERE posicion <= ?
+    ''', (proyecto_id, *padres_ids, limite + 1)).fetchall()
+
+    padres_con_mas = {fila['parent_id'] for fila in filas if fila['posicion'] > limite}
+    return [fila for fila in filas if fila['posicion'] <= limite], padres_con_mas
+
+
+def construir_arbol(filas, padres_con_mas=()):
+    # Convierte filas planas (padres e hijas en cualquier orden) en nodos
+    # anidados; las filas cuyo padre no está cargado quedan como raíces
+    nodos = {}
+    for fila in filas:
+        nodos[fila['id']] = {'tarea': fila, 'hijas': [], 'hay_mas': fila['id'] in padres_con_mas}
+
+    raices = []
+    for fila in filas:
+        padre = nodos.get(fila['parent_id'])
+        (padre['hijas'] if padre else raices).append(nodos[fila['id']])
+    return raices
+
+
+def nodo_tarea(conn, proyecto_id, tarea_id):
+    # Una tarea con sus primeras hijas, como se muestra en el dashboard
+    tarea = conn.execute(TAREA_SQL, (tarea_id, proyecto_id)).fetchone()
+    if tarea is None:
+        return None
+    hijas, padres_con_mas = primeras_hijas(conn, proyecto_id, [tarea_id])
+    return construir_arbol([tarea] + hijas, padres_con_mas)[0]
@@ -0,0 +1,301 @@
+import asyncio
+import io
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.exceptions import ClientDisconnected, RequestEntityTooLarge
+from conexiones import pool, pools
+from eventos import canales
+from plantillas import precompilar
+from app import app
+
+# Modo de producción ASGI:
+#
+#   python asgi.py                      (necesita uvicorn: pip install uvicorn)
+#   uvicorn asgi:aplicacion --workers 4 (o cualquier otro servidor ASGI)
+#
+# El bucle de eventos del servidor atiende las conexiones (keep-alive,
+# clientes lentos, subida del cuerpo) sin ocupar hilos, y la aplicación Flask
+# se ejecuta en un pool de hilos dedicado y acotado. Las lecturas de SQLite
+# van en paralelo (WAL + pool de conexiones), las escrituras se serializan en
+# un único escritor por proceso y shard (ver escritor.py) y los
+# hashes de contraseñas van a su propio pool de procesos (seguridad.py).
+# Los flujos de eventos del dashboard (text/event-stream, ver eventos.py)
+# pasan a otro pool al empezar a responder para no ocupar un hilo de
+# peticiones mientras esperan.
+
+# Hilos que ejecutan peticiones; por defecto uno por conexión del pool para
+# que ninguna petición espere por una conexión libre
+HILOS = int(os.environ.get('ASGI_HILOS', pool.tamano_max))
+# Procesos del servidor (cada uno con su pool de hilos y de conexiones)
+WORKERS = int(os.environ.get('WEB_WORKERS', 1))
+# El cuerpo de la petición llega a la aplicación a medida que lo lee
+# (wsgi.input), sin acumularlo aquí. Los formularios y el JSON sí se leen
+# enteros en memoria, así que se limitan a MAX_CUERPO bytes; las rutas que
+# leen el cuerpo por lotes (la importación) no tienen límite
+MAX_CUERPO = int(os.environ.get('ASGI_MAX_CUERPO', 16 * 1024 * 1024))
+RUTAS_EN_FLUJO = ('/api/v1/importar',)
+# Flujos SSE abiertos a la vez; casi siempre esperando, sin conexión a SQLite
+FLUJOS = int(os.environ.get('ASGI_FLUJOS', 256))
+# Al parar, espera máxima a las peticiones en curso; los flujos de eventos
+# abiertos no terminan solos y se cortan al cumplirse
+ESPERA_APAGADO = int(os.environ.get('ASGI_ESPERA_APAGADO', 5))
+
+
+class AplicacionAsgi:
+    """Adaptador ASGI que ejecuta una aplicación WSGI en un pool de hilos."""
+
+    def __init__(self, app_wsgi, hilos, flujos):
+        self.app_wsgi = app_wsgi
+        self.hilos = hilos
+        self.max_flujos = flujos
+        self._executor = None
+        self._flujos = None
+
+    @property
+    def executor(self):
+        # Sin lifespan (algunos servidores no lo envían) se crea al vuelo
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix='peticion')
+        return self._executor
+
+    @property
+    def flujos(self):
+        if self._flujos is None:
+            self._flujos = ThreadPoolExecutor(max_workers=self.max_flujos, thread_name_prefix='flujo')
+        return self._flujos
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == 'lifespan.startup':
+                # Plantillas compiladas (o leídas de la caché en disco) antes de
+                # la primera petición
+                precompilar(self.app_wsgi)
+                await send({'type': 'lifespan.startup.complete'})
+            elif mensaje['type'] == 'lifespan.shutdown':
+                canales.cerrar()
+                for executor in (self._executor, self._flujos):
+                    if executor is not None:
+                        executor.shutdown(wait=True)
+                for pool_shard in pools:
+                    pool_shard.cerrar()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        limite = None if scope['path'] in RUTAS_EN_FLUJO else MAX_CUERPO
+        longitud = dict(scope.get('headers', [])).get(b'content-length')
+        if limite is not None and longitud and longitud.isdigit() and int(longitud) > limite:
+            await send({'type': 'http.response.start', 'status': 413,
+                        'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+            await send({'type': 'http.response.body', 'body': b'Cuerpo demasiado grande\n'})
+            return
+
+        loop = asyncio.get_running_loop()
+        cuerpo = CuerpoAsgi(loop, limite)
+        environ = construir_environ(scope, cuerpo)
+        desconectado = threading.Event()
+        receptor = asyncio.create_task(self._recibir(receive, cuerpo, desconectado))
+        try:
+            flujo = await loop.run_in_executor(self.executor, self._ejecutar, environ, send, loop, desconectado)
+            # Lo que la aplicación no leyó del cuerpo se descarta
+            cuerpo.soltar()
+            if flujo is not None:
+                await loop.run_in_executor(self.flujos, flujo)
+        finally:
+            # También si el servidor cancela la petición al apagarse
+            desconectado.set()
+            receptor.cancel()
+
+    async def _recibir(self, receive, cuerpo, desconectado):
+        # Único lector de receive: pasa cada trozo del cuerpo cuando el hilo
+        # de la petición lo pide (así el cliente no envía más deprisa de lo
+        # que la aplicación lee) y después espera el cierre del cliente
+        try:
+            while True:
+                await cuerpo.esperar_pedido()
+                mensaje = await receive()
+                if mensaje['type'] == 'http.disconnect':
+                    desconectado.set()
+                    return
+                if mensaje['type'] == 'http.request':
+                    cuerpo.recibir(mensaje.get('body', b''), mensaje.get('more_body', False))
+        finally:
+            cuerpo.cortar()
+
+    def _ejecutar(self, environ, send, loop, desconectado):
+        # En un hilo del pool: cada trozo de la respuesta se envía en cuanto
+        # se genera, así las respuestas en streaming no se acumulan en memoria.
+        # Un flujo de eventos se devuelve sin empezar para enviarlo desde el
+        # pool de flujos.
+        inicio = {}
+
+        def start_response(estado, cabeceras, exc_info=None):
+            inicio['mensaje'] = {
+                'type': 'http.response.start',
+                'status': int(estado.split(' ', 1)[0]),
+                'headers': [(nombre.lower().encode('latin-1'), valor.encode('latin-1'))
+                            for nombre, valor in cabeceras],
+            }
+
+        def enviar(mensaje):
+            if desconectado.is_set():
+                raise ConnectionResetError
+            asyncio.run_coroutine_threadsafe(send(mensaje), loop).result()
+
+        respuesta = self.app_wsgi(environ, start_response)
+        cabeceras = dict(inicio['mensaje']['headers']) if 'mensaje' in inicio else {}
+        if cabeceras.get(b'content-type', b'').startswith(b'text/event-stream'):
+            return lambda: self._transmitir(respuesta, inicio, enviar)
+        self._transmitir(respuesta, inicio, enviar)
+        return None
+
+    def _transmitir(self, respuesta, inicio, enviar):
+        try:
+            for trozo in respuesta:
+                if not trozo:
+                    continue
+                if 'mensaje' in inicio:
+                    enviar(inicio.pop('mensaje'))
+                enviar({'type': 'http.response.body', 'body': trozo, 'more_body': True})
+            if 'mensaje' in inicio:
+                enviar(inicio.pop('mensaje'))
+            enviar({'type': 'http.response.body', 'body': b''})
+        except OSError:
+            pass  # el cliente cerró la conexión
+        finally:
+            if hasattr(respuesta, 'close'):
+                respuesta.close()
+
+
+class CuerpoAsgi(io.RawIOBase):
+    """wsgi.input que lee el cuerpo de la petición a medida que llega.
+
+    El hilo de la petición lee (readinto); el bucle de eventos recibe los
+    mensajes http.request y los deja en una cola segura entre hilos.
+    """
+
+    def __init__(self, loop, limite=None):
+        self.loop = loop
+        self.limite = limite
+        self.recibidos = 0
+        # Solo se usan en el bucle de eventos; el primer trozo se pide ya
+        self.completo = False
+        self._descartar = False
+        self._pedido = asyncio.Event()
+        self._pedido.set()
+        # Del bucle al hilo: bytes, None al final o la excepción para el lector
+        self._trozos = queue.Queue()
+        self._actual = b''
+        self._posicion = 0
+        self._fin = False
+
+    # En el bucle de eventos
+
+    async def esperar_pedido(self):
+        if not self.completo and not self._descartar:
+            await self._pedido.wait()
+            self._pedido.clear()
+
+    def recibir(self, trozo, mas):
+        if self.completo:
+            return
+        self.recibidos += len(trozo)
+        if self._descartar:
+            self.completo = not mas
+        elif self.limite is not None and self.recibidos > self.limite:
+            self.completo = True
+            self._trozos.put(RequestEntityTooLarge())
+        else:
+            self._trozos.put(trozo)
+            if not mas:
+                self.completo = True
+                self._trozos.put(None)
+
+    def soltar(self):
+        # La aplicación ya respondió: el resto del cuerpo se recibe y se tira
+        self._descartar = True
+        self._pedido.set()
+
+    def cortar(self):
+        # El cliente se fue (o se canceló la petición) sin terminar de enviar
+        if not self.completo:
+            self.completo = True
+            self._trozos.put(ClientDisconnected())
+
+    # En el hilo de la petición
+
+    def readable(self):
+        return True
+
+    def readinto(self, destino):
+        while self._posicion >= len(self._actual):
+            if self._fin:
+                return 0
+            self.loop.call_soon_threadsafe(self._pedido.set)
+            trozo = self._trozos.get()
+            if trozo is None or isinstance(trozo, Exception):
+                self._fin = True
+                if trozo is not None:
+                    raise trozo
+                return 0
+            self._actual, self._posicion = trozo, 0
+        leidos = min(len(destino), len(self._actual) - self._posicion)
+        destino[:leidos] = self._actual[self._posicion:self._posicion + leidos]
+        self._posicion += leidos
+        return leidos
+
+
+def construir_environ(scope, cuerpo):
+    # Traducción del scope ASGI al environ WSGI (PEP 3333)
+    servidor = scope.get('server') or ('localhost', 80)
+    cliente = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': servidor[0],
+        'SERVER_PORT': str(servidor[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': cliente[0],
+        'REMOTE_PORT': str(cliente[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BufferedReader(cuerpo),
+        # Sin Content-Length (chunked) el cuerpo termina donde termina la entrada
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': WORKERS > 1,
+        'wsgi.run_once': False,
+    }
+    for nombre, valor in scope.get('headers', []):
+        nombre = nombre.decode('latin-1').upper().replace('-', '_')
+        valor = valor.decode('latin-1')
+        if nombre not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            nombre = 'HTTP_' + nombre
+        if nombre in environ:
+            valor = environ[nombre] + ('; ' if nombre == 'HTTP_COOKIE' else ',') + valor
+        environ[nombre] = valor
+    return environ
+
+
+aplicacion = AplicacionAsgi(app, HILOS, FLUJOS)
+
+
+if __name__ == "__main__":
+    import uvicorn  # solo necesario para servir con este módulo
+
+    uvicorn.run('asgi:aplicacion', host='0.0.0.0', port=int(os.environ.get('PORT', 5000)),
+                workers=WORKERS, lifespan='on', log_level='info',
+                timeout_graceful_shutdown=ESPERA_APAGADO)
@@ -0,0 +1,341 @@
+import argparse
+import http.cookiejar
+import json
+import logging
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+# Benchmark reproducible de las rutas de app.py.
+#
+#   python benchmark.py --usuarios 20 --proyectos 5 --tareas 2000 --profundidad 4 \
+#       --guardar resultados.json [--comparar base.json --tolerancia 0.2]
+#
+# Crea una base de datos sintética en un directorio temporal, mide login,
+# dashboard, agregar, completar y eliminar con el cliente de pruebas de Flask
+# (sin red) y después lanza una carga HTTP multihilo contra un servidor
+# local (el de desarrollo de werkzeug, o asgi.py con --servidor asgi). Los
+# resultados se guardan en JSON; con --comparar se marcan como regresión
+# las métricas cuyo p95 empeore más que la tolerancia.
+
+PASSWORD = 'benchmark123'
+
+
+# ==================== DATOS SINTÉTICOS ====================
+
+def sembrar(ruta, usuarios, proyectos_por_usuario, tareas_por_proyecto, profundidad, semilla=42):
+    # Se importa aquí: TAREAS_DB ya apunta a la base de datos temporal
+    from werkzeug.security import generate_password_hash
+    from conexiones import abrir_conexion, transaccion
+    from esquema import actualizar_esquema
+
+    aleatorio = random.Random(semilla)
+    conn = abrir_conexion(ruta)
+    actualizar_esquema(conn)
+
+    # Un solo hash para todos: sembrar no debe tardar minutos
+    password_hash = generate_password_hash(PASSWORD)
+    with transaccion(conn):
+        conn.executemany(
+            'INSERT INTO usuarios (username, email, password_hash) VALUES (?, ?, ?)',
+            [(f'bench{u}', f'bench{u}@ejemplo.com', password_hash) for u in range(usuarios)]
+        )
+        ids_usuarios = [fila[0] for fila in conn.execute("SELECT id FROM usuarios WHERE username LIKE 'bench%'")]
+        conn.executemany(
+            'INSERT INTO proyectos (nombre, descripcion, usuario_id) VALUES (?, ?, ?)',
+            [(f'Proyecto {p}', '', usuario_id) for usuario_id in ids_usuarios for p in range(proyectos_por_usuario)]
+        )
+
+    proyectos = conn.execute(
+        f"SELECT id FROM proyectos WHERE usuario_id IN ({', '.join('?' * len(ids_usuarios))})", ids_usuarios
+    ).fetchall()
+
+    # Cada nivel del árbol se inserta por lotes colgando de tareas del nivel anterior
+    por_nivel = max(tareas_por_proyecto // max(profundidad, 1), 1)
+    for (proyecto_id,) in proyectos:
+        with transaccion(conn):
+            padres = [None]
+            restantes = tareas_por_proyecto
+            for nivel in range(max(profundidad, 1)):
+                cantidad = restantes if nivel == profundidad - 1 else min(por_nivel, restantes)
+                conn.executemany(
+                    'INSERT INTO tareas (titulo, descripcion, parent_id, proyecto_id, completada) VALUES (?, ?, ?, ?, ?)',
+                    [(f'Tarea {nivel}-{i}', 'Descripción de prueba', aleatorio.choice(padres), proyecto_id,
+                      aleatorio.random() < 0.3) for i in range(cantidad)]
+                )
+                ultimo = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+                padres = list(range(ultimo - cantidad + 1, ultimo + 1)) or padres
+                restantes -= cantidad
+    conn.execute('ANALYZE')
+    conn.close()
+    return ids_usuarios
+
+
+def proyectos_y_tareas(ruta, usuario_id):
+    conn = sqlite3.connect(ruta)
+    proyectos = [fila[0] for fila in conn.execute('SELECT id FROM proyectos WHERE usuario_id = ?', (usuario_id,))]
+    tareas = [fila[0] for fila in conn.execute(
+        f"SELECT id FROM tareas WHERE eliminada = 0 AND proyecto_id IN ({', '.join('?' * len(proyectos))})", proyectos)]
+    conn.close()
+    return proyectos, tareas
+
+
+# ==================== ESTADÍSTICAS ====================
+
+def resumir(latencias, segundos_totales=None):
+    latencias = sorted(latencias)
+    if len(latencias) < 2:
+        latencias = latencias * 2
+    cuantiles = statistics.quantiles(latencias, n=100, method='inclusive')
+    resumen = {
+        'n': len(latencias),
+        'p50_ms': round(cuantiles[49] * 1000, 3),
+        'p95_ms': round(cuantiles[94] * 1000, 3),
+        'p99_ms': round(cuantiles[98] * 1000, 3),
+        'media_ms': round(statistics.fmean(latencias) * 1000, 3),
+    }
+    total = segundos_totales if segundos_totales is not None else sum(latencias)
+    resumen['peticiones_s'] = round(len(latencias) / total, 1) if total else None
+    return resumen
+
+
+def medir(funcion, iteraciones):
+    latencias = []
+    for _ in range(iteraciones):
+        inicio = time.perf_counter()
+        funcion()
+        latencias.append(time.perf_counter() - inicio)
+    return resumir(latencias)
+
+
+# ==================== ESCENARIOS (CLIENTE DE PRUEBAS) ====================
+
+def escenarios_cliente(app, ruta, usuario_id, iteraciones, semilla=42):
+    from cache import cache
+    from grafo import grafos
+
+    aleatorio = random.Random(semilla)
+    proyectos, tareas = proyectos_y_tareas(ruta, usuario_id)
+    cliente = app.test_client()
+    username = _username(ruta, usuario_id)
+
+    def comprobar(respuesta, *codigos):
+        # El dashboard se genera en streaming mientras se lee el cuerpo: se lee
+        # entero (y se cierra) dentro de la medida
+        respuesta.get_data()
+        respuesta.close()
+        if respuesta.status_code not in codigos:
+            raise RuntimeError(f'{respuesta.request.path}: estado {respuesta.status_code}')
+
+    def login():
+        comprobar(cliente.post('/login', data={'username': username, 'password': PASSWORD}), 302)
+
+    def dashboard():
+        comprobar(cliente.get(f'/?proyecto_id={aleatorio.choice(proyectos)}'), 200)
+
+    def dashboard_frio():
+        cache.clear()
+        grafos.limpiar()
+        comprobar(cliente.get(f'/?proyecto_id={aleatorio.choice(proyectos)}'), 200)
+
+    agregadas = [0]
+
+    def agregar():
+        proyecto_id = aleatorio.choice(proyectos)
+        comprobar(cliente.post('/agregar', data={'titulo': 'Nueva', 'descripcion': '',
+                                                 'parent_id': '', 'proyecto_id': proyecto_id}), 302)
+        agregadas[0] += 1
+
+    def completar():
+        comprobar(cliente.get(f'/completar/{aleatorio.choice(tareas)}'), 302)
+
+    resultados = {'login': medir(login, max(iteraciones // 10, 2))}
+    resultados['dashboard'] = medir(dashboard, iteraciones)
+    resultados['dashboard_frio'] = medir(dashboard_frio, iteraciones)
+    resultados['agregar'] = medir(agregar, iteraciones)
+    resultados['completar'] = medir(completar, iteraciones)
+
+    # Eliminar las tareas recién agregadas (sin hijas) para no alterar el árbol
+    conn = sqlite3.connect(ruta)
+    recientes = [fila[0] for fila in conn.execute(
+        "SELECT id FROM tareas WHERE titulo = 'Nueva' AND eliminada = 0 ORDER BY id DESC LIMIT ?", (agregadas[0],))]
+    conn.close()
+    pendientes = iter(recientes)
+    resultados['eliminar'] = medir(lambda: comprobar(cliente.get(f'/eliminar/{next(pendientes)}'), 302),
+                                   len(recientes))
+    return resultados
+
+
+def _username(ruta, usuario_id):
+    conn = sqlite3.connect(ruta)
+    username = conn.execute('SELECT username FROM usuarios WHERE id = ?', (usuario_id,)).fetchone()[0]
+    conn.close()
+    return username
+
+
+# ==================== CARGA HTTP ====================
+
+class SinRedirecciones(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def arrancar_servidor(app, tipo):
+    # Devuelve (url base, función para pararlo)
+    if tipo == 'asgi':
+        import uvicorn
+        from asgi import aplicacion
+
+        servidor = uvicorn.Server(uvicorn.Config(aplicacion, host='127.0.0.1', port=0, log_level='error'))
+        threading.Thread(target=servidor.run, daemon=True).start()
+        while not servidor.started:
+            time.sleep(0.01)
+        puerto = servidor.servers[0].sockets[0].getsockname()[1]
+
+        def parar():
+            servidor.should_exit = True
+        return f'http://127.0.0.1:{puerto}', parar
+
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    servidor = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{servidor.server_port}', servidor.shutdown
+
+
+def carga_http(app, ruta, ids_usuarios, hilos, segundos, servidor='wsgi', semilla=42):
+    base, parar = arrancar_servidor(app, servidor)
+
+    latencias = {'dashboard': [], 'completar': []}
+    errores = [0]
+    lock = threading.Lock()
+    fin = time.perf_counter() + segundos
+
+    def trabajador(numero):
+        aleatorio = random.Random(semilla + numero)
+        usuario_id = ids_usuarios[numero % len(ids_usuarios)]
+        proyectos, tareas = proyectos_y_tareas(ruta, usuario_id)
+        abridor = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), SinRedirecciones)
+
+        def pedir(url, datos=None):
+            try:
+                abridor.open(base + url, data=datos, timeout=30).read()
+            except urllib.error.HTTPError as error:
+                if error.code >= 400:
+                    raise
+
+        pedir('/login', urllib.parse.urlencode(
+            {'username': _username(ruta, usuario_id), 'password': PASSWORD}).encode())
+        while time.perf_counter() < fin:
+            # Mezcla típica: mayoría de lecturas y alguna escritura
+            nombre = 'completar' if aleatorio.random() < 0.1 else 'dashboard'
+            url = (f'/completar/{aleatorio.choice(tareas)}' if nombre == 'completar'
+                   else f'/?proyecto_id={aleatorio.choice(proyectos)}')
+            inicio = time.perf_counter()
+            try:
+                pedir(url)
+            except Exception:
+                with lock:
+                    errores[0] += 1
+                continue
+            with lock:
+                latencias[nombre].append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    trabajadores = [threading.Thread(target=trabajador, args=(i,)) for i in range(hilos)]
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    duracion = time.perf_counter() - inicio
+    parar()
+
+    resultados = {f'http_{nombre}': resumir(valores, duracion) for nombre, valores in latencias.items() if valores}
+    todas = [latencia for valores in latencias.values() for latencia in valores]
+    if todas:
+        resultados['http_total'] = resumir(todas, duracion)
+        resultados['http_total']['errores'] = errores[0]
+    return resultados
+
+
+# ==================== COMPARACIÓN ====================
+
+def comparar(actuales, base, tolerancia):
+    regresiones = []
+    for nombre, medida in actuales.items():
+        anterior = base.get('resultados', {}).get(nombre)
+        if not anterior or not anterior.get('p95_ms'):
+            continue
+        cambio = medida['p95_ms'] / anterior['p95_ms'] - 1
+        if cambio > tolerancia:
+            regresiones.append((nombre, anterior['p95_ms'], medida['p95_ms'], cambio))
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de las rutas del organizador de tareas')
+    parser.add_argument('--usuarios', type=int, default=10)
+    parser.add_argument('--proyectos', type=int, default=3, help='proyectos por usuario')
+    parser.add_argument('--tareas', type=int, default=500, help='tareas por proyecto')
+    parser.add_argument('--profundidad', type=int, default=3, help='niveles del árbol de tareas')
+    parser.add_argument('--iteraciones', type=int, default=200, help='peticiones por escenario')
+    parser.add_argument('--hilos', type=int, default=8, help='hilos de la carga HTTP (0 = sin carga HTTP)')
+    parser.add_argument('--segundos', type=float, default=10, help='duración de la carga HTTP')
+    parser.add_argument('--servidor', choices=('wsgi', 'asgi'), default='wsgi',
+                        help='servidor de la carga HTTP (asgi necesita uvicorn)')
+    parser.add_argument('--guardar', help='fichero JSON donde guardar los resultados')
+    parser.add_argument('--comparar', help='resultados JSON de referencia')
+    parser.add_argument('--tolerancia', type=float, default=0.2, help='empeoramiento de p95 permitido')
+    args = parser.parse_args(argv)
+
+    directorio = tempfile.mkdtemp(prefix='bench_tareas_')
+    ruta = os.path.join(directorio, 'tareas.db')
+    os.environ['TAREAS_DB'] = ruta
+
+    inicio = time.perf_counter()
+    ids_usuarios = sembrar(ruta, args.usuarios, args.proyectos, args.tareas, args.profundidad)
+    print(f"🌱 Base de datos sintética en {ruta} ({time.perf_counter() - inicio:.1f} s)")
+
+    from app import app
+    resultados = escenarios_cliente(app, ruta, ids_usuarios[0], args.iteraciones)
+    if args.hilos:
+        resultados.update(carga_http(app, ruta, ids_usuarios, args.hilos, args.segundos, args.servidor))
+
+    for nombre, medida in resultados.items():
+        print(f"   {nombre:16} p50 {medida['p50_ms']:8.2f} ms   p95 {medida['p95_ms']:8.2f} ms   "
+              f"p99 {medida['p99_ms']:8.2f} ms   {medida['peticiones_s'] or 0:8.1f} req/s")
+
+    informe = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'configuracion': {clave: valor for clave, valor in vars(args).items()
+                          if clave not in ('guardar', 'comparar')},
+        'resultados': resultados,
+    }
+    if args.guardar:
+        with open(args.guardar, 'w', encoding='utf-8') as fichero:
+            json.dump(informe, fichero, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados guardados en {args.guardar}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as fichero:
+            regresiones = comparar(resultados, json.load(fichero), args.tolerancia)
+        for nombre, antes, ahora, cambio in regresiones:
+            print(f"❌ {nombre}: p95 {antes:.2f} ms → {ahora:.2f} ms (+{cambio:.0%})")
+        if regresiones:
+            return 1
+        print("✅ Sin regresiones respecto a la referencia")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import re
+from markupsafe import Markup, escape
+
+# Búsqueda de texto completo sobre títulos y descripciones con el índice FTS5
+# tareas_fts (migración 4). Los resultados se limitan siempre a los proyectos
+# del usuario y se ordenan por relevancia (bm25).
+
+RESULTADOS_POR_PAGINA = 20
+# Más allá de esta página conviene afinar la búsqueda (OFFSET no es gratis)
+PAGINA_MAXIMA = 50
+
+# Marcadores que no aparecen en texto normal; se sustituyen por <mark>
+# después de escapar el HTML del título y la descripción
+_INICIO, _FIN = '\x02', '\x03'
+
+_PALABRA = re.compile(r'\w+', re.UNICODE)
+
+
+def consulta_fts(texto):
+    # Cada palabra entre comillas (sin operadores de FTS5) y la última como
+    # prefijo para que funcione mientras se escribe
+    palabras = _PALABRA.findall(texto)
+    if not palabras:
+        return None
+    return ' '.join(f'"{palabra}"' for palabra in palabras) + '*'
+
+
+def resaltar(texto):
+    return Markup(str(escape(texto or '')).replace(_INICIO, '<mark>').replace(_FIN, '</mark>'))
+
+
+BUSCAR_SQL = f'''
+    SELECT t.id, t.proyecto_id, t.parent_id, t.completada, p.nombre AS proyecto,
+           highlight(tareas_fts, 0, '{_INICIO}', '{_FIN}') AS titulo,
+           snippet(tareas_fts, 1, '{_INICIO}', '{_FIN}', '…', 16) AS fragmento
+    FROM tareas_fts
+    JOIN tareas t ON t.id = tareas_fts.rowid
+    JOIN proyectos p ON p.id = t.proyecto_id
+    WHERE tareas_fts MATCH :consulta
+      AND p.usuario_id = :usuario_id
+      AND (:proyecto_id IS NULL OR t.proyecto_id = :proyecto_id)
+    ORDER BY rank
+    LIMIT :limite OFFSET :desplazamiento
+'''
+
+
+def buscar_tareas(conn, usuario_id, texto, proyecto_id=None, pagina=1, por_pagina=RESULTADOS_POR_PAGINA):
+    # Devuelve (resultados, hay_mas); cada resultado trae título y fragmento
+    # de la descripción con las coincidencias marcadas
+    consulta = consulta_fts(texto)
+    pagina = min(max(pagina, 1), PAGINA_MAXIMA)
+    if consulta is None:
+        return [], False
+
+    filas = conn.execute(BUSCAR_SQL, {
+        'consulta': consulta,
+        'usuario_id': usuario_id,
+        'proyecto_id': proyecto_id,
+        'limite': por_pagina + 1,
+        'desplazamiento': (pagina - 1) * por_pagina,
+    }).fetchall()
+
+    resultados = [
+        dict(fila, titulo=resaltar(fila['titulo']), fragmento=resaltar(fila['fragmento']))
+        for fila in filas[:por_pagina]
+    ]
+    return resultados, len(filas) > por_pagina and pagina < PAGINA_MAXIMA
+
+
+BUSCAR_TITULOS_SQL = '''
+    SELECT t.id, t.titulo
+    FROM tareas_fts JOIN tareas t ON t.id = tareas_fts.rowid
+    WHERE tareas_fts MATCH ? AND t.proyecto_id = ?
+    ORDER BY rank
+    LIMIT ?
+'''
+
+
+def buscar_titulos(conn, proyecto_id, texto, limite=20):
+    # Selector de tarea padre: coincidencias por prefijo solo en el título
+    consulta = consulta_fts(texto)
+    if consulta is None:
+        return conn.execute(
+            'SELECT id, titulo FROM tareas WHERE proyecto_id = ? AND eliminada = 0 ORDER BY parent_id, id LIMIT ?',
+            (proyecto_id, limite)
+        ).fetchall()
+    return conn.execute(BUSCAR_TITULOS_SQL, ('titulo : (' + consulta + ')', proyecto_id, limite)).fetchall()
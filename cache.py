@@ -0,0 +1,124 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Caché de fragmentos HTML del dashboard.
+#
+# Las claves incluyen los contadores de versión guardados en la base de datos
+# (proyectos.version e inquilinos.version_proyectos). Las rutas que modifican
+# datos incrementan el contador dentro de su transacción, de modo que la
+# invalidación es exacta por proyecto y funciona igual con varios procesos:
+# las entradas viejas dejan de ser alcanzables y el LRU las descarta. También
+# incluyen el shard del usuario: los ids solo son únicos dentro de cada shard.
+
+
+class CacheMemoria:
+    """LRU en memoria acotado por número de entradas y por tamaño total."""
+
+    def __init__(self, max_entradas=1024, max_bytes=64 * 1024 * 1024):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._datos = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def get(self, clave):
+        with self._lock:
+            valor = self._datos.get(clave)
+            if valor is None:
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def set(self, clave, valor):
+        with self._lock:
+            anterior = self._datos.pop(clave, None)
+            if anterior is not None:
+                self._bytes -= len(anterior)
+            self._datos[clave] = valor
+            self._bytes += len(valor)
+            while self._datos and (len(self._datos) > self.max_entradas or self._bytes > self.max_bytes):
+                _, descartado = self._datos.popitem(last=False)
+                self._bytes -= len(descartado)
+
+    def delete(self, clave):
+        with self._lock:
+            valor = self._datos.pop(clave, None)
+            if valor is not None:
+                self._bytes -= len(valor)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+            self._bytes = 0
+
+
+class CacheRedis:
+    """Mismo interfaz sobre un servidor compatible con Redis (CACHE_URL)."""
+
+    def __init__(self, cliente, ttl=3600):
+        self.cliente = cliente
+        self.ttl = ttl
+
+    def get(self, clave):
+        valor = self.cliente.get(clave)
+        return valor.decode('utf-8') if valor is not None else None
+
+    def set(self, clave, valor):
+        self.cliente.set(clave, valor.encode('utf-8'), ex=self.ttl)
+
+    def delete(self, clave):
+        self.cliente.delete(clave)
+
+    def clear(self):
+        self.cliente.flushdb()
+
+
+def crear_cache():
+    url = os.environ.get('CACHE_URL')
+    if url:
+        import redis  # solo necesario si se configura CACHE_URL
+        return CacheRedis(redis.Redis.from_url(url))
+    return CacheMemoria(max_entradas=int(os.environ.get('CACHE_MAX_ENTRADAS', 1024)))
+
+
+cache = crear_cache()
+
+
+# ==================== CONTADORES DE VERSIÓN ====================
+
+# Una sola consulta: versión de la lista de proyectos del usuario, suma de
+# las versiones de sus proyectos (cambia con el progreso de cualquiera de
+# ellos), primer proyecto (proyecto por defecto) y versión y número de tareas
+# del proyecto pedido.
+# Se hace en el shard del usuario; sin fila en inquilinos no devuelve nada.
+VERSIONES_SQL = '''
+    SELECT u.version_proyectos,
+           (SELECT SUM(version) FROM proyectos WHERE usuario_id = u.id) AS version_progreso,
+           (SELECT MIN(id) FROM proyectos WHERE usuario_id = u.id) AS primer_proyecto,
+           p.version AS version_proyecto,
+           p.total_tareas AS tareas_proyecto
+    FROM inquilinos u
+    LEFT JOIN proyectos p
+           ON p.id = COALESCE(:proyecto_id, (SELECT MIN(id) FROM proyectos WHERE usuario_id = u.id))
+          AND p.usuario_id = u.id
+    WHERE u.id = :usuario_id
+'''
+
+
+def versiones_dashboard(conn, usuario_id, proyecto_id):
+    return conn.execute(VERSIONES_SQL, {'usuario_id': usuario_id, 'proyecto_id': proyecto_id}).fetchone()
+
+
+def tocar_proyectos(conn, proyectos_ids):
+    conn.executemany('UPDATE proyectos SET version = version + 1 WHERE id = ?',
+                     [(proyecto_id,) for proyecto_id in set(proyectos_ids)])
+
+
+def tocar_lista_proyectos(conn, usuario_id):
+    conn.execute('UPDATE inquilinos SET version_proyectos = version_proyectos + 1 WHERE id = ?',
+                 (usuario_id,))
@@ -0,0 +1,114 @@
+import os
+import zlib
+from flask import request
+
+# Compresión de las respuestas (gzip, o brotli si está instalado: pip install brotli).
+#
+# Las respuestas en flujo (el dashboard, las exportaciones) se comprimen
+# trozo a trozo y cada trozo se vacía al enviarlo, así que siguen llegando
+# mientras se generan. Los flujos de eventos (text/event-stream) no se
+# comprimen. Al comprimir, el ETag pasa a débil: el contenido es el mismo
+# pero los bytes no.
+
+COMPRESION = os.environ.get('COMPRESION', '1') == '1'
+# Por debajo de este tamaño no compensa (solo respuestas completas)
+MINIMO = int(os.environ.get('COMPRESION_MINIMO', 1024))
+NIVEL_GZIP = int(os.environ.get('COMPRESION_NIVEL_GZIP', 6))
+# Calidad media: las máximas son demasiado lentas para comprimir al vuelo
+CALIDAD_BROTLI = int(os.environ.get('COMPRESION_CALIDAD_BROTLI', 5))
+
+TIPOS = {'text/html', 'text/plain', 'text/csv', 'text/css', 'application/json',
+         'application/x-ndjson', 'application/javascript'}
+
+
+class Gzip:
+    nombre = 'gzip'
+
+    def __init__(self):
+        # wbits 31: formato gzip
+        self._compresor = zlib.compressobj(NIVEL_GZIP, zlib.DEFLATED, 31)
+
+    def comprimir(self, datos):
+        return self._compresor.compress(datos)
+
+    def vaciar(self):
+        return self._compresor.flush(zlib.Z_SYNC_FLUSH)
+
+    def terminar(self):
+        return self._compresor.flush()
+
+
+class Brotli:
+    nombre = 'br'
+
+    def __init__(self, brotli):
+        self._compresor = brotli.Compressor(quality=CALIDAD_BROTLI)
+
+    def comprimir(self, datos):
+        return self._compresor.process(datos)
+
+    def vaciar(self):
+        return self._compresor.flush()
+
+    def terminar(self):
+        return self._compresor.finish()
+
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def elegir_compresor(aceptadas):
+    # aceptadas: request.accept_encodings
+    if brotli is not None and aceptadas['br']:
+        return Brotli(brotli)
+    if aceptadas['gzip']:
+        return Gzip()
+    return None
+
+
+def _comprimir_flujo(trozos, original, compresor):
+    # original: el iterable de la respuesta; se cierra aunque el cliente corte
+    try:
+        for trozo in trozos:
+            if trozo:
+                salida = compresor.comprimir(trozo) + compresor.vaciar()
+                if salida:
+                    yield salida
+        yield compresor.terminar()
+    finally:
+        if hasattr(original, 'close'):
+            original.close()
+
+
+def comprimir_respuesta(respuesta):
+    if (request.method == 'HEAD' or respuesta.status_code in (204, 206, 304)
+            or respuesta.direct_passthrough or 'Content-Encoding' in respuesta.headers
+            or respuesta.mimetype not in TIPOS):
+        return respuesta
+    respuesta.vary.add('Accept-Encoding')
+    compresor = elegir_compresor(request.accept_encodings)
+    if compresor is None:
+        return respuesta
+
+    if respuesta.is_streamed:
+        respuesta.response = _comprimir_flujo(respuesta.iter_encoded(), respuesta.response, compresor)
+        respuesta.headers.pop('Content-Length', None)
+    else:
+        datos = respuesta.get_data()
+        if len(datos) < MINIMO:
+            return respuesta
+        respuesta.set_data(compresor.comprimir(datos) + compresor.terminar())
+
+    respuesta.headers['Content-Encoding'] = compresor.nombre
+    etag, debil = respuesta.get_etag()
+    if etag and not debil:
+        respuesta.set_etag(etag, weak=True)
+    return respuesta
+
+
+def configurar_compresion(app):
+    if COMPRESION:
+        app.after_request(comprimir_respuesta)
@@ -0,0 +1,260 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from flask import g, has_request_context, session
+from metricas import ConexionMedida
+
+# Ruta de la base de datos (configurable por variable de entorno)
+DB_PATH = os.environ.get('TAREAS_DB', 'tareas.db')
+
+# Ajustes aplicados a cada conexión nueva del pool
+PRAGMAS = (
+    # Solo tiene efecto al crear la base de datos (antes de pasar a WAL) o en
+    # un VACUUM: permite devolver páginas libres por partes (mantenimiento.py)
+    'PRAGMA auto_vacuum = INCREMENTAL',
+    'PRAGMA journal_mode = WAL',       # lectores no se bloquean detrás del escritor
+    'PRAGMA journal_size_limit = 67108864',  # el WAL se recorta a 64 MB tras cada checkpoint
+    'PRAGMA synchronous = NORMAL',     # seguro con WAL y mucho menos fsync
+    'PRAGMA busy_timeout = 5000',      # esperar 5 s al lock en vez de fallar
+    'PRAGMA cache_size = -16000',      # ~16 MB de caché de páginas por conexión
+    'PRAGMA mmap_size = 134217728',    # 128 MB de lectura vía mmap
+    'PRAGMA temp_store = MEMORY',
+)
+
+
+# Medir cada sentencia para /metrics y el log de consultas lentas (metricas.py)
+INSTRUMENTAR = os.environ.get('DB_INSTRUMENTAR', '1') == '1'
+
+
+class Conexion(sqlite3.Connection):
+    """Conexión sin instrumentar; como ConexionMedida, admite el atributo ruta."""
+
+
+def abrir_conexion(ruta=None):
+    fabrica = ConexionMedida if INSTRUMENTAR else Conexion
+    conn = sqlite3.connect(ruta or DB_PATH, check_same_thread=False, factory=fabrica)
+    conn.ruta = ruta or DB_PATH
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class PoolConexiones:
+    """Pool acotado de conexiones SQLite reutilizables entre peticiones."""
+
+    def __init__(self, ruta=None, tamano_max=8, timeout=10.0, solo_lectura=False):
+        self.ruta = ruta or DB_PATH
+        self.tamano_max = tamano_max
+        self.timeout = timeout
+        # Réplicas (replicas.py): sin migraciones y con query_only
+        self.solo_lectura = solo_lectura
+        # Libres (la última devuelta sale primero) y abiertas en total; con
+        # _disponible se avisa a quien espera cuando se libera o se descarta
+        # una conexión
+        self._libres = []
+        self._abiertas = 0
+        self._disponible = threading.Condition()
+        self._esquema_al_dia = False
+        self._lock_esquema = threading.Lock()
+
+    def obtener(self):
+        # Una libre si la hay; si no, abrir otra mientras no se supere el
+        # máximo; si no, esperar a que se libere o se descarte alguna
+        limite = time.monotonic() + self.timeout
+        with self._disponible:
+            while not self._libres and self._abiertas >= self.tamano_max:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    raise RuntimeError('No hay conexiones disponibles en el pool')
+                self._disponible.wait(restante)
+            if self._libres:
+                return self._libres.pop()
+            self._abiertas += 1
+
+        try:
+            conn = abrir_conexion(self.ruta)
+            self._preparar_esquema(conn)
+            return conn
+        except Exception:
+            self._hueco_libre()
+            raise
+
+    def _preparar_esquema(self, conn):
+        # Migraciones pendientes en la primera conexión del proceso; después
+        # no se vuelve a comprobar
+        if self.solo_lectura:
+            conn.execute('PRAGMA query_only = 1')
+            return
+        if self._esquema_al_dia:
+            return
+        with self._lock_esquema:
+            if not self._esquema_al_dia:
+                from esquema import actualizar_esquema
+                actualizar_esquema(conn)
+                self._esquema_al_dia = True
+
+    def liberar(self, conn):
+        # Descartar cualquier transacción que la petición haya dejado abierta
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._descartar(conn)
+            return
+        with self._disponible:
+            self._libres.append(conn)
+            self._disponible.notify()
+
+    def _hueco_libre(self):
+        with self._disponible:
+            self._abiertas -= 1
+            self._disponible.notify()
+
+    def _descartar(self, conn):
+        try:
+            conn.close()
+        finally:
+            self._hueco_libre()
+
+    def cerrar(self):
+        with self._disponible:
+            libres, self._libres = self._libres, []
+        for conn in libres:
+            self._descartar(conn)
+
+
+pool = PoolConexiones(tamano_max=int(os.environ.get('DB_POOL_SIZE', 8)))
+
+
+# ==================== SHARDS ====================
+# La base de datos central (DB_PATH) guarda el directorio de usuarios, con el
+# shard de cada uno en usuarios.shard, y las sesiones. Los proyectos y tareas
+# de cada usuario viven en un único shard: un fichero SQLite con su propio
+# pool de conexiones y su propio escritor (escritor.py), así que las
+# escrituras de usuarios en shards distintos no se esperan entre sí.
+#
+# El shard 0 es la propia base de datos central: con SHARDS=0 (por defecto)
+# todo sigue en un solo fichero. Con SHARDS=N se añaden N ficheros
+# (tareas.shard1.db ... tareas.shardN.db) y los usuarios nuevos se reparten
+# entre ellos por hash del nombre. Para mover usuarios ya existentes ver
+# shards.py.
+
+SHARDS = int(os.environ.get('SHARDS', 0))
+
+
+def ruta_shard(numero, central=None):
+    central = central or DB_PATH
+    if numero == 0:
+        return central
+    base, extension = os.path.splitext(central)
+    return f'{base}.shard{numero}{extension or ".db"}'
+
+
+def es_ruta_shard(ruta):
+    # Ficheros tareas.shardN.db; el shard 0 (la central) no cuenta
+    return re.search(r'\.shard\d+(\.[^.]*)?$', ruta or '') is not None
+
+
+def shard_para(username):
+    # Shard de un usuario nuevo (estable: no depende del orden de registro)
+    if SHARDS == 0:
+        return 0
+    return 1 + zlib.crc32(username.encode('utf-8')) % SHARDS
+
+
+pools = [pool] + [PoolConexiones(ruta_shard(numero), tamano_max=pool.tamano_max)
+                  for numero in range(1, SHARDS + 1)]
+
+
+def comprobar_shard(numero):
+    if not 0 <= numero <= SHARDS:
+        raise RuntimeError(f'El shard {numero} no está configurado (SHARDS={SHARDS})')
+    return numero
+
+
+def pool_shard(numero):
+    return pools[comprobar_shard(numero)]
+
+
+def shard_actual():
+    # Shard del usuario en sesión; se guarda en la sesión al iniciarla y
+    # solo se consulta el directorio con sesiones anteriores a los shards
+    shard = session.get('shard')
+    if shard is None:
+        if SHARDS == 0 or 'user_id' not in session:
+            return 0
+        fila = get_db_central().execute('SELECT shard FROM usuarios WHERE id = ?',
+                                        (session['user_id'],)).fetchone()
+        shard = session['shard'] = fila['shard'] if fila else 0
+    return comprobar_shard(shard)
+
+
+def conexion_de(pool_elegido):
+    # Como mucho una conexión por pool y petición; se devuelven en el teardown
+    conexiones = g.setdefault('conexiones', {})
+    if pool_elegido not in conexiones:
+        conexiones[pool_elegido] = pool_elegido.obtener()
+    return conexiones[pool_elegido]
+
+
+def get_db_connection():
+    # Proyectos y tareas: shard del usuario en sesión
+    return conexion_de(pool_shard(shard_actual()))
+
+
+def get_db_central():
+    # Directorio de usuarios
+    return conexion_de(pool)
+
+
+def liberar_db_connection(exception=None):
+    for pool_elegido, conn in g.pop('conexiones', {}).items():
+        pool_elegido.liberar(conn)
+
+
+# Un solo escritor por proceso y base de datos: las escrituras esperan en
+# cola en este lock en vez de reintentar contra SQLite (busy_timeout), y las
+# lecturas siguen en paralelo en el resto de conexiones. Entre procesos decide
+# el lock de SQLite. Cada shard tiene el suyo.
+_locks_escritura = {}
+ESPERA_ESCRITURA = 5.0
+
+
+def lock_escritura(conn):
+    ruta = getattr(conn, 'ruta', DB_PATH)
+    lock = _locks_escritura.get(ruta)
+    if lock is None:
+        lock = _locks_escritura.setdefault(ruta, threading.Lock())
+    return lock
+
+
+def anotar_escritura():
+    # La petición escribe: al terminar se guarda la hora en la sesión para que
+    # sus siguientes lecturas no vayan a una réplica anterior (replicas.py)
+    if has_request_context():
+        g.escritura = True
+
+
+@contextmanager
+def transaccion(conn):
+    # Transacción explícita: sqlite3 no abre una por sí solo ante sentencias
+    # que empiezan por WITH, y IMMEDIATE toma el lock de escritura desde el inicio
+    lock = lock_escritura(conn)
+    if not lock.acquire(timeout=ESPERA_ESCRITURA):
+        raise sqlite3.OperationalError('database is locked')
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        anotar_escritura()
+    finally:
+        lock.release()
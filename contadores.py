@@ -0,0 +1,85 @@
+import argparse
+import sqlite3
+import sys
+from conexiones import DB_PATH, transaccion
+
+# Contadores de progreso materializados:
+#   proyectos.total_tareas / proyectos.tareas_completadas
+#   tareas.total_hijas / tareas.hijas_completadas (solo hijas directas)
+#
+# Los mantienen los triggers de la migración 5 en cada INSERT, DELETE o
+# cambio de completada/parent_id/proyecto_id, así que cubren la interfaz, la
+# API por lotes y los borrados y marcados de subárboles sin tocar esas rutas.
+# Solo cuentan tareas vivas: marcar una como eliminada (migración 9) cuenta
+# como borrarla.
+# Este módulo comprueba que cuadran con los datos y corrige los que no:
+#
+#   python contadores.py [tareas.db]            solo comprobar (sale con 1 si hay descuadres)
+#   python contadores.py [tareas.db] --reparar  recalcular los que no cuadran
+
+DESCUADRES_PROYECTOS_SQL = '''
+    SELECT p.id, p.total_tareas, p.tareas_completadas,
+           COUNT(t.id) AS total, COALESCE(SUM(t.completada IS TRUE), 0) AS completadas
+    FROM proyectos p LEFT JOIN tareas t ON t.proyecto_id = p.id AND t.eliminada = 0
+    GROUP BY p.id
+    HAVING total != p.total_tareas OR completadas != p.tareas_completadas
+'''
+
+DESCUADRES_TAREAS_SQL = '''
+    SELECT t.id, t.proyecto_id, t.total_hijas, t.hijas_completadas,
+           COUNT(h.id) AS total, COALESCE(SUM(h.completada IS TRUE), 0) AS completadas
+    FROM tareas t LEFT JOIN tareas h ON h.parent_id = t.id AND h.eliminada = 0
+    GROUP BY t.id
+    HAVING total != t.total_hijas OR completadas != t.hijas_completadas
+'''
+
+
+def descuadres(conn):
+    return (conn.execute(DESCUADRES_PROYECTOS_SQL).fetchall(),
+            conn.execute(DESCUADRES_TAREAS_SQL).fetchall())
+
+
+def corregir_contadores(conn):
+    # Recalcula solo las filas descuadradas y sube la versión de sus
+    # proyectos para invalidar la caché. No abre transacción propia.
+    proyectos, tareas = descuadres(conn)
+    conn.executemany(
+        'UPDATE proyectos SET total_tareas = ?, tareas_completadas = ?, version = version + 1 WHERE id = ?',
+        [(fila[3], fila[4], fila[0]) for fila in proyectos]
+    )
+    conn.executemany(
+        'UPDATE tareas SET total_hijas = ?, hijas_completadas = ? WHERE id = ?',
+        [(fila[4], fila[5], fila[0]) for fila in tareas]
+    )
+    conn.executemany('UPDATE proyectos SET version = version + 1 WHERE id = ?',
+                     [(proyecto_id,) for proyecto_id in {fila[1] for fila in tareas}])
+    return len(proyectos), len(tareas)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Comprueba los contadores de progreso')
+    parser.add_argument('db', nargs='?', default=DB_PATH)
+    parser.add_argument('--reparar', action='store_true', help='recalcular los contadores descuadrados')
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    if args.reparar:
+        with transaccion(conn):
+            proyectos, tareas = corregir_contadores(conn)
+        print(f"✅ Corregidos {proyectos} proyectos y {tareas} tareas")
+        return 0
+
+    proyectos, tareas = descuadres(conn)
+    for fila in proyectos:
+        print(f"❌ proyecto {fila[0]}: {fila[2]}/{fila[1]} guardado, {fila[4]}/{fila[3]} real")
+    for fila in tareas:
+        print(f"❌ tarea {fila[0]}: {fila[3]}/{fila[2]} guardado, {fila[5]}/{fila[4]} real")
+    if proyectos or tareas:
+        print("   Ejecuta con --reparar para corregirlos")
+        return 1
+    print("✅ Los contadores de progreso cuadran")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from conexiones import abrir_conexion, anotar_escritura, pools, shard_actual, transaccion
+from metricas import metricas
+
+# Escritor único con commit agrupado (group commit).
+#
+# Las rutas no escriben con su propia conexión: encolan una función
+# operacion(conn, *args) y esperan su resultado. Un hilo escritor toma de la
+# cola todas las operaciones que lleguen en unos milisegundos (o hasta
+# ESCRITURA_LOTE_MAX), las ejecuta en una sola transacción y hace un único
+# commit. Cada operación va en su propio SAVEPOINT: si falla, solo ella se
+# deshace y su excepción se relanza en la petición que la encoló.
+#
+# Hay un escritor por base de datos: escritor para la central (usuarios y
+# sesiones) y escritor_del_usuario() para el shard del usuario en sesión.
+
+ESCRITURA_AGRUPADA = os.environ.get('ESCRITURA_AGRUPADA', '1') == '1'
+LOTE_MAX = int(os.environ.get('ESCRITURA_LOTE_MAX', 64))
+ESPERA_LOTE = float(os.environ.get('ESCRITURA_ESPERA_MS', 2)) / 1000
+TIMEOUT_ESCRITURA = float(os.environ.get('ESCRITURA_TIMEOUT', 10))
+
+
+class EscrituraSaturada(Exception):
+    """La operación esperó TIMEOUT_ESCRITURA en la cola y se retiró sin ejecutarse."""
+
+
+class EscritorAgrupado:
+    def __init__(self, ruta, lote_max, espera):
+        self.ruta = ruta
+        self.lote_max = lote_max
+        self.espera = espera
+        self._cola = queue.Queue()
+        self._hilo = None
+        self._lock = threading.Lock()
+
+    def _arrancar(self):
+        # El hilo y su conexión se crean con la primera escritura. La conexión
+        # se abre aquí y no en el hilo: si falla (disco, permisos, una
+        # migración) el error llega a quien escribe en vez de matar el hilo
+        # en silencio, y la siguiente escritura lo vuelve a intentar
+        from esquema import actualizar_esquema
+
+        with self._lock:
+            if self._hilo is None:
+                conn = abrir_conexion(self.ruta)
+                try:
+                    actualizar_esquema(conn)
+                except Exception:
+                    conn.close()
+                    raise
+                self._hilo = threading.Thread(target=self._bucle, args=(conn,), name='escritor', daemon=True)
+                self._hilo.start()
+
+    def ejecutar(self, operacion, *args):
+        anotar_escritura()
+        if self._hilo is None:
+            self._arrancar()
+        futuro = Future()
+        self._cola.put((operacion, args, futuro, time.perf_counter()))
+        try:
+            return futuro.result(timeout=TIMEOUT_ESCRITURA)
+        except TimeoutError:
+            # Si aún no entró en un lote se retira y no se ejecutará: se puede
+            # reintentar sin duplicar nada. Si ya está en un lote, el lote
+            # termina (commit o rollback) y se espera a su resultado
+            if futuro.cancel():
+                raise EscrituraSaturada() from None
+            return futuro.result()
+
+    def pendientes(self):
+        return self._cola.qsize()
+
+    def _siguiente_lote(self):
+        lote = [self._cola.get()]
+        limite = time.perf_counter() + self.espera
+        while len(lote) < self.lote_max:
+            restante = limite - time.perf_counter()
+            try:
+                lote.append(self._cola.get(timeout=restante) if restante > 0 else self._cola.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _bucle(self, conn):
+        while True:
+            lote = self._siguiente_lote()
+            inicio = time.perf_counter()
+            resultados = []
+            try:
+                with transaccion(conn):
+                    for operacion, args, futuro, _ in lote:
+                        if not futuro.set_running_or_notify_cancel():
+                            continue
+                        conn.execute('SAVEPOINT operacion')
+                        try:
+                            resultados.append((futuro, operacion(conn, *args), None))
+                        except Exception as error:
+                            conn.execute('ROLLBACK TO operacion')
+                            resultados.append((futuro, None, error))
+                        conn.execute('RELEASE operacion')
+            except Exception as error:
+                # Falló el commit: ninguna operación del lote quedó guardada
+                for _, _, futuro, _ in lote:
+                    if not futuro.done():
+                        futuro.set_exception(error)
+                continue
+
+            # Solo se responde cuando el commit del lote ya está hecho
+            for futuro, resultado, error in resultados:
+                if error is not None:
+                    futuro.set_exception(error)
+                else:
+                    futuro.set_result(resultado)
+            metricas.observar_lote(len(lote), time.perf_counter() - inicio,
+                                   [inicio - encolada for _, _, _, encolada in lote])
+
+
+class EscritorDirecto:
+    """Sin agrupar (ESCRITURA_AGRUPADA=0): una transacción por operación."""
+
+    def __init__(self, pool_conexiones):
+        self.pool = pool_conexiones
+
+    def ejecutar(self, operacion, *args):
+        anotar_escritura()
+        conn = self.pool.obtener()
+        try:
+            with transaccion(conn):
+                return operacion(conn, *args)
+        finally:
+            self.pool.liberar(conn)
+
+    def pendientes(self):
+        return 0
+
+
+def crear_escritor(pool_conexiones):
+    if ESCRITURA_AGRUPADA:
+        return EscritorAgrupado(pool_conexiones.ruta, LOTE_MAX, ESPERA_LOTE)
+    return EscritorDirecto(pool_conexiones)
+
+
+# Uno por shard; el del shard 0 es el de la base de datos central
+escritores = [crear_escritor(pool_shard) for pool_shard in pools]
+escritor = escritores[0]
+
+
+def escritor_del_usuario():
+    return escritores[shard_actual()]
+
+
+metricas.registrar_indicador('tareas_escritura_cola', 'Operaciones de escritura esperando al escritor',
+                             lambda: sum(e.pendientes() for e in escritores))
@@ -0,0 +1,489 @@
+import sqlite3
+import sys
+from werkzeug.security import generate_password_hash
+from conexiones import DB_PATH, es_ruta_shard
+from cache import VERSIONES_SQL
+from arbol import ELIMINAR_SUBARBOL_SQL, PAGINA_RAICES_SQL, PAGINA_HIJAS_SQL
+from busqueda import BUSCAR_SQL, BUSCAR_TITULOS_SQL
+from contadores import corregir_contadores
+from vencimientos import PENDIENTES_SQL, PRIORIDAD_SQL, SEMANA_SQL, VENCIDAS_SQL
+
+# ==================== MIGRACIONES ====================
+# Cada migración deja PRAGMA user_version en su número. Se aplican en la
+# primera conexión de cada proceso (ver conexiones.py) y solo si la base de
+# datos está atrasada; el caso normal cuesta una lectura de user_version.
+
+
+def columnas(conn, tabla):
+    return {fila[1] for fila in conn.execute(f'PRAGMA table_info({tabla})')}
+
+
+def migracion_1_esquema_base(conn):
+    # Tablas de la aplicación (antes database.py, migrar_db.py y
+    # migrar_usuarios.py). Las bases de datos antiguas se actualizan en el
+    # sitio sin perder datos.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS proyectos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre VARCHAR(100) NOT NULL,
+            descripcion TEXT,
+            usuario_id INTEGER NOT NULL,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS tareas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            titulo TEXT NOT NULL,
+            descripcion TEXT,
+            parent_id INTEGER,
+            proyecto_id INTEGER,
+            completada BOOLEAN DEFAULT FALSE,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (parent_id) REFERENCES tareas (id),
+            FOREIGN KEY (proyecto_id) REFERENCES proyectos (id)
+        )
+    ''')
+
+    # Base de datos sin proyectos (antes migrar_db.py): las tareas pasan al proyecto 1
+    if 'proyecto_id' not in columnas(conn, 'tareas'):
+        conn.execute('ALTER TABLE tareas ADD COLUMN proyecto_id INTEGER DEFAULT 1')
+        conn.execute('UPDATE tareas SET proyecto_id = 1')
+
+    # Proyectos sin dueño (antes migrar_usuarios.py): pasan al usuario demo
+    if 'usuario_id' not in columnas(conn, 'proyectos'):
+        conn.execute('ALTER TABLE proyectos ADD COLUMN usuario_id INTEGER NOT NULL DEFAULT 1')
+
+    # Índices de las consultas calientes
+    # index(): WHERE proyecto_id = ? ORDER BY parent_id, id sin ordenar en memoria
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_tareas_proyecto_parent ON tareas (proyecto_id, parent_id, id)')
+    # Búsqueda de subtareas por padre
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_tareas_parent ON tareas (parent_id)')
+    # Proyectos de un usuario ordenados por id
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_proyectos_usuario ON proyectos (usuario_id, id)')
+
+
+def migracion_2_contadores(conn):
+    # Contadores de versión para invalidar la caché del dashboard (ver cache.py)
+    conn.execute('ALTER TABLE proyectos ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+    conn.execute('ALTER TABLE usuarios ADD COLUMN version_proyectos INTEGER NOT NULL DEFAULT 0')
+
+
+def migracion_3_datos_demo(conn):
+    # Usuario y proyecto demo; el hash solo se calcula si falta el usuario.
+    # Los ficheros de shard no los llevan: el demo vive en la central
+    if es_ruta_shard(getattr(conn, 'ruta', None)):
+        return
+    if not conn.execute('SELECT 1 FROM usuarios WHERE id = 1').fetchone():
+        conn.execute(
+            "INSERT INTO usuarios (id, username, email, password_hash) VALUES (1, ?, ?, ?)",
+            ('demo', 'demo@ejemplo.com', generate_password_hash('demo123'))
+        )
+    conn.execute(
+        "INSERT OR IGNORE INTO proyectos (id, nombre, descripcion, usuario_id) VALUES (1, ?, ?, ?)",
+        ('Proyecto de Demo', 'Proyecto de ejemplo para usuario demo', 1)
+    )
+
+
+def migracion_4_busqueda(conn):
+    # Índice FTS5 sobre título y descripción (ver busqueda.py). Es una tabla de
+    # contenido externo: el texto vive en tareas y los triggers mantienen el índice
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS tareas_fts USING fts5(
+            titulo, descripcion,
+            content='tareas', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS tareas_fts_insertar AFTER INSERT ON tareas BEGIN
+            INSERT INTO tareas_fts (rowid, titulo, descripcion) VALUES (new.id, new.titulo, new.descripcion);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS tareas_fts_eliminar AFTER DELETE ON tareas BEGIN
+            INSERT INTO tareas_fts (tareas_fts, rowid, titulo, descripcion)
+            VALUES ('delete', old.id, old.titulo, old.descripcion);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS tareas_fts_actualizar AFTER UPDATE OF titulo, descripcion ON tareas BEGIN
+            INSERT INTO tareas_fts (tareas_fts, rowid, titulo, descripcion)
+            VALUES ('delete', old.id, old.titulo, old.descripcion);
+            INSERT INTO tareas_fts (rowid, titulo, descripcion) VALUES (new.id, new.titulo, new.descripcion);
+        END
+    ''')
+    # Indexar las tareas que ya existían
+    conn.execute("INSERT INTO tareas_fts (tareas_fts) VALUES ('rebuild')")
+
+
+def migracion_5_progreso(conn):
+    # Contadores de progreso por proyecto y por tarea padre (ver contadores.py)
+    conn.execute('ALTER TABLE proyectos ADD COLUMN total_tareas INTEGER NOT NULL DEFAULT 0')
+    conn.execute('ALTER TABLE proyectos ADD COLUMN tareas_completadas INTEGER NOT NULL DEFAULT 0')
+    conn.execute('ALTER TABLE tareas ADD COLUMN total_hijas INTEGER NOT NULL DEFAULT 0')
+    conn.execute('ALTER TABLE tareas ADD COLUMN hijas_completadas INTEGER NOT NULL DEFAULT 0')
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS progreso_insertar AFTER INSERT ON tareas BEGIN
+            UPDATE proyectos SET total_tareas = total_tareas + 1,
+                                 tareas_completadas = tareas_completadas + (new.completada IS TRUE)
+            WHERE id = new.proyecto_id;
+            UPDATE tareas SET total_hijas = total_hijas + 1,
+                              hijas_completadas = hijas_completadas + (new.completada IS TRUE)
+            WHERE id = new.parent_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS progreso_eliminar AFTER DELETE ON tareas BEGIN
+            UPDATE proyectos SET total_tareas = total_tareas - 1,
+                                 tareas_completadas = tareas_completadas - (old.completada IS TRUE)
+            WHERE id = old.proyecto_id;
+            UPDATE tareas SET total_hijas = total_hijas - 1,
+                              hijas_completadas = hijas_completadas - (old.completada IS TRUE)
+            WHERE id = old.parent_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS progreso_actualizar
+        AFTER UPDATE OF completada, parent_id, proyecto_id ON tareas BEGIN
+            UPDATE proyectos SET total_tareas = total_tareas - 1,
+                                 tareas_completadas = tareas_completadas - (old.completada IS TRUE)
+            WHERE id = old.proyecto_id;
+            UPDATE proyectos SET total_tareas = total_tareas + 1,
+                                 tareas_completadas = tareas_completadas + (new.completada IS TRUE)
+            WHERE id = new.proyecto_id;
+            UPDATE tareas SET total_hijas = total_hijas - 1,
+                              hijas_completadas = hijas_completadas - (old.completada IS TRUE)
+            WHERE id = old.parent_id;
+            UPDATE tareas SET total_hijas = total_hijas + 1,
+                              hijas_completadas = hijas_completadas + (new.completada IS TRUE)
+            WHERE id = new.parent_id;
+        END
+    ''')
+    # Los valores iniciales para los datos que ya existían los calcula la
+    # migración 9: corregir_contadores cuenta solo tareas vivas (eliminada = 0)
+
+
+def migracion_6_sesiones(conn):
+    # Sesiones en el servidor (ver sesiones.py)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sesiones (
+            id TEXT PRIMARY KEY,
+            usuario_id INTEGER,
+            datos TEXT NOT NULL,
+            expira INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sesiones_expira ON sesiones(expira)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sesiones_usuario ON sesiones(usuario_id)')
+
+
+def migracion_7_busqueda_diferida(conn):
+    # Mientras busqueda_diferida tenga una fila, los INSERT en tareas no
+    # indexan fila a fila: quien la inserta (importación masiva, ver
+    # intercambio.py) indexa su rango de ids con un solo INSERT ... SELECT y
+    # la borra antes de confirmar, así que fuera de su transacción nunca
+    # tiene filas. FTS5 vuelca su índice en cada sentencia, y por fila es
+    # más de diez veces más lento.
+    conn.execute('CREATE TABLE IF NOT EXISTS busqueda_diferida (activa INTEGER)')
+    conn.execute('DROP TRIGGER IF EXISTS tareas_fts_insertar')
+    conn.execute('''
+        CREATE TRIGGER tareas_fts_insertar AFTER INSERT ON tareas
+        WHEN NOT EXISTS (SELECT 1 FROM busqueda_diferida) BEGIN
+            INSERT INTO tareas_fts (rowid, titulo, descripcion) VALUES (new.id, new.titulo, new.descripcion);
+        END
+    ''')
+
+
+def migracion_8_shards(conn):
+    # Directorio de shards (ver conexiones.py y shards.py). usuarios.shard y
+    # usuarios.trasladando solo se usan en la base de datos central; cada
+    # shard tiene en inquilinos una fila por usuario alojado, con el contador
+    # de versión de su lista de proyectos (usuarios.version_proyectos queda
+    # sin uso)
+    conn.execute('ALTER TABLE usuarios ADD COLUMN shard INTEGER NOT NULL DEFAULT 0')
+    conn.execute('ALTER TABLE usuarios ADD COLUMN trasladando INTEGER NOT NULL DEFAULT 0')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS inquilinos (
+            id INTEGER PRIMARY KEY,
+            version_proyectos INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO inquilinos (id, version_proyectos) SELECT id, version_proyectos FROM usuarios')
+
+
+def migracion_9_papelera(conn):
+    # Eliminar una tarea solo la marca: tareas.eliminada guarda la hora (unix)
+    # y las consultas filtran eliminada = 0. Los índices parciales no incluyen
+    # las eliminadas, y los triggers las sacan de los contadores y de la
+    # búsqueda al marcarlas, así que al borrarlas de verdad (mantenimiento.py)
+    # ya no tocan nada.
+    conn.execute('ALTER TABLE tareas ADD COLUMN eliminada INTEGER NOT NULL DEFAULT 0')
+
+    conn.execute('DROP INDEX IF EXISTS idx_tareas_proyecto_parent')
+    conn.execute('DROP INDEX IF EXISTS idx_tareas_parent')
+    conn.execute('CREATE INDEX idx_tareas_proyecto_parent ON tareas (proyecto_id, parent_id, id) WHERE eliminada = 0')
+    conn.execute('CREATE INDEX idx_tareas_parent ON tareas (parent_id) WHERE eliminada = 0')
+    conn.execute('CREATE INDEX idx_tareas_eliminadas ON tareas (eliminada) WHERE eliminada != 0')
+
+    for trigger in ('tareas_fts_insertar', 'tareas_fts_eliminar', 'tareas_fts_actualizar',
+                    'progreso_insertar', 'progreso_eliminar', 'progreso_actualizar'):
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    conn.execute('''
+        CREATE TRIGGER tareas_fts_insertar AFTER INSERT ON tareas
+        WHEN new.eliminada = 0 AND NOT EXISTS (SELECT 1 FROM busqueda_diferida) BEGIN
+            INSERT INTO tareas_fts (rowid, titulo, descripcion) VALUES (new.id, new.titulo, new.descripcion);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER tareas_fts_eliminar AFTER DELETE ON tareas WHEN old.eliminada = 0 BEGIN
+            INSERT INTO tareas_fts (tareas_fts, rowid, titulo, descripcion)
+            VALUES ('delete', old.id, old.titulo, old.descripcion);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER tareas_fts_actualizar AFTER UPDATE OF titulo, descripcion ON tareas
+        WHEN old.eliminada = 0 BEGIN
+            INSERT INTO tareas_fts (tareas_fts, rowid, titulo, descripcion)
+            VALUES ('delete', old.id, old.titulo, old.descripcion);
+            INSERT INTO tareas_fts (rowid, titulo, descripcion) VALUES (new.id, new.titulo, new.descripcion);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER progreso_insertar AFTER INSERT ON tareas WHEN new.eliminada = 0 BEGIN
+            UPDATE proyectos SET total_tareas = total_tareas + 1,
+                                 tareas_completadas = tareas_completadas + (new.completada IS TRUE)
+            WHERE id = new.proyecto_id;
+            UPDATE tareas SET total_hijas = total_hijas + 1,
+                              hijas_completadas = hijas_completadas + (new.completada IS TRUE)
+            WHERE id = new.parent_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER progreso_eliminar AFTER DELETE ON tareas WHEN old.eliminada = 0 BEGIN
+            UPDATE proyectos SET total_tareas = total_tareas - 1,
+                                 tareas_completadas = tareas_completadas - (old.completada IS TRUE)
+            WHERE id = old.proyecto_id;
+            UPDATE tareas SET total_hijas = total_hijas - 1,
+                              hijas_completadas = hijas_completadas - (old.completada IS TRUE)
+            WHERE id = old.parent_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER progreso_actualizar
+        AFTER UPDATE OF completada, parent_id, proyecto_id ON tareas WHEN old.eliminada = 0 BEGIN
+            UPDATE proyectos SET total_tareas = total_tareas - 1,
+                                 tareas_completadas = tareas_completadas - (old.completada IS TRUE)
+            WHERE id = old.proyecto_id;
+            UPDATE proyectos SET total_tareas = total_tareas + 1,
+                                 tareas_completadas = tareas_completadas + (new.completada IS TRUE)
+            WHERE id = new.proyecto_id;
+            UPDATE tareas SET total_hijas = total_hijas - 1,
+                              hijas_completadas = hijas_completadas - (old.completada IS TRUE)
+            WHERE id = old.parent_id;
+            UPDATE tareas SET total_hijas = total_hijas + 1,
+                              hijas_completadas = hijas_completadas + (new.completada IS TRUE)
+            WHERE id = new.parent_id;
+        END
+    ''')
+    # Marcar y desmarcar cuentan como borrar e insertar
+    conn.execute('''
+        CREATE TRIGGER tareas_papelera AFTER UPDATE OF eliminada ON tareas
+        WHEN old.eliminada = 0 AND new.eliminada != 0 BEGIN
+            UPDATE proyectos SET total_tareas = total_tareas - 1,
+                                 tareas_completadas = tareas_completadas - (old.completada IS TRUE)
+            WHERE id = old.proyecto_id;
+            UPDATE tareas SET total_hijas = total_hijas - 1,
+                              hijas_completadas = hijas_completadas - (old.completada IS TRUE)
+            WHERE id = old.parent_id;
+            INSERT INTO tareas_fts (tareas_fts, rowid, titulo, descripcion)
+            VALUES ('delete', old.id, old.titulo, old.descripcion);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER tareas_restaurar AFTER UPDATE OF eliminada ON tareas
+        WHEN old.eliminada != 0 AND new.eliminada = 0 BEGIN
+            UPDATE proyectos SET total_tareas = total_tareas + 1,
+                                 tareas_completadas = tareas_completadas + (new.completada IS TRUE)
+            WHERE id = new.proyecto_id;
+            UPDATE tareas SET total_hijas = total_hijas + 1,
+                              hijas_completadas = hijas_completadas + (new.completada IS TRUE)
+            WHERE id = new.parent_id;
+            INSERT INTO tareas_fts (rowid, titulo, descripcion) VALUES (new.id, new.titulo, new.descripcion);
+        END
+    ''')
+
+    # Última pasada de mantenimiento; con varios procesos, el que la actualiza hace la siguiente
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS mantenimiento (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            ultima INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO mantenimiento (id) VALUES (1)')
+
+    # Tareas que quedaron sin padre con el borrado anterior (no se veían pero contaban)
+    conn.execute('''
+        UPDATE tareas SET eliminada = CAST(strftime('%s', 'now') AS INTEGER)
+        WHERE parent_id IS NOT NULL AND parent_id NOT IN (SELECT id FROM tareas)
+    ''')
+    corregir_contadores(conn)
+
+
+def migracion_10_vencimientos(conn):
+    # Fecha de vencimiento (UTC, como fecha_creacion) y prioridad de cada
+    # tarea (vencimientos.py). avisada = 1 cuando ya se envió el recordatorio
+    # del vencimiento actual; cambiar vence lo vuelve a poner a 0.
+    conn.execute('ALTER TABLE tareas ADD COLUMN vence TEXT')
+    conn.execute('ALTER TABLE tareas ADD COLUMN prioridad INTEGER NOT NULL DEFAULT 0')
+    conn.execute('ALTER TABLE tareas ADD COLUMN avisada INTEGER NOT NULL DEFAULT 0')
+
+    # Vistas del dashboard: vencidas / esta semana y por prioridad
+    conn.execute('CREATE INDEX idx_tareas_vence ON tareas (proyecto_id, completada, vence) WHERE eliminada = 0')
+    conn.execute('CREATE INDEX idx_tareas_prioridad ON tareas (proyecto_id, completada, prioridad) '
+                 'WHERE eliminada = 0')
+    # Cola de recordatorios: solo las tareas que aún tienen que avisar
+    conn.execute('''
+        CREATE INDEX idx_tareas_avisos ON tareas (vence)
+        WHERE vence IS NOT NULL AND avisada = 0 AND completada = 0 AND eliminada = 0
+    ''')
+
+
+def migracion_11_actividad(conn):
+    # Registro de actividad (actividad.py): una tabla por mes, actividad_AAAAMM,
+    # que se crea al escribir la primera entrada; aquí se listan con su rango
+    # de horas unix [desde, hasta)
+    conn.execute('''
+        CREATE TABLE actividad_particiones (
+            nombre TEXT PRIMARY KEY,
+            desde REAL NOT NULL,
+            hasta REAL NOT NULL
+        )
+    ''')
+
+
+MIGRACIONES = (
+    (1, migracion_1_esquema_base),
+    (2, migracion_2_contadores),
+    (3, migracion_3_datos_demo),
+    (4, migracion_4_busqueda),
+    (5, migracion_5_progreso),
+    (6, migracion_6_sesiones),
+    (7, migracion_7_busqueda_diferida),
+    (8, migracion_8_shards),
+    (9, migracion_9_papelera),
+    (10, migracion_10_vencimientos),
+    (11, migracion_11_actividad),
+)
+VERSION_ESQUEMA = MIGRACIONES[-1][0]
+
+
+# Consultas calientes de app.py con parámetros de ejemplo. Si se cambia una
+# consulta en app.py hay que actualizarla aquí también.
+CONSULTAS_CRITICAS = (
+    ('versiones_dashboard', VERSIONES_SQL, {'usuario_id': 1, 'proyecto_id': None}),
+    ('proyectos_usuario',
+     'SELECT * FROM proyectos WHERE usuario_id = ? ORDER BY id', (1,)),
+    ('proyecto_de_usuario',
+     'SELECT id FROM proyectos WHERE id = ? AND usuario_id = ?', (1, 1)),
+    ('pagina_raices', PAGINA_RAICES_SQL, (1, 0, 51)),
+    ('pagina_hijas', PAGINA_HIJAS_SQL, (1, 1, 0, 51)),
+    ('buscar_padre', BUSCAR_TITULOS_SQL, ('titulo : ("a"*)', 1, 20)),
+    ('buscar_tareas', BUSCAR_SQL,
+     {'consulta': '"a"*', 'usuario_id': 1, 'proyecto_id': None, 'limite': 21, 'desplazamiento': 0}),
+    ('permiso_tarea', '''
+        SELECT t.proyecto_id
+        FROM tareas t
+        JOIN proyectos p ON t.proyecto_id = p.id
+        WHERE t.id = ? AND p.usuario_id = ? AND t.eliminada = 0
+     ''', (1, 1)),
+    ('eliminar_subarbol',
+     ELIMINAR_SUBARBOL_SQL,
+     {'tarea_id': 1, 'proyecto_id': 1}),
+    ('cargar_sesion',
+     'SELECT datos, expira FROM sesiones WHERE id = ? AND expira > ?', ('x', 0)),
+    ('barrer_sesiones',
+     'DELETE FROM sesiones WHERE expira < ?', (0,)),
+    ('vista_vencidas', VENCIDAS_SQL, (1, '2000-01-01 00:00:00', 51)),
+    ('vista_semana', SEMANA_SQL, (1, '2000-01-01 00:00:00', '2000-01-08 00:00:00', 51)),
+    ('vista_prioridad', PRIORIDAD_SQL, (1, 51)),
+    ('recordatorios_pendientes', PENDIENTES_SQL, ('2000-01-01 00:00:00', 100)),
+    ('buscar_usuario',
+     'SELECT * FROM usuarios WHERE username = ? OR email = ?', ('demo', 'demo')),
+)
+
+
+def version_actual(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def actualizar_esquema(conn):
+    if version_actual(conn) >= VERSION_ESQUEMA:
+        return False
+
+    # Todo en una transacción: si otro proceso se adelantó, la versión ya
+    # estará al día al obtener el lock
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        version = version_actual(conn)
+        for numero, migracion in MIGRACIONES:
+            if numero > version:
+                migracion(conn)
+                conn.execute(f'PRAGMA user_version = {numero}')
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    return True
+
+
+def plan_consulta(conn, sql, params=()):
+    return [fila[3] for fila in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+
+# Tablas de CTE recursivas: recorrerlas es el propio paso de la recursión
+TABLAS_CTE = ('subarbol',)
+
+
+def es_regresion(detalle):
+    # SCAN = recorrido completo de tabla; TEMP B-TREE = ordenación en memoria
+    if detalle.startswith('SCAN'):
+        # En FTS5 ':M' indica que la restricción MATCH la resuelve el índice
+        if 'VIRTUAL TABLE INDEX' in detalle:
+            return ':M' not in detalle
+        tabla = detalle.split()[1]
+        return tabla not in TABLAS_CTE + ('CONSTANT',) and not tabla.startswith('(subquery')
+    return 'USE TEMP B-TREE' in detalle
+
+
+def verificar_planes(conn):
+    problemas = []
+    for nombre, sql, params in CONSULTAS_CRITICAS:
+        for detalle in plan_consulta(conn, sql, params):
+            if es_regresion(detalle):
+                problemas.append((nombre, detalle))
+    return problemas
+
+
+if __name__ == "__main__":
+    conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else DB_PATH)
+    actualizar_esquema(conn)
+    problemas = verificar_planes(conn)
+    conn.close()
+
+    if problemas:
+        for nombre, detalle in problemas:
+            print(f"❌ {nombre}: {detalle}")
+        sys.exit(1)
+    print(f"✅ {len(CONSULTAS_CRITICAS)} consultas usan índices")
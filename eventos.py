@@ -0,0 +1,243 @@
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from flask import Response, get_template_attribute
+from arbol import nodo_tarea
+from conexiones import pool_shard, shard_actual
+from metricas import metricas
+
+# Actualizaciones del dashboard sin recargar la página (Server-Sent Events).
+#
+# Las acciones sobre tareas hechas con fetch desde el dashboard responden
+# con los eventos del cambio: la tarjeta de la tarea ya renderizada y los
+# contadores de progreso del padre y del proyecto. Los mismos eventos se
+# publican en el canal del proyecto y GET /proyectos/<id>/eventos los envía
+# a las demás pestañas abiertas, que solo sustituyen esos trozos de HTML.
+#
+# Los canales viven en la memoria del proceso. Para los cambios que no llegan
+# por ellos (otro proceso con WEB_WORKERS > 1, la API, una importación) cada
+# flujo compara cada SSE_LATIDO segundos la versión del proyecto con la de
+# los eventos recibidos y, si falta alguno, pide a la pestaña que recargue.
+# También si el cliente no lee y se llena su cola. Cada flujo se cierra tras
+# SSE_DURACION segundos y el navegador reconecta solo (con Last-Event-ID), lo
+# que reparte las conexiones entre procesos y no retiene un apagado.
+
+MAX_EVENTOS = int(os.environ.get('SSE_MAX_EVENTOS', 100))
+MAX_SUSCRIPCIONES = int(os.environ.get('SSE_MAX_SUSCRIPCIONES', 1000))
+LATIDO = float(os.environ.get('SSE_LATIDO', 15))
+DURACION = float(os.environ.get('SSE_DURACION', 300))
+# Espera del navegador antes de reconectar si se corta el flujo
+REINTENTO_MS = 3000
+
+CIERRE = object()
+RECARGAR = 'event: recargar\ndata: {}\n\n'
+
+
+# ==================== CANALES ====================
+
+class Suscripcion:
+    def __init__(self, clave, max_eventos):
+        self.clave = clave
+        self.cola = queue.Queue(maxsize=max_eventos)
+        self.desbordada = False
+
+    def entregar(self, evento):
+        # Nunca bloquea al que publica; si el cliente no lee, se le pedirá recargar
+        try:
+            self.cola.put_nowait(evento)
+        except queue.Full:
+            self.desbordada = True
+
+    def siguiente(self, timeout):
+        try:
+            return self.cola.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Canales:
+    """Publicación y suscripción en memoria por clave (shard, proyecto_id)."""
+
+    def __init__(self, max_eventos, max_suscripciones):
+        self.max_eventos = max_eventos
+        self.max_suscripciones = max_suscripciones
+        self._suscripciones = {}
+        self._total = 0
+        self._lock = threading.Lock()
+        self._secuencia = itertools.count(1)
+
+    def suscribir(self, clave):
+        with self._lock:
+            if self._total >= self.max_suscripciones:
+                return None
+            suscripcion = Suscripcion(clave, self.max_eventos)
+            self._suscripciones.setdefault(clave, set()).add(suscripcion)
+            self._total += 1
+            return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            grupo = self._suscripciones.get(suscripcion.clave)
+            if grupo is None or suscripcion not in grupo:
+                return
+            grupo.discard(suscripcion)
+            self._total -= 1
+            if not grupo:
+                del self._suscripciones[suscripcion.clave]
+
+    def escuchando(self, clave):
+        return clave in self._suscripciones
+
+    def saturados(self):
+        return self._total >= self.max_suscripciones
+
+    def suscritos(self):
+        return self._total
+
+    def publicar(self, clave, evento):
+        with self._lock:
+            destinatarios = list(self._suscripciones.get(clave, ()))
+        for suscripcion in destinatarios:
+            suscripcion.entregar(evento)
+
+    def nuevo_id(self):
+        return next(self._secuencia)
+
+    def cerrar(self):
+        # Al parar el servidor: terminan todos los flujos abiertos
+        with self._lock:
+            todas = [suscripcion for grupo in self._suscripciones.values() for suscripcion in grupo]
+        for suscripcion in todas:
+            suscripcion.entregar(CIERRE)
+
+
+canales = Canales(MAX_EVENTOS, MAX_SUSCRIPCIONES)
+metricas.registrar_indicador('tareas_sse_suscripciones', 'Flujos de eventos del dashboard abiertos',
+                             canales.suscritos)
+
+
+# ==================== EVENTOS DEL DASHBOARD ====================
+
+def publicar_tarea(conn, accion, proyecto_id, tarea_id, version, padre_id=None, responder=False):
+    # accion: 'agregada', 'actualizada' o 'eliminada'; version es la del
+    # proyecto tras el cambio. padre_id solo hace falta en 'eliminada', cuando
+    # la tarea ya no se puede consultar. Si nadie escucha y no hay que
+    # responder con el evento no se renderiza nada.
+    clave = (shard_actual(), proyecto_id)
+    if not responder and not canales.escuchando(clave):
+        return None
+
+    tarjeta = get_template_attribute('_tarea.html', 'tarjeta')
+    evento = {'id': canales.nuevo_id(), 'accion': accion, 'tarea_id': tarea_id,
+              'proyecto_id': proyecto_id, 'version': version}
+    if accion != 'eliminada':
+        nodo = nodo_tarea(conn, proyecto_id, tarea_id)
+        if nodo is None:
+            evento['accion'] = 'eliminada'
+        else:
+            evento['html'] = str(tarjeta(nodo))
+            padre_id = nodo['tarea']['parent_id']
+
+    evento['padre_id'] = padre_id
+    if padre_id:
+        padre = conn.execute('SELECT id, total_hijas, hijas_completadas FROM tareas WHERE id = ?',
+                             (padre_id,)).fetchone()
+        if padre is not None:
+            evento['insignia_padre'] = str(get_template_attribute('_tarea.html', 'progreso_hijas')(padre))
+        # Primera subtarea de un padre sin lista de hijas: se pinta el padre entero
+        if evento['accion'] == 'agregada':
+            nodo_padre = nodo_tarea(conn, proyecto_id, padre_id)
+            if nodo_padre is not None:
+                evento['html_padre'] = str(tarjeta(nodo_padre))
+
+    proyecto = conn.execute('SELECT id, total_tareas, tareas_completadas FROM proyectos WHERE id = ?',
+                            (proyecto_id,)).fetchone()
+    evento['insignia_proyecto'] = str(get_template_attribute('_proyectos.html', 'progreso_proyecto')(proyecto))
+
+    canales.publicar(clave, evento)
+    return evento
+
+
+def publicar_recarga(proyectos_ids):
+    # Cambios en bloque (API): las pestañas abiertas recargan la página
+    shard = shard_actual()
+    for proyecto_id in set(proyectos_ids):
+        canales.publicar((shard, proyecto_id), {'accion': 'recargar'})
+
+
+# ==================== FLUJO SSE ====================
+
+def _mensaje(evento):
+    # id: versión del proyecto; el navegador la reenvía como Last-Event-ID al reconectar
+    return f"id: {evento['version']}\nevent: tarea\ndata: {json.dumps(evento)}\n\n"
+
+
+def _version_en_bd(shard, proyecto_id):
+    pool_conexiones = pool_shard(shard)
+    conn = pool_conexiones.obtener()
+    try:
+        fila = conn.execute('SELECT version FROM proyectos WHERE id = ?', (proyecto_id,)).fetchone()
+    finally:
+        pool_conexiones.liberar(conn)
+    return fila[0] if fila else None
+
+
+def _eventos(shard, proyecto_id, version):
+    # Sin conexión a la base de datos mientras espera: solo la pide en cada latido
+    suscripcion = canales.suscribir((shard, proyecto_id))
+    if suscripcion is None:
+        return
+    # vista: versión hasta la que han llegado todos los cambios; cada
+    # operación sube la versión en uno, pero dos del mismo lote pueden
+    # publicarse en otro orden (sueltas)
+    vista, sueltas, pendiente = version, set(), None
+    fin = time.monotonic() + DURACION
+    try:
+        yield f'retry: {REINTENTO_MS}\n\n'
+        while time.monotonic() < fin:
+            if suscripcion.desbordada:
+                yield RECARGAR
+                return
+            evento = suscripcion.siguiente(LATIDO)
+            if evento is CIERRE:
+                return
+            if evento is not None:
+                if evento['accion'] == 'recargar':
+                    yield RECARGAR
+                    return
+                if vista is None or evento['version'] == vista + 1:
+                    vista = evento['version']
+                    while vista + 1 in sueltas:
+                        vista += 1
+                        sueltas.discard(vista)
+                elif evento['version'] > vista:
+                    sueltas.add(evento['version'])
+                yield _mensaje(evento)
+                continue
+
+            # Latido: un cambio que sigue sin llegar tras dos latidos no
+            # vendrá por el canal
+            actual = _version_en_bd(shard, proyecto_id)
+            if vista is None:
+                vista = actual
+            elif actual is not None and actual > vista:
+                if pendiente is not None and vista < pendiente:
+                    yield RECARGAR
+                    return
+                pendiente = actual
+            else:
+                pendiente = None
+            yield ': latido\n\n'
+    finally:
+        canales.cancelar(suscripcion)
+
+
+def flujo_eventos(shard, proyecto_id, version):
+    respuesta = Response(_eventos(shard, proyecto_id, version), mimetype='text/event-stream')
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    # Sin búfer en proxies como nginx
+    respuesta.headers['X-Accel-Buffering'] = 'no'
+    return respuesta
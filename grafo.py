@@ -0,0 +1,290 @@
+import bisect
+import os
+import sys
+import threading
+from collections import OrderedDict
+from arbol import HIJAS_PRECARGADAS, TAREAS_POR_PAGINA, construir_arbol
+from metricas import metricas
+
+# Caché en memoria del árbol de tareas de los proyectos grandes.
+#
+# Un proyecto con al menos GRAFO_MIN_TAREAS tareas se carga entero con una
+# consulta la primera vez que se pinta: cada tarea es un NodoTarea con
+# __slots__ (sin dict por fila, a diferencia de sqlite3.Row) y el árbol se
+# guarda como listas ordenadas de ids por padre. Las páginas del dashboard
+# se sirven de ahí sin tocar SQLite.
+#
+# El grafo lleva la versión del proyecto con la que se cargó (cache.py).
+# Las rutas del dashboard que modifican tareas le aplican su cambio (alta,
+# completar, eliminar) si el grafo estaba justo en la versión anterior; si
+# no, lo descartan y se vuelve a cargar en la siguiente visita. Los cambios
+# que no pasan por ellas (API, importación, otro proceso) suben la versión y
+# el grafo deja de usarse igual que los fragmentos HTML.
+#
+# Los nodos publicados no se modifican: un cambio los sustituye por copias,
+# así que una página extraída antes se sigue pintando con el estado de su
+# versión. El total se limita a GRAFO_MAX_MB con LRU por proyecto.
+
+MAX_BYTES = int(float(os.environ.get('GRAFO_MAX_MB', 64)) * 1024 * 1024)   # 0 = sin caché
+MIN_TAREAS = int(os.environ.get('GRAFO_MIN_TAREAS', 500))
+
+COLUMNAS = ('id', 'titulo', 'descripcion', 'completada', 'parent_id', 'fecha_creacion',
+            'total_hijas', 'hijas_completadas', 'vence', 'prioridad')
+
+CARGAR_SQL = f'''
+    SELECT {', '.join(COLUMNAS)} FROM tareas
+    WHERE proyecto_id = ? AND eliminada = 0
+    ORDER BY id
+'''
+
+
+class NodoTarea:
+    __slots__ = COLUMNAS
+
+    def __init__(self, id, titulo, descripcion, completada, parent_id, fecha_creacion,
+                 total_hijas, hijas_completadas, vence, prioridad):
+        self.id = id
+        self.titulo = titulo
+        self.descripcion = descripcion
+        self.completada = completada
+        self.parent_id = parent_id
+        self.fecha_creacion = fecha_creacion
+        self.total_hijas = total_hijas
+        self.hijas_completadas = hijas_completadas
+        self.vence = vence
+        self.prioridad = prioridad
+
+    # Se usa igual que las filas de arbol.py en construir_arbol y las plantillas
+    def __getitem__(self, clave):
+        return getattr(self, clave)
+
+    @property
+    def tiene_hijas(self):
+        return self.total_hijas > 0
+
+    def copia(self, **cambios):
+        nodo = NodoTarea(*(getattr(self, columna) for columna in COLUMNAS))
+        for columna, valor in cambios.items():
+            setattr(nodo, columna, valor)
+        return nodo
+
+    def tamano(self):
+        return (sys.getsizeof(self) + sys.getsizeof(self.titulo) + sys.getsizeof(self.descripcion)
+                + sys.getsizeof(self.fecha_creacion) + sys.getsizeof(self.vence))
+
+
+def _pagina(ids, despues_de, limite):
+    inicio = bisect.bisect_right(ids, despues_de)
+    return ids[inicio:inicio + limite], len(ids) > inicio + limite
+
+
+class GrafoProyecto:
+    def __init__(self, version, nodos):
+        self.version = version
+        self.nodos = {}
+        self.raices = []
+        self.hijas = {}
+        self.bytes = 0
+        for nodo in nodos:
+            self._enlazar(nodo)
+        self.bytes += sys.getsizeof(self.nodos) + sum(sys.getsizeof(ids) for ids in self.hijas.values())
+
+    def _enlazar(self, nodo):
+        # Las hijas de una tarea eliminada no son alcanzables (como en SQL)
+        self.nodos[nodo.id] = nodo
+        bisect.insort(self.raices if nodo.parent_id is None else self.hijas.setdefault(nodo.parent_id, []),
+                      nodo.id)
+        self.bytes += nodo.tamano()
+
+    def _nodos(self, ids):
+        return [self.nodos[tarea_id] for tarea_id in ids]
+
+    # Mismas respuestas que pagina_raices, pagina_hijas y primeras_hijas de arbol.py
+
+    def pagina_raices(self, despues_de, limite):
+        ids, hay_mas = _pagina(self.raices, despues_de, limite)
+        return self._nodos(ids), hay_mas
+
+    def pagina_hijas(self, padre_id, despues_de, limite):
+        ids, hay_mas = _pagina(self.hijas.get(padre_id, []), despues_de, limite)
+        return self._nodos(ids), hay_mas
+
+    def primeras_hijas(self, padres_ids, limite):
+        filas, padres_con_mas = [], set()
+        for padre_id in padres_ids:
+            ids = self.hijas.get(padre_id, [])
+            filas.extend(self._nodos(ids[:limite]))
+            if len(ids) > limite:
+                padres_con_mas.add(padre_id)
+        return filas, padres_con_mas
+
+    def pagina_dashboard(self, despues_de):
+        # Árbol de la página de tareas principales del dashboard con sus primeras subtareas
+        raices, hay_mas = self.pagina_raices(despues_de, TAREAS_POR_PAGINA)
+        hijas, padres_con_mas = self.primeras_hijas([raiz.id for raiz in raices], HIJAS_PRECARGADAS)
+        return construir_arbol(raices + hijas, padres_con_mas), hay_mas
+
+    # Cambios: replican lo que hacen en SQLite las operaciones de app.py y los
+    # triggers de los contadores
+
+    def _sustituir(self, nodo):
+        self.nodos[nodo.id] = nodo
+
+    def _ajustar_padre(self, padre_id, total, completadas):
+        padre = self.nodos.get(padre_id)
+        if padre is not None:
+            self._sustituir(padre.copia(total_hijas=padre.total_hijas + total,
+                                        hijas_completadas=padre.hijas_completadas + completadas))
+
+    def _subarbol(self, tarea_id):
+        pendientes, ids = [tarea_id], []
+        while pendientes:
+            actual = pendientes.pop()
+            ids.append(actual)
+            pendientes.extend(self.hijas.get(actual, ()))
+        return ids
+
+    def agregar(self, fila):
+        nodo = NodoTarea(*(fila[columna] for columna in COLUMNAS))
+        self._enlazar(nodo)
+        self._ajustar_padre(nodo.parent_id, 1, nodo.completada)
+
+    def marcar(self, tarea_id, completada):
+        raiz = self.nodos.get(tarea_id)
+        if raiz is None:
+            return
+        for actual in self._subarbol(tarea_id):
+            nodo = self.nodos[actual]
+            self._sustituir(nodo.copia(completada=completada,
+                                       hijas_completadas=nodo.total_hijas if completada else 0))
+        self._ajustar_padre(raiz.parent_id, 0, completada - raiz.completada)
+
+    def eliminar(self, tarea_id):
+        raiz = self.nodos.get(tarea_id)
+        if raiz is None:
+            return
+        for actual in self._subarbol(tarea_id):
+            self.bytes -= self.nodos.pop(actual).tamano()
+            self.hijas.pop(actual, None)
+        hermanas = self.raices if raiz.parent_id is None else self.hijas.get(raiz.parent_id, [])
+        posicion = bisect.bisect_left(hermanas, tarea_id)
+        if posicion < len(hermanas) and hermanas[posicion] == tarea_id:
+            del hermanas[posicion]
+        self._ajustar_padre(raiz.parent_id, -1, -raiz.completada)
+
+
+def cargar_grafo(conn, proyecto_id):
+    # Versión y tareas en la misma transacción de lectura: el grafo
+    # corresponde exactamente a esa versión
+    conn.execute('BEGIN')
+    try:
+        fila = conn.execute('SELECT version FROM proyectos WHERE id = ?', (proyecto_id,)).fetchone()
+        if fila is None:
+            return None
+        cursor = conn.cursor()
+        # Tuplas en vez de sqlite3.Row: cada fila se convierte en un nodo
+        cursor.row_factory = None
+        return GrafoProyecto(fila[0], (NodoTarea(*tupla) for tupla in cursor.execute(CARGAR_SQL, (proyecto_id,))))
+    finally:
+        conn.rollback()
+
+
+class CacheGrafos:
+    """LRU de grafos por (shard, proyecto_id), acotado por memoria estimada."""
+
+    def __init__(self, max_bytes, min_tareas):
+        self.max_bytes = max_bytes
+        self.min_tareas = min_tareas
+        self._grafos = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def consultar(self, conn, shard, proyecto_id, version, total_tareas, consulta):
+        # consulta(grafo) con el grafo del proyecto en esa versión, o None si
+        # no conviene usarlo (proyecto pequeño, caché desactivada o lectura
+        # de una réplica anterior al grafo guardado). Se ejecuta bajo el lock:
+        # ningún cambio se aplica a medias de una página. Con total_tareas
+        # None solo se usa un grafo ya cargado.
+        if self.max_bytes <= 0 or version is None:
+            return None
+        clave = (shard, proyecto_id)
+        with self._lock:
+            grafo = self._grafos.get(clave)
+            if grafo is not None and grafo.version >= version:
+                self._grafos.move_to_end(clave)
+                if grafo.version != version:
+                    return None
+                self.aciertos += 1
+                return consulta(grafo)
+        if total_tareas is None or total_tareas < self.min_tareas:
+            return None
+
+        self.fallos += 1
+        grafo = cargar_grafo(conn, proyecto_id)
+        if grafo is None:
+            return None
+        with self._lock:
+            actual = self._grafos.get(clave)
+            if actual is None or actual.version < grafo.version:
+                self._guardar(clave, grafo)
+            return consulta(grafo) if grafo.version == version else None
+
+    def _guardar(self, clave, grafo):
+        anterior = self._grafos.pop(clave, None)
+        if anterior is not None:
+            self._bytes -= anterior.bytes
+        if grafo.bytes > self.max_bytes:
+            return
+        self._grafos[clave] = grafo
+        self._bytes += grafo.bytes
+        while self._bytes > self.max_bytes:
+            _, descartado = self._grafos.popitem(last=False)
+            self._bytes -= descartado.bytes
+
+    def aplicar(self, shard, proyecto_id, version, cambio, *args):
+        # version: la del proyecto tras el cambio; cambio: 'agregar',
+        # 'marcar' o 'eliminar'
+        clave = (shard, proyecto_id)
+        with self._lock:
+            grafo = self._grafos.get(clave)
+            if grafo is None or version is None:
+                return
+            if grafo.version != version - 1:
+                # Se perdió algún cambio intermedio
+                self._bytes -= self._grafos.pop(clave).bytes
+                return
+            antes = grafo.bytes
+            getattr(grafo, cambio)(*args)
+            grafo.version = version
+            self._bytes += grafo.bytes - antes
+
+    def limpiar(self):
+        with self._lock:
+            self._grafos.clear()
+            self._bytes = 0
+
+    # Para /metrics
+    def bytes(self):
+        return self._bytes
+
+    def proyectos(self):
+        return len(self._grafos)
+
+    def nodos(self):
+        with self._lock:
+            return sum(len(grafo.nodos) for grafo in self._grafos.values())
+
+
+grafos = CacheGrafos(MAX_BYTES, MIN_TAREAS)
+
+metricas.registrar_indicador('tareas_grafo_bytes', 'Memoria estimada de los árboles de tareas en caché',
+                             grafos.bytes)
+metricas.registrar_indicador('tareas_grafo_proyectos', 'Proyectos con el árbol de tareas en caché',
+                             grafos.proyectos)
+metricas.registrar_indicador('tareas_grafo_nodos', 'Tareas en los árboles en caché', grafos.nodos)
+metricas.registrar_indicador('tareas_grafo_aciertos', 'Páginas servidas desde el árbol en caché',
+                             lambda: grafos.aciertos)
+metricas.registrar_indicador('tareas_grafo_fallos', 'Cargas del árbol de un proyecto desde SQLite',
+                             lambda: grafos.fallos)
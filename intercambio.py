@@ -0,0 +1,317 @@
+import argparse
+import csv
+import io
+import json
+import sys
+from conexiones import DB_PATH, abrir_conexion, ruta_shard, transaccion
+from cache import tocar_proyectos, tocar_lista_proyectos
+from esquema import actualizar_esquema
+from vencimientos import leer_prioridad, leer_vence
+
+# Exportación e importación de proyectos y árboles de tareas de un usuario.
+#
+#   python intercambio.py exportar demo [--formato csv] [--salida datos.csv]
+#   python intercambio.py importar demo datos.jsonl [--formato jsonl]
+#
+# Un registro por línea (JSON Lines) o por fila (CSV), primero los proyectos
+# y después sus tareas:
+#   {"tipo": "proyecto", "id": 1, "titulo": "Casa", "descripcion": "", ...}
+#   {"tipo": "tarea", "id": 7, "proyecto_id": 1, "parent_id": 3, "titulo": ...}
+# En los proyectos "titulo" es el nombre. Se lee y escribe por bloques
+# (fetchmany / lotes de LOTE registros), así que la memoria no depende del
+# tamaño de la exportación salvo por la tabla de ids de la importación.
+# Al importar, proyectos y tareas reciben ids nuevos y parent_id se traduce.
+
+COLUMNAS = ('tipo', 'id', 'proyecto_id', 'parent_id', 'titulo', 'descripcion', 'completada', 'fecha_creacion',
+            'vence', 'prioridad')
+LOTE = 1000
+FORMATOS = {'jsonl': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+# ==================== EXPORTACIÓN ====================
+
+def registros_usuario(conn, usuario_id, proyectos_ids=None):
+    # Generador de registros; una sola transacción de lectura para que
+    # proyectos y tareas salgan de la misma instantánea
+    conn.execute('BEGIN')
+    try:
+        proyectos = conn.execute(
+            'SELECT id, nombre, descripcion, fecha_creacion FROM proyectos WHERE usuario_id = ? ORDER BY id',
+            (usuario_id,)
+        ).fetchall()
+        if proyectos_ids is not None:
+            proyectos = [p for p in proyectos if p['id'] in proyectos_ids]
+
+        for p in proyectos:
+            yield {'tipo': 'proyecto', 'id': p['id'], 'titulo': p['nombre'],
+                   'descripcion': p['descripcion'], 'fecha_creacion': p['fecha_creacion']}
+
+        for p in proyectos:
+            # Sin ORDER BY: se recorre el índice (proyecto_id, parent_id, id)
+            # sin ordenar en memoria; la importación acepta cualquier orden
+            cursor = conn.execute('''
+                SELECT id, proyecto_id, parent_id, titulo, descripcion, completada, fecha_creacion, vence, prioridad
+                FROM tareas WHERE proyecto_id = ? AND eliminada = 0
+            ''', (p['id'],))
+            while True:
+                filas = cursor.fetchmany(LOTE)
+                if not filas:
+                    break
+                for fila in filas:
+                    yield {'tipo': 'tarea', **dict(fila), 'completada': bool(fila['completada'])}
+    finally:
+        conn.rollback()
+
+
+def a_jsonl(registros):
+    for registro in registros:
+        yield json.dumps(registro, ensure_ascii=False) + '\n'
+
+
+def a_csv(registros):
+    # Se vacía el búfer cada LOTE filas para emitir trozos de tamaño acotado
+    bufer = io.StringIO()
+    escritor_csv = csv.DictWriter(bufer, fieldnames=COLUMNAS, extrasaction='ignore')
+    escritor_csv.writeheader()
+    for numero, registro in enumerate(registros, 1):
+        escritor_csv.writerow(dict(registro, completada=int(registro.get('completada') or 0)))
+        if numero % LOTE == 0:
+            yield bufer.getvalue()
+            bufer.seek(0)
+            bufer.truncate()
+    yield bufer.getvalue()
+
+
+def exportar(conn, usuario_id, formato='jsonl', proyectos_ids=None):
+    registros = registros_usuario(conn, usuario_id, proyectos_ids)
+    return a_csv(registros) if formato == 'csv' else a_jsonl(registros)
+
+
+# ==================== IMPORTACIÓN ====================
+
+class ErrorImportacion(ValueError):
+    pass
+
+
+def leer_registros(texto, formato='jsonl'):
+    # texto: fichero o flujo de texto; se lee línea a línea
+    if formato == 'csv':
+        for numero, fila in enumerate(csv.DictReader(texto), 2):
+            yield numero, fila
+        return
+    for numero, linea in enumerate(texto, 1):
+        if linea.strip():
+            try:
+                yield numero, json.loads(linea)
+            except ValueError:
+                raise ErrorImportacion(f'Línea {numero}: JSON no válido')
+
+
+def _entero(valor, campo, numero):
+    if valor in (None, ''):
+        return None
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise ErrorImportacion(f'Línea {numero}: "{campo}" debe ser un entero')
+
+
+def _vencimiento(registro, numero):
+    try:
+        return leer_vence(registro.get('vence')), leer_prioridad(registro.get('prioridad'))
+    except (TypeError, ValueError):
+        raise ErrorImportacion(f'Línea {numero}: "vence" o "prioridad" no válidos')
+
+
+def _booleano(valor):
+    return int(valor not in (None, '', '0', 0, False, 'false', 'False'))
+
+
+def en_lotes(registros, tamano=LOTE):
+    lote = []
+    for registro in registros:
+        lote.append(registro)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+class Importador:
+    """Aplica lotes de registros traduciendo ids viejos a nuevos."""
+
+    def __init__(self, usuario_id):
+        self.usuario_id = usuario_id
+        self.proyectos = {}
+        # id viejo -> (id nuevo, proyecto nuevo)
+        self.tareas = {}
+        # Tareas cuyo padre aún no había llegado: (id nuevo, parent_id viejo, proyecto nuevo)
+        self.huerfanas = []
+        self.num_tareas = 0
+
+    def aplicar(self, conn, lote):
+        # Los ids nuevos solo se recuerdan si el lote entero se aplica (si
+        # falla, el escritor deshace el lote completo)
+        proyectos, tareas, huerfanas = {}, {}, []
+        insertadas = []
+        # Índice de búsqueda en bloque al final del lote (migración 7)
+        conn.execute('INSERT INTO busqueda_diferida VALUES (1)')
+        for numero, registro in lote:
+            tipo = registro.get('tipo')
+            if tipo == 'proyecto':
+                proyectos[self._viejo(registro, numero)] = self._proyecto(conn, numero, registro)
+            elif tipo == 'tarea':
+                insertadas.append(self._tarea(conn, numero, registro, proyectos, tareas, huerfanas))
+            else:
+                raise ErrorImportacion(f'Línea {numero}: tipo desconocido "{tipo}"')
+        conn.execute('DELETE FROM busqueda_diferida')
+        if insertadas:
+            conn.execute('''
+                INSERT INTO tareas_fts (rowid, titulo, descripcion)
+                SELECT id, titulo, descripcion FROM tareas WHERE id BETWEEN ? AND ?
+            ''', (insertadas[0], insertadas[-1]))
+        if proyectos:
+            tocar_lista_proyectos(conn, self.usuario_id)
+        tocar_proyectos(conn, {proyecto_id for _, proyecto_id in tareas.values()} | set(proyectos.values()))
+        self.proyectos.update(proyectos)
+        self.tareas.update(tareas)
+        self.huerfanas.extend(huerfanas)
+        self.num_tareas += len(insertadas)
+
+    def _viejo(self, registro, numero):
+        return _entero(registro.get('id'), 'id', numero)
+
+    def _proyecto(self, conn, numero, registro):
+        nombre = registro.get('titulo') or registro.get('nombre')
+        if not nombre:
+            raise ErrorImportacion(f'Línea {numero}: el proyecto necesita "titulo"')
+        return conn.execute('''
+            INSERT INTO proyectos (nombre, descripcion, usuario_id, fecha_creacion)
+            VALUES (?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        ''', (nombre, registro.get('descripcion') or '', self.usuario_id,
+              registro.get('fecha_creacion') or None)).lastrowid
+
+    def _tarea(self, conn, numero, registro, proyectos, tareas, huerfanas):
+        proyecto_viejo = _entero(registro.get('proyecto_id'), 'proyecto_id', numero)
+        proyecto_id = proyectos.get(proyecto_viejo) or self.proyectos.get(proyecto_viejo)
+        if proyecto_id is None:
+            raise ErrorImportacion(f'Línea {numero}: la tarea es de un proyecto que no aparece antes')
+        if not registro.get('titulo'):
+            raise ErrorImportacion(f'Línea {numero}: la tarea necesita "titulo"')
+
+        padre_viejo = _entero(registro.get('parent_id'), 'parent_id', numero)
+        padre = tareas.get(padre_viejo) or self.tareas.get(padre_viejo)
+        if padre is not None and padre[1] != proyecto_id:
+            raise ErrorImportacion(f'Línea {numero}: la tarea padre es de otro proyecto')
+
+        vence, prioridad = _vencimiento(registro, numero)
+        nuevo = conn.execute('''
+            INSERT INTO tareas (titulo, descripcion, parent_id, proyecto_id, completada, fecha_creacion,
+                                vence, prioridad)
+            VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?)
+        ''', (registro['titulo'], registro.get('descripcion') or '', padre and padre[0], proyecto_id,
+              _booleano(registro.get('completada')), registro.get('fecha_creacion') or None,
+              vence, prioridad)).lastrowid
+        viejo = self._viejo(registro, numero)
+        if viejo is not None:
+            tareas[viejo] = (nuevo, proyecto_id)
+        if padre_viejo is not None and padre is None:
+            huerfanas.append((nuevo, padre_viejo, proyecto_id))
+        return nuevo
+
+    def enlazar_huerfanas(self, conn):
+        # Padres que llegaron después que sus hijas; si nunca llegan (o son
+        # de otro proyecto) la tarea queda como principal
+        enlaces = []
+        for nuevo, padre_viejo, proyecto_id in self.huerfanas:
+            padre = self.tareas.get(padre_viejo)
+            if padre is not None and padre[1] == proyecto_id:
+                enlaces.append((padre[0], nuevo, proyecto_id))
+        conn.executemany('UPDATE tareas SET parent_id = ? WHERE id = ?', [enlace[:2] for enlace in enlaces])
+        tocar_proyectos(conn, {enlace[2] for enlace in enlaces})
+        self.huerfanas.clear()
+
+    def resumen(self):
+        return {'proyectos': len(self.proyectos), 'tareas': self.num_tareas}
+
+
+def importar(ejecutar, usuario_id, texto, formato='jsonl'):
+    return importar_registros(ejecutar, usuario_id, leer_registros(texto, formato))
+
+
+def importar_registros(ejecutar, usuario_id, registros):
+    # ejecutar(operacion, *args) corre operacion(conn, *args) en una
+    # transacción: escritor.ejecutar en la aplicación, directo en la consola.
+    # registros: pares (número de línea, registro). Si un lote falla, los
+    # anteriores ya confirmados se quedan y el error indica cuántos registros
+    # se importaron.
+    importador = Importador(usuario_id)
+    try:
+        for lote in en_lotes(registros):
+            ejecutar(importador.aplicar, lote)
+    except ErrorImportacion as error:
+        error.resumen = importador.resumen()
+        raise
+    finally:
+        ejecutar(importador.enlazar_huerfanas)
+    return importador
+
+
+# ==================== LÍNEA DE COMANDOS ====================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Exporta o importa proyectos y tareas de un usuario')
+    parser.add_argument('--db', default=DB_PATH)
+    ordenes = parser.add_subparsers(dest='orden', required=True)
+
+    p_exportar = ordenes.add_parser('exportar')
+    p_exportar.add_argument('usuario', help='username del dueño')
+    p_exportar.add_argument('--formato', choices=FORMATOS, default='jsonl')
+    p_exportar.add_argument('--salida', help='fichero de salida (por defecto la salida estándar)')
+
+    p_importar = ordenes.add_parser('importar')
+    p_importar.add_argument('usuario', help='username que recibirá los proyectos')
+    p_importar.add_argument('fichero')
+    p_importar.add_argument('--formato', choices=FORMATOS,
+                            help='por defecto según la extensión del fichero')
+
+    args = parser.parse_args(argv)
+    conn = abrir_conexion(args.db)
+    actualizar_esquema(conn)
+    usuario = conn.execute('SELECT id, shard FROM usuarios WHERE username = ?', (args.usuario,)).fetchone()
+    if usuario is None:
+        parser.error(f'no existe el usuario {args.usuario}')
+    # Sus proyectos y tareas están en su shard (ver conexiones.py)
+    if usuario['shard']:
+        conn.close()
+        conn = abrir_conexion(ruta_shard(usuario['shard'], args.db))
+        actualizar_esquema(conn)
+
+    if args.orden == 'exportar':
+        salida = open(args.salida, 'w', encoding='utf-8', newline='') if args.salida else sys.stdout
+        for trozo in exportar(conn, usuario['id'], args.formato):
+            salida.write(trozo)
+        if args.salida:
+            salida.close()
+            print(f"✅ Exportado en {args.salida}", file=sys.stderr)
+        return 0
+
+    def ejecutar(operacion, *args_operacion):
+        with transaccion(conn):
+            return operacion(conn, *args_operacion)
+
+    formato = args.formato or ('csv' if args.fichero.endswith('.csv') else 'jsonl')
+    with open(args.fichero, encoding='utf-8', newline='') as texto:
+        try:
+            importador = importar(ejecutar, usuario['id'], texto, formato)
+        except ErrorImportacion as error:
+            print(f"❌ {error}", file=sys.stderr)
+            return 1
+    resumen = importador.resumen()
+    print(f"✅ Importados {resumen['proyectos']} proyectos y {resumen['tareas']} tareas", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
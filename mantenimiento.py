@@ -0,0 +1,270 @@
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from cache import tocar_proyectos
+from conexiones import DB_PATH, SHARDS, abrir_conexion, pools, ruta_shard, transaccion
+from escritor import escritores
+from actividad import eliminar_particiones, limite_retencion
+from metricas import metricas
+
+# Mantenimiento de cada base de datos (central y shards) sin parar la aplicación.
+#
+# Eliminar una tarea solo la marca (tareas.eliminada, migración 9). Cada
+# MANTENIMIENTO_INTERVALO segundos un hilo de la aplicación:
+#   1. marca como eliminadas las tareas vivas cuyo padre está eliminado
+#   2. borra de verdad las eliminadas hace más de MANTENIMIENTO_RETENCION
+#      segundos (hasta entonces se pueden recuperar con UPDATE ... eliminada = 0)
+#   3. borra los meses del registro de actividad anteriores a
+#      ACTIVIDAD_RETENCION_MESES (actividad.py), si hay límite
+#   4. devuelve al sistema de ficheros las páginas libres (incremental_vacuum)
+#   5. PRAGMA optimize y un checkpoint del WAL que no espera a nadie
+# Las escrituras van por lotes de MANTENIMIENTO_LOTE filas a través del
+# escritor de cada base de datos (escritor.py), así que nunca retienen el lock
+# más que una escritura normal. Con varios procesos solo uno hace cada pasada
+# (tabla mantenimiento).
+#
+#   python mantenimiento.py estado       tamaño, páginas libres y papelera de cada base de datos
+#   python mantenimiento.py ejecutar     una pasada ahora
+#   python mantenimiento.py compactar    VACUUM completo; bloquea la base de datos mientras dura.
+#                                        Necesario una vez en bases de datos creadas antes de
+#                                        auto_vacuum = INCREMENTAL (ver conexiones.py)
+
+INTERVALO = int(os.environ.get('MANTENIMIENTO_INTERVALO', 600))   # 0 = sin hilo
+RETENCION = int(os.environ.get('MANTENIMIENTO_RETENCION', 86400))
+LOTE = int(os.environ.get('MANTENIMIENTO_LOTE', 500))
+# Páginas devueltas por operación del escritor (4 MB con páginas de 4 KB)
+PAGINAS_POR_PASO = 1000
+
+log = logging.getLogger('tareas.mantenimiento')
+
+# Totales del proceso para /metrics
+totales = {'purgadas': 0, 'huerfanas': 0, 'bytes': 0, 'ultima': 0}
+
+
+# ==================== OPERACIONES ====================
+# Se ejecutan en el escritor de cada base de datos; reciben su conexión.
+
+def _turno(conn, ahora, intervalo):
+    # Solo el primer proceso en llegar hace la pasada
+    return conn.execute('UPDATE mantenimiento SET ultima = ? WHERE id = 1 AND ultima <= ?',
+                        (ahora, ahora - intervalo)).rowcount == 1
+
+
+def _marcar_huerfanas(conn, lote):
+    # Subtareas vivas de tareas eliminadas: no se ven pero cuentan en el progreso
+    filas = conn.execute('''
+        SELECT h.id, h.proyecto_id FROM tareas p
+        JOIN tareas h ON h.parent_id = p.id AND h.eliminada = 0
+        WHERE p.eliminada != 0
+        LIMIT ?
+    ''', (lote,)).fetchall()
+    conn.executemany("UPDATE tareas SET eliminada = CAST(strftime('%s', 'now') AS INTEGER) WHERE id = ?",
+                     [(fila['id'],) for fila in filas])
+    tocar_proyectos(conn, [fila['proyecto_id'] for fila in filas])
+    return len(filas)
+
+
+def _purgar(conn, antes_de, lote):
+    # Las que aún tienen hijas vivas esperan a que el paso anterior las marque
+    return conn.execute('''
+        DELETE FROM tareas WHERE id IN (
+            SELECT d.id FROM tareas d
+            WHERE d.eliminada != 0 AND d.eliminada < ?
+              AND NOT EXISTS (SELECT 1 FROM tareas h WHERE h.parent_id = d.id AND h.eliminada = 0)
+            LIMIT ?
+        )
+    ''', (antes_de, lote)).rowcount
+
+
+def _liberar_paginas(conn, paginas):
+    # El módulo sqlite3 da un solo paso a las sentencias sin columnas de
+    # resultado, y incremental_vacuum libera una página por paso
+    for _ in range(paginas):
+        conn.execute('PRAGMA incremental_vacuum(1)')
+
+
+def _optimizar(conn):
+    conn.execute('PRAGMA optimize')
+
+
+# ==================== PASADA ====================
+
+def tamano(ruta):
+    return sum(os.path.getsize(f) for f in (ruta, ruta + '-wal') if os.path.exists(f))
+
+
+def por_lotes(ejecutar, operacion, *args):
+    total = 0
+    while True:
+        hechas = ejecutar(operacion, *args, LOTE)
+        total += hechas
+        if hechas < LOTE:
+            return total
+
+
+def mantener(ejecutar, conn, retencion=RETENCION):
+    # ejecutar(operacion, *args): escritura en la base de datos (el escritor
+    # de la aplicación o una transacción propia); conn: conexión de lectura
+    inicio = time.perf_counter()
+    informe = {
+        'huerfanas': por_lotes(ejecutar, _marcar_huerfanas),
+        'purgadas': por_lotes(ejecutar, _purgar, int(time.time() - retencion)),
+        'particiones': 0,
+        'paginas': 0,
+    }
+    limite = limite_retencion()
+    if limite is not None:
+        informe['particiones'] = ejecutar(eliminar_particiones, limite)
+
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        libres = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        while libres:
+            ejecutar(_liberar_paginas, min(libres, PAGINAS_POR_PASO))
+            quedan = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if quedan >= libres:
+                break
+            informe['paginas'] += libres - quedan
+            libres = quedan
+
+    ejecutar(_optimizar)
+    # PASSIVE copia lo que puede sin bloquear lectores ni escritores
+    informe['checkpoint'] = tuple(conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone())
+    # El fichero se acorta cuando el checkpoint llega a esas páginas
+    informe['bytes'] = informe['paginas'] * conn.execute('PRAGMA page_size').fetchone()[0]
+    informe['segundos'] = time.perf_counter() - inicio
+    return informe
+
+
+def describir(informe):
+    return (f"{informe['huerfanas']} huérfanas marcadas, {informe['purgadas']} tareas purgadas, "
+            f"{informe['particiones']} meses de actividad borrados, "
+            f"{informe['paginas']} páginas devueltas, {informe['bytes'] / 1e6:.1f} MB recuperados "
+            f"en {informe['segundos']:.1f} s")
+
+
+# ==================== HILO DE LA APLICACIÓN ====================
+
+def _pasada_aplicacion():
+    for numero, (pool_shard, escritor_shard) in enumerate(zip(pools, escritores)):
+        if not escritor_shard.ejecutar(_turno, int(time.time()), INTERVALO):
+            continue
+        conn = pool_shard.obtener()
+        try:
+            informe = mantener(escritor_shard.ejecutar, conn, RETENCION)
+        finally:
+            pool_shard.liberar(conn)
+        for clave in ('purgadas', 'huerfanas', 'bytes'):
+            totales[clave] += informe[clave]
+        totales['ultima'] = int(time.time())
+        log.info('Mantenimiento del shard %d: %s', numero, describir(informe))
+
+
+def _bucle():
+    while True:
+        time.sleep(INTERVALO)
+        try:
+            _pasada_aplicacion()
+        except Exception:
+            log.exception('Falló el mantenimiento; se reintenta en %d s', INTERVALO)
+
+
+_hilo = None
+_lock = threading.Lock()
+
+
+def arrancar_mantenimiento():
+    global _hilo
+    if INTERVALO <= 0 or _hilo is not None:
+        return
+    with _lock:
+        if _hilo is None:
+            _hilo = threading.Thread(target=_bucle, name='mantenimiento', daemon=True)
+            _hilo.start()
+
+
+def configurar_mantenimiento(app):
+    # El hilo arranca con la primera petición, no al importar (scripts, tests)
+    app.before_request(arrancar_mantenimiento)
+
+
+metricas.registrar_indicador('tareas_mantenimiento_purgadas', 'Tareas eliminadas purgadas por este proceso',
+                             lambda: totales['purgadas'])
+metricas.registrar_indicador('tareas_mantenimiento_bytes_recuperados', 'Bytes devueltos al disco por este proceso',
+                             lambda: totales['bytes'])
+metricas.registrar_indicador('tareas_mantenimiento_ultima', 'Hora (unix) de la última pasada de este proceso',
+                             lambda: totales['ultima'])
+
+
+# ==================== LÍNEA DE COMANDOS ====================
+
+def rutas(central):
+    return [(numero, ruta_shard(numero, central)) for numero in range(SHARDS + 1)
+            if os.path.exists(ruta_shard(numero, central))]
+
+
+def abrir(ruta):
+    from esquema import actualizar_esquema
+
+    conn = abrir_conexion(ruta)
+    actualizar_esquema(conn)
+    return conn
+
+
+def estado(ruta):
+    conn = abrir(ruta)
+    pagina = conn.execute('PRAGMA page_size').fetchone()[0]
+    libres = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    modo = {0: 'NONE', 1: 'FULL', 2: 'INCREMENTAL'}[conn.execute('PRAGMA auto_vacuum').fetchone()[0]]
+    eliminadas, huerfanas = conn.execute('''
+        SELECT (SELECT COUNT(*) FROM tareas WHERE eliminada != 0),
+               (SELECT COUNT(*) FROM tareas p JOIN tareas h ON h.parent_id = p.id AND h.eliminada = 0
+                WHERE p.eliminada != 0)
+    ''').fetchone()
+    conn.close()
+    return (f"{tamano(ruta) / 1e6:.1f} MB, {libres * pagina / 1e6:.1f} MB libres, auto_vacuum {modo}, "
+            f"{eliminadas} tareas en la papelera, {huerfanas} huérfanas")
+
+
+def compactar(ruta):
+    conn = abrir(ruta)
+    antes = tamano(ruta)
+    conn.execute('VACUUM')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    return antes - tamano(ruta)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mantenimiento de las bases de datos')
+    parser.add_argument('--db', default=DB_PATH, help='base de datos central')
+    ordenes = parser.add_subparsers(dest='orden', required=True)
+    ordenes.add_parser('estado')
+    p_ejecutar = ordenes.add_parser('ejecutar')
+    p_ejecutar.add_argument('--retencion', type=int, default=RETENCION,
+                            help='segundos que una tarea eliminada se conserva antes de purgarla')
+    ordenes.add_parser('compactar')
+    args = parser.parse_args(argv)
+
+    for numero, ruta in rutas(args.db):
+        if args.orden == 'estado':
+            print(f"🗄️ shard {numero}: {estado(ruta)} ({ruta})")
+        elif args.orden == 'compactar':
+            print(f"⏳ shard {numero}: VACUUM de {ruta}...")
+            print(f"✅ shard {numero}: {compactar(ruta) / 1e6:.1f} MB recuperados")
+        else:
+            conn = abrir(ruta)
+
+            def ejecutar(operacion, *args_operacion):
+                with transaccion(conn):
+                    return operacion(conn, *args_operacion)
+
+            print(f"✅ shard {numero}: {describir(mantener(ejecutar, conn, args.retencion))}")
+            conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from flask import Response, g, has_app_context, request
+
+# Instrumentación por petición: latencia por ruta, número y duración de las
+# consultas SQL, cabecera Server-Timing, registro de consultas lentas con su
+# EXPLAIN QUERY PLAN y endpoint /metrics en formato de texto de Prometheus.
+# Las métricas son por proceso; Prometheus las agrega por instancia.
+
+UMBRAL_LENTA = float(os.environ.get('SLOW_QUERY_MS', 100)) / 1000
+METRICAS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_CONSULTAS = (1, 2, 3, 5, 10, 20, 50, 100)
+BUCKETS_LOTE = (1, 2, 4, 8, 16, 32, 64, 128)
+
+log_lentas = logging.getLogger('tareas.consultas_lentas')
+
+
+# ==================== CONEXIÓN MEDIDA ====================
+
+def _registrar(conn, sql, parametros, segundos, filas):
+    # Solo se acumula dentro de una petición; scripts y migraciones no.
+    # conn: la conexión que ejecutó la sentencia (cada shard tiene la suya),
+    # para el EXPLAIN de las lentas
+    if not has_app_context():
+        return None
+    registro = {'conexion': conn, 'sql': sql, 'parametros': parametros, 'segundos': segundos,
+                'filas': max(filas, 0)}
+    g.setdefault('consultas', []).append(registro)
+    return registro
+
+
+class CursorMedido(sqlite3.Cursor):
+    _registro = None
+
+    def _medir_lectura(self, inicio, filas):
+        if self._registro is not None:
+            self._registro['segundos'] += time.perf_counter() - inicio
+            self._registro['filas'] += filas
+
+    def execute(self, sql, parametros=()):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            self._registro = _registrar(self.connection, sql, parametros, time.perf_counter() - inicio,
+                                        self.rowcount)
+
+    def executemany(self, sql, lista_parametros):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, lista_parametros)
+        finally:
+            self._registro = _registrar(self.connection, sql, None, time.perf_counter() - inicio, self.rowcount)
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        fila = super().fetchone()
+        self._medir_lectura(inicio, fila is not None)
+        return fila
+
+    def fetchmany(self, size=None):
+        inicio = time.perf_counter()
+        filas = super().fetchmany(size if size is not None else self.arraysize)
+        self._medir_lectura(inicio, len(filas))
+        return filas
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        filas = super().fetchall()
+        self._medir_lectura(inicio, len(filas))
+        return filas
+
+    def __next__(self):
+        inicio = time.perf_counter()
+        fila = super().__next__()
+        self._medir_lectura(inicio, 1)
+        return fila
+
+
+class ConexionMedida(sqlite3.Connection):
+    """Conexión cuyos cursores registran duración y filas de cada sentencia."""
+
+    def cursor(self, factory=CursorMedido):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, lista_parametros):
+        return self.cursor().executemany(sql, lista_parametros)
+
+
+# ==================== REGISTRO DE MÉTRICAS ====================
+
+class Histograma:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.cuentas = [0] * len(buckets)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                self.cuentas[i] += 1
+        self.suma += valor
+        self.total += 1
+
+    def lineas(self, nombre, etiquetas=''):
+        prefijo = etiquetas + ',' if etiquetas else ''
+        sufijo = f'{{{etiquetas}}}' if etiquetas else ''
+        for limite, cuenta in zip(self.buckets, self.cuentas):
+            yield f'{nombre}_bucket{{{prefijo}le="{limite}"}} {cuenta}'
+        yield f'{nombre}_bucket{{{prefijo}le="+Inf"}} {self.total}'
+        yield f'{nombre}_sum{sufijo} {self.suma}'
+        yield f'{nombre}_count{sufijo} {self.total}'
+
+
+class Metricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias = {}
+        self.consultas = {}
+        self.peticiones = {}
+        self.segundos_db = {}
+        self.lentas = 0
+        self.lotes = Histograma(BUCKETS_LOTE)
+        self.duracion_lotes = Histograma(BUCKETS_LATENCIA)
+        self.espera_escritura = Histograma(BUCKETS_LATENCIA)
+        self.indicadores = {}
+
+    def observar(self, ruta, metodo, estado, segundos, num_consultas, segundos_db):
+        clave = (ruta, metodo)
+        with self._lock:
+            self.latencias.setdefault(clave, Histograma(BUCKETS_LATENCIA)).observar(segundos)
+            self.consultas.setdefault(clave, Histograma(BUCKETS_CONSULTAS)).observar(num_consultas)
+            self.segundos_db[clave] = self.segundos_db.get(clave, 0.0) + segundos_db
+            clave_estado = (ruta, metodo, estado)
+            self.peticiones[clave_estado] = self.peticiones.get(clave_estado, 0) + 1
+
+    def contar_lenta(self):
+        with self._lock:
+            self.lentas += 1
+
+    def observar_lote(self, tamano, segundos, esperas):
+        with self._lock:
+            self.lotes.observar(tamano)
+            self.duracion_lotes.observar(segundos)
+            for espera in esperas:
+                self.espera_escritura.observar(espera)
+
+    def registrar_indicador(self, nombre, ayuda, funcion):
+        # Valor instantáneo (gauge) que se lee al exportar
+        self.indicadores[nombre] = (ayuda, funcion)
+
+    def exportar(self):
+        with self._lock:
+            lineas = [
+                '# HELP tareas_http_request_duration_seconds Latencia de las peticiones por ruta',
+                '# TYPE tareas_http_request_duration_seconds histogram',
+            ]
+            for (ruta, metodo), histograma in sorted(self.latencias.items()):
+                lineas.extend(histograma.lineas('tareas_http_request_duration_seconds',
+                                                f'ruta="{ruta}",metodo="{metodo}"'))
+
+            lineas += [
+                '# HELP tareas_http_requests_total Peticiones atendidas por ruta y estado',
+                '# TYPE tareas_http_requests_total counter',
+            ]
+            for (ruta, metodo, estado), cuenta in sorted(self.peticiones.items()):
+                lineas.append(f'tareas_http_requests_total{{ruta="{ruta}",metodo="{metodo}",estado="{estado}"}} {cuenta}')
+
+            lineas += [
+                '# HELP tareas_db_consultas_por_peticion Sentencias SQL ejecutadas por petición',
+                '# TYPE tareas_db_consultas_por_peticion histogram',
+            ]
+            for (ruta, metodo), histograma in sorted(self.consultas.items()):
+                lineas.extend(histograma.lineas('tareas_db_consultas_por_peticion',
+                                                f'ruta="{ruta}",metodo="{metodo}"'))
+
+            lineas += [
+                '# HELP tareas_db_duracion_segundos_total Tiempo total en SQLite por ruta',
+                '# TYPE tareas_db_duracion_segundos_total counter',
+            ]
+            for (ruta, metodo), segundos in sorted(self.segundos_db.items()):
+                lineas.append(f'tareas_db_duracion_segundos_total{{ruta="{ruta}",metodo="{metodo}"}} {segundos}')
+
+            lineas += [
+                '# HELP tareas_db_consultas_lentas_total Sentencias por encima del umbral SLOW_QUERY_MS',
+                '# TYPE tareas_db_consultas_lentas_total counter',
+                f'tareas_db_consultas_lentas_total {self.lentas}',
+                '# HELP tareas_escritura_lote_operaciones Operaciones confirmadas en cada commit agrupado',
+                '# TYPE tareas_escritura_lote_operaciones histogram',
+                *self.lotes.lineas('tareas_escritura_lote_operaciones'),
+                '# HELP tareas_escritura_lote_segundos Duración de cada transacción agrupada',
+                '# TYPE tareas_escritura_lote_segundos histogram',
+                *self.duracion_lotes.lineas('tareas_escritura_lote_segundos'),
+                '# HELP tareas_escritura_espera_segundos Tiempo en cola hasta entrar en un lote',
+                '# TYPE tareas_escritura_espera_segundos histogram',
+                *self.espera_escritura.lineas('tareas_escritura_espera_segundos'),
+            ]
+            for nombre, (ayuda, funcion) in sorted(self.indicadores.items()):
+                lineas += [f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} gauge', f'{nombre} {funcion()}']
+        return '\n'.join(lineas) + '\n'
+
+
+metricas = Metricas()
+
+
+# ==================== HOOKS DE FLASK ====================
+
+def _registrar_lenta(registro):
+    metricas.contar_lenta()
+    plan = ''
+    conn = registro['conexion']
+    if registro['parametros'] is not None:
+        try:
+            # Sin pasar por el cursor medido para no contarse a sí misma
+            filas = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + registro['sql'], registro['parametros'])
+            plan = '; '.join(fila[3] for fila in filas)
+        except sqlite3.Error:
+            pass
+    log_lentas.warning('Consulta lenta (%.1f ms, %d filas): %s | plan: %s',
+                       registro['segundos'] * 1000, registro['filas'],
+                       ' '.join(registro['sql'].split()), plan or 'no disponible')
+
+
+def instrumentar(app):
+    @app.before_request
+    def iniciar_medicion():
+        g.inicio_peticion = time.perf_counter()
+
+    @app.after_request
+    def terminar_medicion(respuesta):
+        inicio = g.get('inicio_peticion')
+        if inicio is None:
+            return respuesta
+        segundos = time.perf_counter() - inicio
+        consultas = g.get('consultas', [])
+        segundos_db = sum(registro['segundos'] for registro in consultas)
+
+        for registro in consultas:
+            if registro['segundos'] >= UMBRAL_LENTA:
+                _registrar_lenta(registro)
+
+        metricas.observar(request.endpoint or 'desconocida', request.method,
+                          respuesta.status_code, segundos, len(consultas), segundos_db)
+        respuesta.headers.add('Server-Timing',
+                              f'db;dur={segundos_db * 1000:.1f};desc="{len(consultas)} consultas", '
+                              f'app;dur={segundos * 1000:.1f}')
+        return respuesta
+
+    @app.route('/metrics')
+    def exportar_metricas():
+        if METRICAS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICAS_TOKEN}':
+            return Response('No autorizado\n', 401, mimetype='text/plain')
+        return Response(metricas.exportar(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,189 @@
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from conexiones import PRAGMAS, transaccion
+from esquema import actualizar_esquema
+from contadores import corregir_contadores
+
+# Copia de datos entre bases de datos SQLite por lotes y reanudable.
+#
+#   python migrar_datos.py respaldo tareas.db respaldo.db
+#       Copia en caliente con la API de backup de SQLite (sin renombrar ni
+#       bloquear la base de datos en uso).
+#
+#   python migrar_datos.py copiar viejo.db nuevo.db [--lote 10000]
+#       Crea el esquema actual en nuevo.db y copia usuarios, inquilinos,
+#       proyectos y tareas de viejo.db (aunque tenga un esquema antiguo) por
+#       bloques de ids. Cada bloque se inserta con INSERT ... SELECT desde la
+#       base de datos adjunta y se confirma junto con su punto de control, así
+#       que si se interrumpe basta con volver a lanzar el mismo comando.
+
+# Tablas en orden de dependencias
+TABLAS = ('usuarios', 'inquilinos', 'proyectos', 'tareas')
+
+# Valores para columnas que no existían en esquemas antiguos
+VALORES_POR_DEFECTO = {
+    ('proyectos', 'usuario_id'): '1',
+    ('tareas', 'proyecto_id'): '1',
+}
+
+
+def uri_solo_lectura(ruta):
+    return Path(ruta).resolve().as_uri() + '?mode=ro'
+
+
+def abrir_destino(ruta):
+    conn = sqlite3.connect(ruta)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def respaldar(origen, destino, paginas_por_paso=1024):
+    fuente = sqlite3.connect(uri_solo_lectura(origen), uri=True)
+    copia = sqlite3.connect(destino)
+    inicio = time.perf_counter()
+
+    def progreso(estado, restantes, total):
+        print(f"   {total - restantes}/{total} páginas copiadas", end='\r')
+
+    # Entre pasos se suelta el lock para que la aplicación siga escribiendo
+    fuente.backup(copia, pages=paginas_por_paso, progress=progreso, sleep=0.005)
+    print(f"\n✅ Respaldo creado en {destino} ({time.perf_counter() - inicio:.1f} s)")
+    copia.close()
+    fuente.close()
+
+
+def columnas_de(conn, tabla, esquema='origen'):
+    return [fila[1] for fila in conn.execute(f'PRAGMA {esquema}.table_info({tabla})')]
+
+
+def expresiones_select(conn, tabla):
+    # Columnas de destino que se pueden rellenar desde el origen
+    en_origen = set(columnas_de(conn, tabla))
+    destino = []
+    origen = []
+    for columna in columnas_de(conn, tabla, esquema='main'):
+        if columna in en_origen:
+            destino.append(columna)
+            origen.append(columna)
+        elif (tabla, columna) in VALORES_POR_DEFECTO:
+            destino.append(columna)
+            origen.append(VALORES_POR_DEFECTO[(tabla, columna)])
+    return destino, origen
+
+
+def preparar_progreso(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS migracion_progreso (
+            tabla TEXT PRIMARY KEY,
+            ultimo_id INTEGER NOT NULL,
+            filas INTEGER NOT NULL
+        )
+    ''')
+
+
+def copiar_tabla(conn, tabla, lote):
+    if not columnas_de(conn, tabla):
+        print(f"⚠️ {tabla}: no existe en el origen, se omite")
+        return 0
+
+    fila = conn.execute('SELECT ultimo_id, filas FROM migracion_progreso WHERE tabla = ?', (tabla,)).fetchone()
+    ultimo_id, copiadas = fila if fila else (0, 0)
+    if fila:
+        print(f"🔄 {tabla}: reanudando después del id {ultimo_id} ({copiadas} filas ya copiadas)")
+
+    destino, origen = expresiones_select(conn, tabla)
+    insertar = f'''
+        INSERT OR REPLACE INTO main.{tabla} ({', '.join(destino)})
+        SELECT {', '.join(origen)} FROM origen.{tabla} WHERE id > ? AND id <= ?
+    '''
+    inicio = time.perf_counter()
+    copiadas_ahora = 0
+
+    while True:
+        # Último id del siguiente bloque (recorrido por clave primaria)
+        hasta, cantidad = conn.execute(f'''
+            SELECT MAX(id), COUNT(*) FROM (
+                SELECT id FROM origen.{tabla} WHERE id > ? ORDER BY id LIMIT ?
+            )
+        ''', (ultimo_id, lote)).fetchone()
+        if not cantidad:
+            break
+
+        with transaccion(conn):
+            conn.execute(insertar, (ultimo_id, hasta))
+            copiadas += cantidad
+            conn.execute('INSERT OR REPLACE INTO migracion_progreso (tabla, ultimo_id, filas) VALUES (?, ?, ?)',
+                         (tabla, hasta, copiadas))
+        ultimo_id = hasta
+        copiadas_ahora += cantidad
+
+        segundos = time.perf_counter() - inicio
+        print(f"   {tabla}: {copiadas} filas ({copiadas_ahora / segundos:,.0f} filas/s)", end='\r')
+
+    segundos = time.perf_counter() - inicio
+    ritmo = copiadas_ahora / segundos if segundos else 0
+    print(f"\r✅ {tabla}: {copiadas} filas en total, {copiadas_ahora} en esta ejecución ({ritmo:,.0f} filas/s)")
+    return copiadas_ahora
+
+
+def copiar(origen, destino, lote=10000):
+    conn = abrir_destino(destino)
+    actualizar_esquema(conn)
+    preparar_progreso(conn)
+    conn.execute('ATTACH DATABASE ? AS origen', (uri_solo_lectura(origen),))
+
+    inicio = time.perf_counter()
+    total = sum(copiar_tabla(conn, tabla, lote) for tabla in TABLAS)
+    segundos = time.perf_counter() - inicio
+
+    # INSERT OR REPLACE no dispara el trigger de borrado sobre la fila
+    # sustituida y los contadores copiados se suman a los de los triggers,
+    # así que el índice de búsqueda y el progreso se recalculan al final
+    with transaccion(conn):
+        conn.execute("INSERT INTO tareas_fts (tareas_fts) VALUES ('rebuild')")
+        corregir_contadores(conn)
+        # Orígenes anteriores a los shards: la versión estaba en usuarios
+        if not columnas_de(conn, 'inquilinos'):
+            conn.execute('''
+                INSERT OR REPLACE INTO inquilinos (id, version_proyectos)
+                SELECT id, version_proyectos FROM usuarios
+            ''')
+
+    # Terminado: el punto de control ya no hace falta
+    conn.execute('DETACH DATABASE origen')
+    conn.execute('DROP TABLE migracion_progreso')
+    conn.commit()
+    conn.close()
+    print(f"🎉 Migración completada: {total} filas en {segundos:.1f} s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Copia de datos entre bases de datos SQLite')
+    ordenes = parser.add_subparsers(dest='orden', required=True)
+
+    p_respaldo = ordenes.add_parser('respaldo', help='copia en caliente con la API de backup')
+    p_respaldo.add_argument('origen')
+    p_respaldo.add_argument('destino')
+    p_respaldo.add_argument('--paginas', type=int, default=1024, help='páginas por paso')
+
+    p_copiar = ordenes.add_parser('copiar', help='copia por lotes al esquema actual (reanudable)')
+    p_copiar.add_argument('origen')
+    p_copiar.add_argument('destino')
+    p_copiar.add_argument('--lote', type=int, default=10000, help='filas por transacción')
+
+    args = parser.parse_args(argv)
+    if not Path(args.origen).exists():
+        parser.error(f'no existe {args.origen}')
+
+    if args.orden == 'respaldo':
+        respaldar(args.origen, args.destino, args.paginas)
+    else:
+        copiar(args.origen, args.destino, args.lote)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+from functools import wraps
+from flask import session, flash, redirect, url_for
+
+# Función para requerir login
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            flash('Por favor inicia sesión para acceder a esta página.', 'warning')
+            return redirect(url_for('login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+def proyecto_del_usuario(conn, proyecto_id):
+    # Los ids de los proyectos propios viven en la sesión (ver sesiones.py);
+    # solo se consulta la base de datos si el proyecto no está entre ellos
+    # (p. ej. creado desde otra sesión del mismo usuario)
+    return proyectos_del_usuario(conn, [proyecto_id]) == {proyecto_id}
+
+def proyectos_del_usuario(conn, ids):
+    # Subconjunto de ids que son proyectos del usuario
+    ids = set(ids)
+    conocidos = set(session.get('proyectos', ()))
+    faltan = ids - conocidos
+    if faltan:
+        marcadores = ', '.join('?' * len(faltan))
+        nuevos = {fila[0] for fila in conn.execute(
+            f'SELECT id FROM proyectos WHERE usuario_id = ? AND id IN ({marcadores})',
+            (session['user_id'], *faltan)
+        )}
+        if nuevos:
+            recordar_proyectos(nuevos)
+        conocidos |= nuevos
+    return ids & conocidos
+
+def recordar_proyectos(ids):
+    session['proyectos'] = sorted(set(session.get('proyectos', ())) | set(ids))
+
+def tarea_del_usuario(conn, tarea_id):
+    # Devuelve proyecto_id y completada si la tarea es de un proyecto del usuario
+    return conn.execute('''
+        SELECT t.proyecto_id, t.completada 
+        FROM tareas t 
+        JOIN proyectos p ON t.proyecto_id = p.id 
+        WHERE t.id = ? AND p.usuario_id = ? AND t.eliminada = 0
+    ''', (tarea_id, session['user_id'])).fetchone()
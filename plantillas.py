@@ -0,0 +1,87 @@
+import os
+import sys
+from flask import current_app, get_flashed_messages, stream_template
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+
+# Renderizado de plantillas.
+#
+# Las plantillas compiladas se guardan en disco (caché de bytecode de Jinja):
+# cada proceso nuevo las carga ya compiladas en vez de compilarlas en su
+# primera petición. asgi.py las precompila al arrancar, y también
+#
+#   python plantillas.py
+#
+# por ejemplo al desplegar. La caché se invalida sola si cambia una plantilla.
+#
+# Con PLANTILLAS_FLUJO=1 el dashboard se envía mientras se genera
+# (transmitir_plantilla): la cabecera y el selector de proyectos salen antes
+# de pintar las tareas, y la página completa nunca está entera en memoria.
+# La compresión de las respuestas está en compresion.py.
+
+CACHE_BYTECODE = os.environ.get('PLANTILLAS_CACHE', '1') == '1'
+# Sin valor: directorio temporal propio del usuario (el de Jinja por defecto)
+DIRECTORIO = os.environ.get('PLANTILLAS_CACHE_DIR') or None
+FLUJO = os.environ.get('PLANTILLAS_FLUJO', '1') == '1'
+# Jinja genera trozos muy pequeños: se envían agrupados en bloques de este tamaño
+TROZO = int(os.environ.get('PLANTILLAS_TROZO', 16 * 1024))
+
+
+def configurar_plantillas(app):
+    if CACHE_BYTECODE:
+        if DIRECTORIO:
+            os.makedirs(DIRECTORIO, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(DIRECTORIO)
+
+
+def precompilar(app):
+    # Compila (o carga de la caché en disco) todas las plantillas
+    nombres = app.jinja_env.list_templates()
+    for nombre in nombres:
+        app.jinja_env.get_template(nombre)
+    return len(nombres)
+
+
+# ==================== RESPUESTAS EN FLUJO ====================
+
+def _por_bloques(piezas, tamano):
+    # Una pieza vacía envía lo acumulado: fragmento_en_flujo la emite antes
+    # de empezar a pintar
+    bufer, acumulado = [], 0
+    for pieza in piezas:
+        bufer.append(pieza)
+        acumulado += len(pieza)
+        if acumulado >= tamano or (not pieza and acumulado):
+            yield ''.join(bufer)
+            bufer, acumulado = [], 0
+    if bufer:
+        yield ''.join(bufer)
+
+
+def transmitir_plantilla(nombre, **contexto):
+    # Como render_template, pero devuelve un iterable para la respuesta.
+    # La sesión se guarda antes de enviar el cuerpo: los mensajes flash se
+    # leen ya para que se borren de ella.
+    get_flashed_messages(with_categories=True)
+    return _por_bloques(stream_template(nombre, **contexto), TROZO)
+
+
+def fragmento_en_flujo(nombre, al_terminar, **contexto):
+    # Trozos de una plantilla parcial para insertarla en otra que se
+    # transmite; al_terminar recibe el HTML completo (para la caché)
+    app = current_app._get_current_object()
+    app.update_template_context(contexto)
+    piezas = []
+    yield Markup('')
+    for pieza in app.jinja_env.get_template(nombre).generate(contexto):
+        if pieza:
+            piezas.append(pieza)
+            yield Markup(pieza)
+    al_terminar(''.join(piezas))
+
+
+if __name__ == "__main__":
+    from app import app
+
+    print(f"✅ {precompilar(app)} plantillas compiladas en la caché de bytecode")
+    sys.exit(0)
@@ -0,0 +1,266 @@
+import heapq
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.request
+from conexiones import pools
+from escritor import escritores
+from metricas import metricas
+from actividad import ACTIVO as ACTIVIDAD, registro
+from vencimientos import PENDIENTES_SQL, ahora_utc, momento
+
+# Recordatorios de las tareas con fecha de vencimiento (vencimientos.py).
+#
+# Un hilo de la aplicación mantiene una cola de prioridad (heapq) con los
+# recordatorios que tocan antes de la siguiente recarga y duerme hasta el
+# primero. Cada RECORDATORIOS_RECARGA segundos lee de cada shard el frente de
+# la cola (PENDIENTES_SQL, un recorrido del índice parcial idx_tareas_avisos
+# de como mucho RECORDATORIOS_VENTANA filas), nunca la tabla entera. Las
+# tareas creadas desde el dashboard o la API entran en la cola al momento
+# (programar); las que llegan de otra forma, en la recarga siguiente.
+#
+# Un recordatorio se envía RECORDATORIOS_ANTELACION segundos antes del
+# vencimiento. Antes de enviarlo se reclama en el escritor del shard
+# (avisada de 0 a 1 si la tarea sigue pendiente con ese mismo vencimiento):
+# con varios procesos solo lo envía uno, y las entradas de tareas
+# completadas, eliminadas o con otra fecha se descartan sin más. Si el envío
+# falla se libera y se reintenta a los RECORDATORIOS_REINTENTO segundos.
+#
+# Destinos (RECORDATORIOS_DESTINO):
+#   log       una línea JSON por recordatorio en RECORDATORIOS_FICHERO
+#   webhook   POST JSON a RECORDATORIOS_URL
+# Otro destino es cualquier objeto con enviar(aviso) añadido a DESTINOS.
+#
+#   python recordatorios.py     el hilo en primer plano, como proceso aparte
+
+ACTIVOS = os.environ.get('RECORDATORIOS', '1') == '1'
+ANTELACION = int(os.environ.get('RECORDATORIOS_ANTELACION', 0))
+RECARGA = float(os.environ.get('RECORDATORIOS_RECARGA', 60))
+VENTANA = int(os.environ.get('RECORDATORIOS_VENTANA', 500))
+REINTENTO = float(os.environ.get('RECORDATORIOS_REINTENTO', 30))
+DESTINO = os.environ.get('RECORDATORIOS_DESTINO', 'log')
+FICHERO = os.environ.get('RECORDATORIOS_FICHERO', 'recordatorios.log')
+URL = os.environ.get('RECORDATORIOS_URL', '')
+
+log = logging.getLogger('tareas.recordatorios')
+
+# Totales del proceso para /metrics
+totales = {'enviados': 0, 'fallidos': 0, 'descartados': 0}
+
+
+# ==================== DESTINOS ====================
+
+class DestinoLog:
+    """Una línea JSON por recordatorio en un fichero local."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+
+    def enviar(self, aviso):
+        linea = json.dumps(aviso, ensure_ascii=False) + '\n'
+        with self._lock, open(self.ruta, 'a', encoding='utf-8') as fichero:
+            fichero.write(linea)
+
+
+class DestinoWebhook:
+    """POST con el recordatorio en JSON; un error HTTP cuenta como fallo."""
+
+    def __init__(self, url, timeout=5):
+        if not url:
+            raise ValueError('RECORDATORIOS_URL es obligatoria con el destino webhook')
+        self.url = url
+        self.timeout = timeout
+
+    def enviar(self, aviso):
+        peticion = urllib.request.Request(self.url, data=json.dumps(aviso).encode('utf-8'),
+                                          headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(peticion, timeout=self.timeout) as respuesta:
+            respuesta.read()
+
+
+DESTINOS = {
+    'log': lambda: DestinoLog(FICHERO),
+    'webhook': lambda: DestinoWebhook(URL),
+}
+
+
+def crear_destino(nombre=DESTINO):
+    if nombre not in DESTINOS:
+        raise ValueError(f'Destino de recordatorios desconocido: {nombre} (usa {", ".join(DESTINOS)})')
+    return DESTINOS[nombre]()
+
+
+# ==================== OPERACIONES ====================
+# Se ejecutan en el escritor del shard de la tarea; reciben su conexión.
+
+def _reclamar(conn, tarea_id, vence):
+    if conn.execute('''
+        UPDATE tareas SET avisada = 1
+        WHERE id = ? AND vence = ? AND avisada = 0 AND completada = 0 AND eliminada = 0
+    ''', (tarea_id, vence)).rowcount != 1:
+        return None
+    fila = conn.execute('''
+        SELECT t.id AS tarea_id, t.titulo, t.vence, t.prioridad, t.proyecto_id,
+               p.nombre AS proyecto, p.usuario_id
+        FROM tareas t JOIN proyectos p ON p.id = t.proyecto_id
+        WHERE t.id = ?
+    ''', (tarea_id,)).fetchone()
+    return dict(fila)
+
+
+def _liberar(conn, tarea_id, vence):
+    conn.execute('UPDATE tareas SET avisada = 0 WHERE id = ? AND vence = ?', (tarea_id, vence))
+
+
+# ==================== COLA ====================
+
+class ColaRecordatorios:
+    def __init__(self, destino=None):
+        self.destino = destino
+        # (hora unix de envío, shard, tarea_id, vence)
+        self._cola = []
+        self._en_cola = set()
+        # Por shard: último vencimiento (hora unix) cargado en la cola
+        self._horizonte = [0.0] * len(pools)
+        self._proxima_recarga = 0.0
+        self._condicion = threading.Condition()
+
+    def _meter(self, envio, shard, tarea_id, vence):
+        # Con el lock tomado
+        if (shard, tarea_id, vence) not in self._en_cola:
+            self._en_cola.add((shard, tarea_id, vence))
+            heapq.heappush(self._cola, (envio, shard, tarea_id, vence))
+
+    def programar(self, shard, tarea_id, vence):
+        # Tarea nueva o con otro vencimiento; si vence después del horizonte
+        # de su shard ya la traerá la recarga
+        if vence is None or momento(vence) > self._horizonte[shard]:
+            return
+        with self._condicion:
+            self._meter(momento(vence) - ANTELACION, shard, tarea_id, vence)
+            self._condicion.notify()
+
+    def recargar(self):
+        limite = ahora_utc(RECARGA + ANTELACION)
+        proxima = time.time() + RECARGA
+        for shard, pool_shard in enumerate(pools):
+            # Antes de leer: lo que se programe mientras tanto entra en la cola
+            self._horizonte[shard] = momento(limite)
+            conn = pool_shard.obtener()
+            try:
+                filas = conn.execute(PENDIENTES_SQL, (limite, VENTANA)).fetchall()
+            finally:
+                pool_shard.liberar(conn)
+            with self._condicion:
+                if len(filas) == VENTANA:
+                    # Cola llena: las que faltan llegan al recargar al alcanzar la última
+                    self._horizonte[shard] = momento(filas[-1]['vence'])
+                    proxima = min(proxima, self._horizonte[shard] - ANTELACION)
+                for fila in filas:
+                    self._meter(momento(fila['vence']) - ANTELACION, shard, fila['id'], fila['vence'])
+        self._proxima_recarga = proxima
+
+    def _vencidos(self):
+        ahora = time.time()
+        with self._condicion:
+            listos = []
+            while self._cola and self._cola[0][0] <= ahora:
+                entrada = heapq.heappop(self._cola)
+                self._en_cola.discard(entrada[1:])
+                listos.append(entrada)
+            return listos
+
+    def _enviar(self, shard, tarea_id, vence):
+        aviso = escritores[shard].ejecutar(_reclamar, tarea_id, vence)
+        if aviso is None:
+            # Completada, eliminada, con otra fecha o enviada por otro proceso
+            totales['descartados'] += 1
+            return
+        try:
+            self.destino.enviar(aviso)
+        except Exception:
+            totales['fallidos'] += 1
+            log.exception('No se pudo enviar el recordatorio de la tarea %d; se reintenta en %d s',
+                          tarea_id, REINTENTO)
+            escritores[shard].ejecutar(_liberar, tarea_id, vence)
+            with self._condicion:
+                self._meter(time.time() + REINTENTO, shard, tarea_id, vence)
+            return
+        totales['enviados'] += 1
+        if ACTIVIDAD:
+            registro.anotar(shard, None, aviso['proyecto_id'], tarea_id, 'recordatorio', despues={'vence': vence})
+
+    def pasada(self):
+        if time.time() >= self._proxima_recarga:
+            self.recargar()
+        for _, shard, tarea_id, vence in self._vencidos():
+            self._enviar(shard, tarea_id, vence)
+
+    def _esperar(self):
+        with self._condicion:
+            hasta = self._proxima_recarga
+            if self._cola:
+                hasta = min(hasta, self._cola[0][0])
+            espera = hasta - time.time()
+            if espera > 0:
+                self._condicion.wait(espera)
+
+    def bucle(self):
+        if self.destino is None:
+            self.destino = crear_destino()
+        while True:
+            try:
+                self.pasada()
+            except Exception:
+                log.exception('Fallaron los recordatorios; se reintenta en %d s', REINTENTO)
+                self._proxima_recarga = time.time() + REINTENTO
+            self._esperar()
+
+    # Para /metrics
+    def pendientes(self):
+        return len(self._cola)
+
+
+recordatorios = ColaRecordatorios()
+
+
+# ==================== HILO DE LA APLICACIÓN ====================
+
+_hilo = None
+_lock = threading.Lock()
+
+
+def arrancar_recordatorios():
+    global _hilo
+    if not ACTIVOS or _hilo is not None:
+        return
+    with _lock:
+        if _hilo is None:
+            _hilo = threading.Thread(target=recordatorios.bucle, name='recordatorios', daemon=True)
+            _hilo.start()
+
+
+def configurar_recordatorios(app):
+    # Como el mantenimiento: el hilo arranca con la primera petición
+    app.before_request(arrancar_recordatorios)
+
+
+metricas.registrar_indicador('tareas_recordatorios_en_cola', 'Recordatorios en la cola en memoria',
+                             recordatorios.pendientes)
+metricas.registrar_indicador('tareas_recordatorios_enviados', 'Recordatorios enviados por este proceso',
+                             lambda: totales['enviados'])
+metricas.registrar_indicador('tareas_recordatorios_fallidos', 'Envíos de recordatorios fallidos (se reintentan)',
+                             lambda: totales['fallidos'])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(f"⏰ Recordatorios cada {RECARGA:g} s al destino {DESTINO} (Ctrl+C para salir)")
+    try:
+        recordatorios.bucle()
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,202 @@
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+from flask import g, session
+from conexiones import (PoolConexiones, abrir_conexion, conexion_de, get_db_connection, pools,
+                        shard_actual)
+from metricas import metricas
+
+# Réplicas de lectura.
+#
+# Cada base de datos (central y shards) puede tener REPLICAS copias locales
+# (tareas.replica1.db, tareas.shard1.replica1.db, ...) que un hilo de la
+# aplicación refresca cada REPLICA_INTERVALO segundos con la API de backup de
+# SQLite. Las lecturas del dashboard (get_db_lectura) van a una réplica con
+# su propio pool de conexiones, así que no compiten con las del escritor por
+# el fichero principal; las escrituras y las comprobaciones de permisos de
+# las acciones siguen en el primario.
+#
+# Una réplica solo se usa si:
+#   - su última copia empezó hace como mucho REPLICA_RETRASO_MAX segundos
+#     (si el hilo se atasca, todo vuelve al primario)
+#   - empezó después de la última escritura del usuario: las peticiones que
+#     pasan por el escritor guardan la hora en session['escrito'] al
+#     terminar, y hasta que una copia posterior esté lista el usuario lee del
+#     primario (lee sus propias escrituras)
+#
+# La hora de cada copia se guarda en la propia réplica (tabla replica), así
+# que con varios procesos solo uno copia en cada intervalo y el resto la
+# leen. Si el primario no cambió desde la última copia (PRAGMA data_version)
+# solo se actualiza esa hora. Una importación en streaming escribe después
+# de guardar la sesión: sus datos se ven en cuanto llega la copia siguiente.
+
+REPLICAS = int(os.environ.get('REPLICAS', 0))   # 0 = todas las lecturas al primario
+INTERVALO = float(os.environ.get('REPLICA_INTERVALO', 2))
+RETRASO_MAX = float(os.environ.get('REPLICA_RETRASO_MAX', 10))
+
+log = logging.getLogger('tareas.replicas')
+
+
+def ruta_replica(ruta, numero):
+    base, extension = os.path.splitext(ruta)
+    return f'{base}.replica{numero}{extension or ".db"}'
+
+
+class Replica:
+    def __init__(self, ruta_primaria, numero, tamano_max):
+        self.ruta_primaria = ruta_primaria
+        self.ruta = ruta_replica(ruta_primaria, numero)
+        self.pool = PoolConexiones(self.ruta, tamano_max=tamano_max, solo_lectura=True)
+        # Hora (time.time) en que empezó la copia que contiene el fichero
+        self.copiada = 0.0
+        self._origen = None
+        self._destino = None
+        self._data_version = None
+
+    def _abrir(self):
+        if self._origen is None:
+            self._origen = abrir_conexion(self.ruta_primaria)
+            self._destino = abrir_conexion(self.ruta)
+            self._destino.execute('CREATE TABLE IF NOT EXISTS replica (id INTEGER PRIMARY KEY, copiada REAL)')
+
+    def _leer_copiada(self):
+        try:
+            fila = self._destino.execute('SELECT copiada FROM replica WHERE id = 1').fetchone()
+        except sqlite3.OperationalError:
+            # Otro proceso acaba de copiar y aún no ha vuelto a crear la tabla
+            return 0.0
+        return fila[0] if fila else 0.0
+
+    def _anotar(self, copiada):
+        with self._destino:
+            self._destino.execute('INSERT OR REPLACE INTO replica (id, copiada) VALUES (1, ?)', (copiada,))
+        self.copiada = copiada
+
+    def refrescar(self):
+        # Devuelve True si copió la base de datos
+        self._abrir()
+        ahora = time.time()
+        copiada = self._leer_copiada()
+        if ahora - copiada < INTERVALO / 2:
+            # Otro proceso la acaba de refrescar
+            self.copiada = copiada
+            return False
+
+        # Cambia con cada commit de otra conexión (de este o de otro proceso)
+        data_version = self._origen.execute('PRAGMA data_version').fetchone()[0]
+        if data_version == self._data_version:
+            self._anotar(ahora)
+            return False
+
+        # Un solo paso: lee una instantánea del primario sin bloquear a sus
+        # escritores y la escribe en la réplica como una transacción; los
+        # lectores de la réplica siguen con la copia anterior hasta el commit
+        self._origen.backup(self._destino)
+        self._data_version = data_version
+        # El backup reemplaza también la tabla replica
+        self._destino.execute('CREATE TABLE IF NOT EXISTS replica (id INTEGER PRIMARY KEY, copiada REAL)')
+        self._anotar(ahora)
+        return True
+
+    def retraso(self):
+        return time.time() - self.copiada
+
+    def cerrar(self):
+        self.pool.cerrar()
+        for conn in (self._origen, self._destino):
+            if conn is not None:
+                conn.close()
+        self._origen = self._destino = None
+
+
+# Las de cada base de datos, en el orden de pools
+replicas = [[Replica(pool_primario.ruta, numero, pool_primario.tamano_max)
+             for numero in range(1, REPLICAS + 1)] for pool_primario in pools]
+_turno = itertools.count()
+totales = {'replica': 0, 'primario': 0, 'copias': 0}
+
+
+# ==================== LECTURAS ====================
+
+def elegir_replica(shard, escrito=0.0):
+    # Réplica al día para quien escribió a la hora `escrito`, o None
+    ahora = time.time()
+    vigentes = [replica for replica in replicas[shard]
+                if replica.copiada > escrito and ahora - replica.copiada <= RETRASO_MAX]
+    if not vigentes:
+        return None
+    return vigentes[next(_turno) % len(vigentes)]
+
+
+def get_db_lectura():
+    # Conexión para consultas de solo lectura de proyectos y tareas del
+    # usuario en sesión: una réplica si hay alguna al día, si no el primario
+    replica = elegir_replica(shard_actual(), session.get('escrito', 0.0)) if REPLICAS else None
+    if replica is None:
+        totales['primario'] += 1
+        return get_db_connection()
+    totales['replica'] += 1
+    return conexion_de(replica.pool)
+
+
+def _anotar_escritura(respuesta):
+    # Después de la vista: todo lo que escribió ya está confirmado
+    if g.get('escritura'):
+        session['escrito'] = time.time()
+    return respuesta
+
+
+# ==================== HILO DE REFRESCO ====================
+
+def refrescar_todas():
+    for replica in itertools.chain.from_iterable(replicas):
+        try:
+            if replica.refrescar():
+                totales['copias'] += 1
+        except sqlite3.Error:
+            # Otro proceso copiando a la vez o el disco lleno: se reintenta en
+            # el siguiente intervalo y, mientras, se lee del primario
+            log.exception('No se pudo refrescar %s', replica.ruta)
+
+
+def _bucle():
+    while True:
+        inicio = time.monotonic()
+        refrescar_todas()
+        time.sleep(max(0.0, INTERVALO - (time.monotonic() - inicio)))
+
+
+_hilo = None
+_lock = threading.Lock()
+
+
+def arrancar_replicas():
+    global _hilo
+    if REPLICAS <= 0 or _hilo is not None:
+        return
+    with _lock:
+        if _hilo is None:
+            _hilo = threading.Thread(target=_bucle, name='replicas', daemon=True)
+            _hilo.start()
+
+
+def configurar_replicas(app):
+    if REPLICAS <= 0:
+        return
+    # Como el mantenimiento: el hilo arranca con la primera petición
+    app.before_request(arrancar_replicas)
+    app.after_request(_anotar_escritura)
+
+
+metricas.registrar_indicador('tareas_replica_retraso_segundos', 'Antigüedad de la réplica más atrasada',
+                             lambda: max((replica.retraso() for replica in itertools.chain.from_iterable(replicas)),
+                                         default=0))
+metricas.registrar_indicador('tareas_lecturas_replica', 'Peticiones del dashboard leídas de una réplica',
+                             lambda: totales['replica'])
+metricas.registrar_indicador('tareas_lecturas_primario', 'Peticiones del dashboard leídas del primario',
+                             lambda: totales['primario'])
+metricas.registrar_indicador('tareas_replica_copias', 'Copias completas hechas por este proceso',
+                             lambda: totales['copias'])
@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Método de hash de werkzeug (p. ej. 'scrypt:32768:8:1' o 'pbkdf2:sha256:600000').
+# Si se cambia, los hashes antiguos se rehacen en el siguiente login correcto.
+METODO_HASH = os.environ.get('PASSWORD_HASH_METHOD') or None
+
+# Procesos dedicados al hash; con 0 se calcula en el hilo de la petición
+HASH_WORKERS = int(os.environ.get('HASH_WORKERS', os.cpu_count() or 1))
+# Peticiones de hash en cola o en curso antes de rechazar nuevas (back-pressure)
+HASH_COLA_MAX = int(os.environ.get('HASH_COLA_MAX', max(HASH_WORKERS, 1) * 4))
+HASH_TIMEOUT = float(os.environ.get('HASH_TIMEOUT', 10))
+
+# Límite de intentos fallidos por IP y por usuario
+INTENTOS_MAX = int(os.environ.get('LOGIN_INTENTOS_MAX', 10))
+VENTANA_INTENTOS = int(os.environ.get('LOGIN_VENTANA', 300))
+
+
+class HashSaturado(Exception):
+    """Cola llena o hash sin terminar en HASH_TIMEOUT: el servidor está ocupado."""
+
+
+class PoolHash:
+    """Calcula hashes en un pool de procesos con una cola acotada."""
+
+    def __init__(self, workers, cola_max, timeout):
+        self.workers = workers
+        self.timeout = timeout
+        self._huecos = threading.BoundedSemaphore(cola_max)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _obtener_executor(self):
+        # Los procesos se arrancan con el primer hash, no al importar
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def ejecutar(self, funcion, *args):
+        if self.workers <= 0:
+            return funcion(*args)
+
+        if not self._huecos.acquire(timeout=1):
+            raise HashSaturado()
+        try:
+            futuro = self._obtener_executor().submit(funcion, *args)
+        except BaseException:
+            self._huecos.release()
+            raise
+        futuro.add_done_callback(lambda _: self._huecos.release())
+        try:
+            return futuro.result(timeout=self.timeout)
+        except TimeoutError:
+            # El hash sigue en su proceso y libera el hueco al terminar
+            raise HashSaturado() from None
+
+
+pool_hash = PoolHash(HASH_WORKERS, HASH_COLA_MAX, HASH_TIMEOUT)
+
+
+def _generar(password):
+    if METODO_HASH:
+        return generate_password_hash(password, method=METODO_HASH)
+    return generate_password_hash(password)
+
+
+def generar_hash(password):
+    return pool_hash.ejecutar(_generar, password)
+
+
+def verificar_password(password_hash, password):
+    return pool_hash.ejecutar(check_password_hash, password_hash, password)
+
+
+_parametros = None
+
+
+def _parametros_actuales():
+    # Prefijo 'metodo:parametros' que produce la configuración actual. Se
+    # calcula una vez por proceso con un hash en el pool, como los demás
+    global _parametros
+    if _parametros is None:
+        _parametros = generar_hash('').split('$', 1)[0]
+    return _parametros
+
+
+def necesita_rehash(password_hash):
+    return password_hash.split('$', 1)[0] != _parametros_actuales()
+
+
+# ==================== LÍMITE DE INTENTOS ====================
+
+class LimitadorIntentos:
+    """Ventana deslizante de intentos por clave (IP o usuario)."""
+
+    def __init__(self, maximo, ventana, max_claves=10000):
+        self.maximo = maximo
+        self.ventana = ventana
+        self.max_claves = max_claves
+        self._intentos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _vigentes(self, clave, ahora):
+        intentos = self._intentos.get(clave)
+        if intentos is None:
+            return None
+        while intentos and intentos[0] <= ahora - self.ventana:
+            intentos.popleft()
+        return intentos
+
+    def bloqueado(self, *claves):
+        ahora = time.monotonic()
+        with self._lock:
+            for clave in claves:
+                intentos = self._vigentes(clave, ahora)
+                if intentos is not None and len(intentos) >= self.maximo:
+                    return True
+        return False
+
+    def registrar_intento(self, *claves):
+        ahora = time.monotonic()
+        with self._lock:
+            for clave in claves:
+                intentos = self._vigentes(clave, ahora)
+                if intentos is None:
+                    intentos = self._intentos[clave] = deque()
+                intentos.append(ahora)
+                self._intentos.move_to_end(clave)
+            while len(self._intentos) > self.max_claves:
+                self._intentos.popitem(last=False)
+
+    def limpiar(self, *claves):
+        with self._lock:
+            for clave in claves:
+                self._intentos.pop(clave, None)
+
+
+limitador = LimitadorIntentos(INTENTOS_MAX, VENTANA_INTENTOS)
@@ -0,0 +1,200 @@
+import json
+import os
+import secrets
+import threading
+import time
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from cache import CacheMemoria
+from conexiones import pool
+from escritor import escritor
+
+# Sesiones en el servidor.
+#
+# La cookie solo lleva un identificador aleatorio; los datos (user_id,
+# username, ids de los proyectos del usuario y mensajes flash) se guardan en
+# la tabla sesiones (migración 6) con un LRU local delante, así que cada
+# petición normalmente no toca SQLite para leer la sesión. Las escrituras van
+# por el escritor agrupado y las sesiones caducadas se borran en bloque cada
+# SESION_BARRIDO segundos. Con SESIONES=cookie se vuelve a la cookie firmada
+# de Flask.
+
+BACKEND = os.environ.get('SESIONES', 'sqlite')
+# Tiempo que una sesión leída se sirve del LRU sin volver a la base de datos
+# (lo que tarda en notarse en otro proceso un cierre de sesión o revocación)
+SEGUNDOS_EN_MEMORIA = float(os.environ.get('SESION_CACHE_SEGUNDOS', 30))
+BARRIDO = int(os.environ.get('SESION_BARRIDO', 300))
+
+serializador = TaggedJSONSerializer()
+
+
+class SesionServidor(CallbackDict, SessionMixin):
+    def __init__(self, datos=None, sid=None, expira=0):
+        def al_cambiar(sesion):
+            sesion.modified = True
+
+        super().__init__(datos, al_cambiar)
+        self.sid = sid
+        self.expira = expira
+        self.usuario_inicial = self.get('user_id')
+        self.new = sid is None
+        self.modified = False
+
+
+# ==================== ALMACÉN ====================
+
+def _guardar(conn, sid, usuario_id, datos, expira, sid_anterior):
+    if sid_anterior:
+        conn.execute('DELETE FROM sesiones WHERE id = ?', (sid_anterior,))
+    conn.execute('INSERT OR REPLACE INTO sesiones (id, usuario_id, datos, expira) VALUES (?, ?, ?, ?)',
+                 (sid, usuario_id, datos, expira))
+
+
+def _renovar(conn, sid, expira):
+    conn.execute('UPDATE sesiones SET expira = ? WHERE id = ?', (expira, sid))
+
+
+def _eliminar(conn, sid):
+    conn.execute('DELETE FROM sesiones WHERE id = ?', (sid,))
+
+
+def _barrer(conn, ahora):
+    return conn.execute('DELETE FROM sesiones WHERE expira < ?', (ahora,)).rowcount
+
+
+class AlmacenSesiones:
+    """Tabla sesiones con un LRU de sesiones recientes delante."""
+
+    def __init__(self, max_en_memoria=10000):
+        self.memoria = CacheMemoria(max_entradas=max_en_memoria)
+        self._ultimo_barrido = time.time()
+        self._lock = threading.Lock()
+
+    def cargar(self, sid):
+        ahora = time.time()
+        guardada = self.memoria.get(sid)
+        if guardada is not None:
+            datos, expira, leida = json.loads(guardada)
+            if ahora - leida < SEGUNDOS_EN_MEMORIA:
+                return (datos, expira) if expira > ahora else None
+
+        conn = pool.obtener()
+        try:
+            fila = conn.execute('SELECT datos, expira FROM sesiones WHERE id = ? AND expira > ?',
+                                (sid, int(ahora))).fetchone()
+        finally:
+            pool.liberar(conn)
+        if fila is None:
+            self.memoria.delete(sid)
+            return None
+        self._recordar(sid, fila['datos'], fila['expira'])
+        return fila['datos'], fila['expira']
+
+    def _recordar(self, sid, datos, expira):
+        self.memoria.set(sid, json.dumps([datos, expira, time.time()]))
+
+    def guardar(self, sid, usuario_id, datos, expira, sid_anterior=None):
+        escritor.ejecutar(_guardar, sid, usuario_id, datos, expira, sid_anterior)
+        if sid_anterior:
+            self.memoria.delete(sid_anterior)
+        self._recordar(sid, datos, expira)
+
+    def renovar(self, sid, datos, expira):
+        escritor.ejecutar(_renovar, sid, expira)
+        self._recordar(sid, datos, expira)
+
+    def eliminar(self, sid):
+        escritor.ejecutar(_eliminar, sid)
+        self.memoria.delete(sid)
+
+    def barrer_si_toca(self):
+        # Borrado en bloque de las caducadas (usa el índice por expira)
+        ahora = time.time()
+        with self._lock:
+            if ahora - self._ultimo_barrido < BARRIDO:
+                return 0
+            self._ultimo_barrido = ahora
+        return escritor.ejecutar(_barrer, int(ahora))
+
+
+# ==================== INTERFAZ DE FLASK ====================
+
+class InterfazSesionServidor(SessionInterface):
+    def __init__(self, almacen):
+        self.almacen = almacen
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            cargada = self.almacen.cargar(sid)
+            if cargada is not None:
+                datos, expira = cargada
+                return SesionServidor(serializador.loads(datos), sid, expira)
+        return SesionServidor()
+
+    def save_session(self, app, session, response):
+        nombre = self.get_cookie_name(app)
+        dominio = self.get_cookie_domain(app)
+        ruta = self.get_cookie_path(app)
+        self.almacen.barrer_si_toca()
+
+        # Sesión vaciada (logout): se borra también en el servidor
+        if not session:
+            if session.sid is not None and session.modified:
+                self.almacen.eliminar(session.sid)
+                response.delete_cookie(nombre, domain=dominio, path=ruta)
+            return
+
+        ahora = time.time()
+        expira = int(ahora + app.permanent_session_lifetime.total_seconds())
+        if session.modified:
+            sid_anterior = session.sid
+            # Identificador nuevo al iniciar sesión (evita fijación de sesión)
+            if session.sid is None or session.get('user_id') != session.usuario_inicial:
+                session.sid = secrets.token_urlsafe(32)
+            self.almacen.guardar(session.sid, session.get('user_id'), serializador.dumps(dict(session)),
+                                 expira, sid_anterior if sid_anterior != session.sid else None)
+        elif session.expira - ahora < app.permanent_session_lifetime.total_seconds() / 2:
+            # Caducidad deslizante sin escribir en cada petición
+            self.almacen.renovar(session.sid, serializador.dumps(dict(session)), expira)
+        else:
+            return
+
+        response.set_cookie(nombre, session.sid,
+                            expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app),
+                            domain=dominio, path=ruta,
+                            secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app))
+        response.vary.add('Cookie')
+
+
+almacen = AlmacenSesiones()
+
+
+def configurar_sesiones(app):
+    if BACKEND == 'sqlite':
+        app.session_interface = InterfazSesionServidor(almacen)
+
+
+# ==================== CONSULTAS SOBRE SESIONES ====================
+
+def _revocar(conn, usuario_id):
+    sids = [fila[0] for fila in conn.execute('SELECT id FROM sesiones WHERE usuario_id = ?', (usuario_id,))]
+    conn.execute('DELETE FROM sesiones WHERE usuario_id = ?', (usuario_id,))
+    return sids
+
+
+def revocar_sesiones(usuario_id):
+    # Cierra todas las sesiones del usuario; otros procesos lo notan en
+    # como mucho SESION_CACHE_SEGUNDOS
+    sids = escritor.ejecutar(_revocar, usuario_id)
+    for sid in sids:
+        almacen.memoria.delete(sid)
+    return len(sids)
+
+
+def contar_sesiones(conn, usuario_id):
+    return conn.execute('SELECT COUNT(*) FROM sesiones WHERE usuario_id = ? AND expira > ?',
+                        (usuario_id, int(time.time()))).fetchone()[0]
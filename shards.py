@@ -0,0 +1,316 @@
+import argparse
+import os
+import sys
+import time
+from conexiones import DB_PATH, SHARDS, abrir_conexion, comprobar_shard, ruta_shard, shard_para, transaccion
+from actividad import COLUMNAS as COLUMNAS_ACTIVIDAD, crear_particion
+from escritor import TIMEOUT_ESCRITURA
+from esquema import actualizar_esquema, columnas
+from intercambio import LOTE
+from sesiones import BACKEND, SEGUNDOS_EN_MEMORIA
+
+# Reparto de usuarios entre shards (ver conexiones.py).
+#
+#   python shards.py estado               usuarios, proyectos y tareas de cada shard
+#   python shards.py mover demo 2         mueve un usuario al shard 2
+#   python shards.py repartir             mueve los usuarios del shard 0 (la base
+#                                         de datos central) al shard que les toca
+#   python shards.py purgar               borra datos de usuarios que no son del shard
+#
+# Un traslado marca al usuario en el directorio (no puede iniciar sesión),
+# cierra sus sesiones y espera a que ningún proceso siga usándolas; después
+# copia sus proyectos, tareas y actividad al shard de destino por lotes,
+# cambia el directorio y borra sus datos del resto de shards. La copia es un
+# INSERT ... SELECT desde el shard de origen (ATTACH): las filas pasan tal
+# cual, con las tareas eliminadas y los recordatorios ya enviados (avisada).
+# Los ids se conservan si están libres en el destino; si no, todos se
+# desplazan lo mismo, así que parent_id y la actividad siguen apuntando a su
+# tarea. Si se interrumpe basta con repetir el comando: la copia a medias del
+# destino se descarta.
+
+# Lo que una sesión cerrada puede seguir sirviéndose de memoria más lo que
+# puede esperar una escritura ya encolada
+ESPERA = SEGUNDOS_EN_MEMORIA + TIMEOUT_ESCRITURA
+
+
+def abrir_shard(numero, central):
+    conn = abrir_conexion(ruta_shard(numero, central))
+    actualizar_esquema(conn)
+    return conn
+
+
+def _por_lotes(conn, sql, parametros):
+    # Repite un DELETE con LIMIT en transacciones cortas para no bloquear a
+    # los demás usuarios del shard
+    while True:
+        with transaccion(conn):
+            if not conn.execute(sql, parametros).rowcount:
+                return
+
+
+def borrar_datos(conn, usuario_id):
+    _por_lotes(conn, '''
+        DELETE FROM tareas WHERE id IN (
+            SELECT t.id FROM proyectos p JOIN tareas t ON t.proyecto_id = p.id
+            WHERE p.usuario_id = ? LIMIT ?
+        )
+    ''', (usuario_id, LOTE))
+    for (tabla,) in conn.execute('SELECT nombre FROM actividad_particiones').fetchall():
+        _por_lotes(conn, f'''
+            DELETE FROM {tabla} WHERE id IN (
+                SELECT id FROM {tabla}
+                WHERE proyecto_id IN (SELECT id FROM proyectos WHERE usuario_id = ?) LIMIT ?
+            )
+        ''', (usuario_id, LOTE))
+    with transaccion(conn):
+        conn.execute('DELETE FROM proyectos WHERE usuario_id = ?', (usuario_id,))
+        conn.execute('DELETE FROM inquilinos WHERE id = ?', (usuario_id,))
+
+
+# ==================== COPIA ====================
+# Sobre la conexión del destino con el shard de origen adjunto como "origen"
+
+PROYECTOS_ORIGEN = '(SELECT id FROM origen.proyectos WHERE usuario_id = :usuario)'
+
+
+def _reservar_ids(conn, tabla, minimo, maximo):
+    # Desplazamiento que lleva los ids [minimo, maximo] del origen a ids
+    # libres del destino (0 si ya lo están). sqlite_sequence queda por
+    # encima del rango, así que las altas de la aplicación no lo ocupan
+    techo = conn.execute(f'''
+        SELECT MAX(COALESCE((SELECT MAX(id) FROM main.{tabla}), 0),
+                   COALESCE((SELECT seq FROM main.sqlite_sequence WHERE name = ?), 0))
+    ''', (tabla,)).fetchone()[0]
+    desplazamiento = max(0, techo + 1 - minimo)
+    if not conn.execute('UPDATE main.sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?',
+                        (maximo + desplazamiento, tabla)).rowcount:
+        conn.execute('INSERT INTO main.sqlite_sequence (name, seq) VALUES (?, ?)', (tabla, maximo + desplazamiento))
+    return desplazamiento
+
+
+def _copiar_filas(conn, tabla, cambios, condicion, parametros):
+    # Todas las columnas de origen.tabla salvo las de `cambios` (columna ->
+    # expresión), que se calculan
+    nombres = sorted(columnas(conn, tabla))
+    seleccion = ', '.join(cambios.get(nombre, nombre) for nombre in nombres)
+    return conn.execute(f'''
+        INSERT INTO main.{tabla} ({", ".join(nombres)})
+        SELECT {seleccion} FROM origen.{tabla} AS o WHERE {condicion} ORDER BY o.id
+    ''', parametros).rowcount
+
+
+def _copiar(conn, usuario_id):
+    proyectos = [fila[0] for fila in conn.execute(
+        'SELECT id FROM origen.proyectos WHERE usuario_id = ? ORDER BY id', (usuario_id,))]
+    tareas = [fila[0] for fila in conn.execute(
+        f'SELECT id FROM origen.tareas WHERE proyecto_id IN {PROYECTOS_ORIGEN} ORDER BY id',
+        {'usuario': usuario_id})]
+    parametros = {'usuario': usuario_id, 'dp': 0, 'dt': 0}
+
+    # Las versiones suben para que ninguna caché sirva lo del shard anterior
+    with transaccion(conn):
+        conn.execute('''
+            INSERT OR REPLACE INTO main.inquilinos (id, version_proyectos)
+            VALUES (:usuario, COALESCE((SELECT version_proyectos FROM origen.inquilinos WHERE id = :usuario), 0) + 1)
+        ''', parametros)
+        if proyectos:
+            parametros['dp'] = _reservar_ids(conn, 'proyectos', proyectos[0], proyectos[-1])
+            _copiar_filas(conn, 'proyectos', {'id': 'id + :dp', 'version': 'version + 1',
+                                              'total_tareas': '0', 'tareas_completadas': '0'},
+                          'usuario_id = :usuario', parametros)
+        if tareas:
+            parametros['dt'] = _reservar_ids(conn, 'tareas', tareas[0], tareas[-1])
+
+    # Por lotes de ids; los triggers suman los contadores de progreso de
+    # cada tarea viva y el índice de búsqueda se rellena al final de cada
+    # lote (migración 7)
+    lotes = [(tareas[inicio], tareas[min(inicio + LOTE, len(tareas)) - 1]) for inicio in range(0, len(tareas), LOTE)]
+    for desde, hasta in lotes:
+        with transaccion(conn):
+            conn.execute('INSERT INTO main.busqueda_diferida VALUES (1)')
+            _copiar_filas(conn, 'tareas', {
+                'id': 'id + :dt',
+                'proyecto_id': 'proyecto_id + :dp',
+                # Un padre que ya no existe (o de otro proyecto) no se traslada
+                'parent_id': '''(SELECT padre.id + :dt FROM origen.tareas AS padre
+                                WHERE padre.id = o.parent_id AND padre.proyecto_id = o.proyecto_id)''',
+                'total_hijas': '0', 'hijas_completadas': '0',
+            }, f'o.id BETWEEN :desde AND :hasta AND o.proyecto_id IN {PROYECTOS_ORIGEN}',
+                dict(parametros, desde=desde, hasta=hasta))
+            conn.execute('DELETE FROM main.busqueda_diferida')
+            conn.execute('''
+                INSERT INTO main.tareas_fts (rowid, titulo, descripcion)
+                SELECT id, titulo, descripcion FROM main.tareas WHERE id BETWEEN ? AND ? AND eliminada = 0
+            ''', (desde + parametros['dt'], hasta + parametros['dt']))
+
+    # Una hija copiada antes que su padre no llegó a sumarse: se recuentan
+    # las hijas de cada tarea copiada (el rango reservado solo tiene estas)
+    for desde, hasta in lotes:
+        with transaccion(conn):
+            conn.execute('''
+                UPDATE main.tareas SET
+                    total_hijas = (SELECT COUNT(*) FROM main.tareas h
+                                   WHERE h.parent_id = tareas.id AND h.eliminada = 0),
+                    hijas_completadas = (SELECT COUNT(*) FROM main.tareas h
+                                         WHERE h.parent_id = tareas.id AND h.eliminada = 0 AND h.completada IS TRUE)
+                WHERE id BETWEEN ? AND ?
+            ''', (desde + parametros['dt'], hasta + parametros['dt']))
+
+    # Actividad de sus proyectos, mes a mes; las entradas de tareas que ya
+    # no existen en el origen pierden la referencia
+    entradas = 0
+    limites = dict(parametros, minimo=tareas[0] if tareas else 0, maximo=tareas[-1] if tareas else -1)
+    seleccion = ', '.join({'proyecto_id': 'proyecto_id + :dp',
+                           'tarea_id': 'CASE WHEN tarea_id BETWEEN :minimo AND :maximo THEN tarea_id + :dt END',
+                           }.get(nombre, nombre) for nombre in COLUMNAS_ACTIVIDAD)
+    for nombre, desde, hasta in conn.execute('SELECT nombre, desde, hasta FROM origen.actividad_particiones').fetchall():
+        with transaccion(conn):
+            crear_particion(conn, nombre, desde, hasta)
+            entradas += conn.execute(f'''
+                INSERT INTO main.{nombre} ({", ".join(COLUMNAS_ACTIVIDAD)})
+                SELECT {seleccion} FROM origen.{nombre}
+                WHERE proyecto_id IN {PROYECTOS_ORIGEN} ORDER BY ts, id
+            ''', limites).rowcount
+    return {'proyectos': len(proyectos), 'tareas': len(tareas), 'actividad': entradas}
+
+
+def copiar_datos(ruta_origen, destino, usuario_id):
+    destino.execute('ATTACH DATABASE ? AS origen', (ruta_origen,))
+    try:
+        return _copiar(destino, usuario_id)
+    finally:
+        destino.execute('DETACH DATABASE origen')
+
+
+def trasladar(central, ruta_central, usuarios, espera):
+    # usuarios: filas (id, username, shard) con el destino en 'destino'
+    with transaccion(central):
+        for usuario in usuarios:
+            central.execute('UPDATE usuarios SET trasladando = 1 WHERE id = ?', (usuario['id'],))
+            central.execute('DELETE FROM sesiones WHERE usuario_id = ?', (usuario['id'],))
+    if BACKEND != 'sqlite':
+        print("⚠️ Con SESIONES=cookie no se pueden cerrar las sesiones abiertas: "
+              "mueve usuarios con la aplicación parada")
+    if espera > 0:
+        print(f"⏳ Esperando {espera:.0f} s a que ningún proceso use sus sesiones...")
+        time.sleep(espera)
+
+    shards = {}
+
+    def shard(numero):
+        if numero not in shards:
+            shards[numero] = abrir_shard(numero, ruta_central)
+        return shards[numero]
+
+    for usuario in usuarios:
+        inicio = time.perf_counter()
+        origen, destino = usuario['shard'], usuario['destino']
+        resumen = {'proyectos': 0, 'tareas': 0, 'actividad': 0}
+        # Con origen == destino solo queda terminar un traslado interrumpido
+        if origen != destino:
+            borrar_datos(shard(destino), usuario['id'])
+            resumen = copiar_datos(ruta_shard(origen, ruta_central), shard(destino), usuario['id'])
+        with transaccion(central):
+            central.execute('UPDATE usuarios SET shard = ?, trasladando = 0 WHERE id = ?', (destino, usuario['id']))
+        for numero in range(SHARDS + 1):
+            if numero != destino and os.path.exists(ruta_shard(numero, ruta_central)):
+                borrar_datos(shard(numero), usuario['id'])
+        print(f"✅ {usuario['username']}: shard {origen} → {destino}, {resumen['proyectos']} proyectos, "
+              f"{resumen['tareas']} tareas y {resumen['actividad']} entradas de actividad "
+              f"en {time.perf_counter() - inicio:.1f} s")
+
+
+def ajenos(central, conn, numero):
+    # Usuarios con datos en el shard que el directorio asigna a otro
+    propios = {fila[0] for fila in central.execute('SELECT id FROM usuarios WHERE shard = ?', (numero,))}
+    presentes = {fila[0] for fila in conn.execute('SELECT DISTINCT usuario_id FROM proyectos')}
+    presentes |= {fila[0] for fila in conn.execute('SELECT id FROM inquilinos')}
+    return presentes - propios
+
+
+def estado(central, ruta_central):
+    asignados = dict(central.execute('SELECT shard, COUNT(*) FROM usuarios GROUP BY shard').fetchall())
+    for numero in range(SHARDS + 1):
+        ruta = ruta_shard(numero, ruta_central)
+        if not os.path.exists(ruta):
+            print(f"   shard {numero}: {asignados.get(numero, 0)} usuarios, sin crear ({ruta})")
+            continue
+        conn = abrir_shard(numero, ruta_central)
+        proyectos, tareas = conn.execute(
+            'SELECT (SELECT COUNT(*) FROM proyectos), (SELECT COUNT(*) FROM tareas)').fetchone()
+        megas = sum(os.path.getsize(f) for f in (ruta, ruta + '-wal') if os.path.exists(f)) / 1e6
+        print(f"🗄️ shard {numero}: {asignados.get(numero, 0)} usuarios, {proyectos} proyectos, "
+              f"{tareas} tareas, {megas:.1f} MB ({ruta})")
+        sobrantes = ajenos(central, conn, numero)
+        if sobrantes:
+            print(f"   ⚠️ datos de {len(sobrantes)} usuarios de otros shards (python shards.py purgar)")
+        conn.close()
+
+    fuera = sum(cantidad for numero, cantidad in asignados.items() if numero > SHARDS)
+    if fuera:
+        print(f"❌ {fuera} usuarios en shards no configurados (SHARDS={SHARDS})")
+    for fila in central.execute('SELECT username FROM usuarios WHERE trasladando'):
+        print(f"⚠️ {fila[0]}: traslado sin terminar (repite python shards.py mover)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reparto de usuarios entre shards')
+    parser.add_argument('--db', default=DB_PATH, help='base de datos central')
+    ordenes = parser.add_subparsers(dest='orden', required=True)
+
+    ordenes.add_parser('estado')
+    p_mover = ordenes.add_parser('mover')
+    p_mover.add_argument('usuario', help='username')
+    p_mover.add_argument('destino', type=int, help='número de shard')
+    p_repartir = ordenes.add_parser('repartir')
+    for p in (p_mover, p_repartir):
+        p.add_argument('--espera', type=float, default=ESPERA,
+                       help='segundos entre cerrar sesiones y copiar (0 con la aplicación parada)')
+    ordenes.add_parser('purgar')
+
+    args = parser.parse_args(argv)
+    central = abrir_shard(0, args.db)
+
+    if args.orden == 'estado':
+        estado(central, args.db)
+        return 0
+
+    if args.orden == 'purgar':
+        for numero in range(SHARDS + 1):
+            if not os.path.exists(ruta_shard(numero, args.db)):
+                continue
+            conn = abrir_shard(numero, args.db)
+            sobrantes = ajenos(central, conn, numero)
+            for usuario_id in sobrantes:
+                borrar_datos(conn, usuario_id)
+            print(f"✅ shard {numero}: borrados los datos de {len(sobrantes)} usuarios de otros shards")
+        return 0
+
+    if args.orden == 'mover':
+        try:
+            comprobar_shard(args.destino)
+        except RuntimeError as error:
+            parser.error(str(error))
+        usuario = central.execute('SELECT id, username, shard, trasladando FROM usuarios WHERE username = ?',
+                                  (args.usuario,)).fetchone()
+        if usuario is None:
+            parser.error(f'no existe el usuario {args.usuario}')
+        if usuario['shard'] == args.destino and not usuario['trasladando']:
+            print(f"✅ {args.usuario} ya está en el shard {args.destino}")
+            return 0
+        usuarios = [dict(usuario, destino=args.destino)]
+    else:
+        if SHARDS == 0:
+            parser.error('no hay shards configurados (SHARDS=0)')
+        usuarios = [dict(fila, destino=shard_para(fila['username'])) for fila in central.execute(
+            'SELECT id, username, shard FROM usuarios WHERE shard = 0 ORDER BY id')]
+        if not usuarios:
+            print("✅ No quedan usuarios en el shard 0")
+            return 0
+
+    trasladar(central, args.db, usuarios, args.espera)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
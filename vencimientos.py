@@ -0,0 +1,112 @@
+from datetime import date, datetime, timedelta, timezone
+from arbol import COLUMNA_TIENE_HIJAS, TAREAS_POR_PAGINA
+
+# Fechas de vencimiento y prioridades de las tareas (migración 10).
+#
+# tareas.vence guarda la fecha en UTC con el mismo formato que
+# fecha_creacion ('YYYY-MM-DD HH:MM:SS'), así que se compara como texto y el
+# índice (proyecto_id, completada, vence) sirve para filtrar y ordenar.
+# tareas.prioridad: 0 baja, 1 media, 2 alta.
+#
+# Las vistas del dashboard (?vista=) son listas planas de tareas pendientes
+# que salen ya ordenadas de los índices parciales de la migración 10:
+#   vencidas    vence antes de ahora, las más antiguas primero
+#   semana      vence en los próximos 7 días
+#   prioridad   alta, media, baja; dentro de cada una las más recientes primero
+
+FORMATO = '%Y-%m-%d %H:%M:%S'
+
+PRIORIDADES = {0: 'baja', 1: 'media', 2: 'alta'}
+
+
+def leer_vence(valor):
+    # Texto ISO 8601 a formato de vence; None o '' = sin vencimiento.
+    # Con zona ('Z', '+02:00', lo que da Date.toISOString()) se pasa a UTC;
+    # sin zona se toma como UTC. Una fecha sin hora vence al final de ese
+    # día. ValueError si no es una fecha válida
+    if valor is None or not valor.strip():
+        return None
+    valor = valor.strip()
+    if len(valor) == 10:
+        return date.fromisoformat(valor).strftime('%Y-%m-%d 23:59:59')
+    fecha = datetime.fromisoformat(valor)
+    if fecha.tzinfo is not None:
+        fecha = fecha.astimezone(timezone.utc)
+    return fecha.strftime(FORMATO)
+
+
+def leer_prioridad(valor):
+    # Número (0-2, también como texto) o nombre; None o '' = baja
+    if valor is None or valor == '':
+        return 0
+    if isinstance(valor, str):
+        for numero, nombre in PRIORIDADES.items():
+            if valor.strip().lower() == nombre:
+                return numero
+        valor = int(valor)
+    if isinstance(valor, bool) or not isinstance(valor, int) or valor not in PRIORIDADES:
+        raise ValueError(f'Prioridad no válida: {valor!r}')
+    return valor
+
+
+def ahora_utc(desplazamiento=0):
+    # Hora actual (más `desplazamiento` segundos) en formato de vence
+    return (datetime.now(timezone.utc) + timedelta(seconds=desplazamiento)).strftime(FORMATO)
+
+
+def momento(vence):
+    # vence a hora unix, para la cola de recordatorios
+    return datetime.strptime(vence, FORMATO).replace(tzinfo=timezone.utc).timestamp()
+
+
+# ==================== VISTAS DEL DASHBOARD ====================
+
+VENCIDAS_SQL = f'''
+    SELECT t.*, {COLUMNA_TIENE_HIJAS} FROM tareas t
+    WHERE t.proyecto_id = ? AND t.completada = 0 AND t.vence < ? AND t.eliminada = 0
+    ORDER BY t.vence, t.id LIMIT ?
+'''
+
+SEMANA_SQL = f'''
+    SELECT t.*, {COLUMNA_TIENE_HIJAS} FROM tareas t
+    WHERE t.proyecto_id = ? AND t.completada = 0 AND t.vence >= ? AND t.vence < ? AND t.eliminada = 0
+    ORDER BY t.vence, t.id LIMIT ?
+'''
+
+PRIORIDAD_SQL = f'''
+    SELECT t.*, {COLUMNA_TIENE_HIJAS} FROM tareas t
+    WHERE t.proyecto_id = ? AND t.completada = 0 AND t.eliminada = 0
+    ORDER BY t.prioridad DESC, t.id DESC LIMIT ?
+'''
+
+VISTAS = {
+    'vencidas': 'Vencidas',
+    'semana': 'Vencen esta semana',
+    'prioridad': 'Por prioridad',
+}
+# Vistas que dependen de la hora (entran en la clave de la caché por minuto)
+VISTAS_CON_HORA = ('vencidas', 'semana')
+
+
+def pagina_vista(conn, proyecto_id, vista, ahora, limite=TAREAS_POR_PAGINA):
+    # ahora: hora de referencia en formato de vence
+    if vista == 'vencidas':
+        filas = conn.execute(VENCIDAS_SQL, (proyecto_id, ahora, limite + 1)).fetchall()
+    elif vista == 'semana':
+        fin = (datetime.strptime(ahora, FORMATO) + timedelta(days=7)).strftime(FORMATO)
+        filas = conn.execute(SEMANA_SQL, (proyecto_id, ahora, fin, limite + 1)).fetchall()
+    else:
+        filas = conn.execute(PRIORIDAD_SQL, (proyecto_id, limite + 1)).fetchall()
+    return filas[:limite], len(filas) > limite
+
+
+# ==================== RECORDATORIOS ====================
+
+# Frente de la cola de recordatorios de un shard (recordatorios.py): las
+# pendientes que vencen antes de un momento, en orden, del índice parcial
+# idx_tareas_avisos (solo contiene las que aún tienen que avisar)
+PENDIENTES_SQL = '''
+    SELECT id, vence FROM tareas
+    WHERE vence <= ? AND vence IS NOT NULL AND avisada = 0 AND completada = 0 AND eliminada = 0
+    ORDER BY vence LIMIT ?
+'''